@@ -17,11 +17,16 @@ from sqlalchemy import (
     Text,
     UniqueConstraint,
     create_engine,
+    event,
 )
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import Session, relationship, sessionmaker
 
+from core.db import apply_pragmas
+
 BASE_DIR = Path(__file__).resolve().parent
+# Своя база: схема этих моделей (proxies host/port, Integer proxy_id)
+# несовместима с таблицами core.models, делить с ними файл нельзя
 DB_PATH = BASE_DIR / "keyset.db"
 
 # SQLAlchemy setup
@@ -30,6 +35,14 @@ engine = create_engine(f"sqlite:///{DB_PATH}", echo=False)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 
+@event.listens_for(engine, "connect")
+def _set_sqlite_pragma(dbapi_conn, connection_record):
+    # Те же PRAGMA (WAL, busy_timeout, кэш), что и у основной базы. Писатель
+    # core.db.connections сюда не относится: файл другой, пишет в него только
+    # этот модуль, конкурирующие сессии ждут на busy_timeout
+    apply_pragmas(dbapi_conn)
+
+
 class Account(Base):
     """Yandex account model"""
 
@@ -2,13 +2,13 @@ from __future__ import annotations
 
 from datetime import datetime
 from typing import List, Optional
-import csv
 import io
 
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, File, Form, HTTPException, Query, UploadFile
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 
+from services import exporter
 from services import frequency as frequency_service
 
 
@@ -33,7 +33,7 @@ class PhraseRow(BaseModel):
 
 class PhraseListResponse(BaseModel):
     items: List[PhraseRow]
-    nextCursor: Optional[int] = None
+    nextCursor: Optional[str] = None
 
 
 class GroupRow(BaseModel):
@@ -56,8 +56,10 @@ def list_phrases(
     offset: int = Query(0, ge=0),
     search: Optional[str] = Query(None, description="Фильтр по части фразы"),
     status: Optional[str] = Query(None, description="Статус записи (queued/ok/error/etc)"),
+    group: Optional[str] = Query(None, description="Группа фраз"),
     q: Optional[str] = Query(None, description="Поиск по маске (alias search)"),
-    cursor: Optional[int] = Query(None, description="ID для кейсет-пагинации"),
+    mode: str = Query("substring", description="Режим поиска: substring/prefix/tokens"),
+    cursor: Optional[str] = Query(None, description="Курсор nextCursor предыдущей страницы"),
     sort: Optional[str] = Query(None, description="Направление сортировки, например updatedAt:desc"),
 ) -> PhraseListResponse:
     status_filter = status if status and status != "all" else None
@@ -70,54 +72,38 @@ def list_phrases(
             sort_field = field
         if direction:
             sort_order = direction
-    raw_rows = frequency_service.list_results(status=status_filter, limit=(limit + offset + 1))
-
-    if query:
-        needle = query.strip().lower()
-        raw_rows = [
-            row
-            for row in raw_rows
-            if needle in (row.get("mask") or "").lower()
-            or needle in (row.get("group") or "").lower()
-        ]
-
-    # apply sort
-    reverse = sort_order.lower() != "asc"
-    key_fn = (
-        (lambda r: (r.get("updated_at"), r.get("id")))
-        if sort_field == "updatedAt"
-        else (lambda r: (r.get("id"),))
-    )
-    raw_rows.sort(key=key_fn, reverse=reverse)
-
-    # keyset pagination
-    if cursor is not None:
-        if reverse:
-            raw_rows = [row for row in raw_rows if (row.get("id") or 0) < cursor]
-        else:
-            raw_rows = [row for row in raw_rows if (row.get("id") or 0) > cursor]
 
-    sliced = raw_rows[offset : offset + limit + 1]
-    has_more = len(sliced) > limit
-    sliced = sliced[:limit]
-    next_cursor = (sliced[-1].get("id") if sliced and has_more else None)
+    try:
+        rows, next_cursor = frequency_service.query_results(
+            search=query,
+            search_mode=mode,
+            status=status_filter,
+            group=group,
+            sort_field=sort_field,
+            sort_order=sort_order,
+            cursor=cursor,
+            offset=offset,
+            limit=limit,
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
 
     items = [
         PhraseRow(
-            id=row.get("id", idx),
-            phrase=row.get("mask", ""),
-            ws=row.get("freq_total", 0) or 0,
-            wsQuotes=row.get("freq_quotes", 0) or 0,
-            wsExact=row.get("freq_exact", 0) or 0,
-            freq=row.get("freq_total", 0) or 0,
-            freqQuotes=row.get("freq_quotes", 0) or 0,
-            freqExact=row.get("freq_exact", 0) or 0,
-            region=row.get("region", 225) or 225,
-            status=row.get("status", "queued") or "queued",
-            group=row.get("group") or None,
-            updatedAt=row.get("updated_at"),
+            id=row.id,
+            phrase=row.mask,
+            ws=row.freq_total or 0,
+            wsQuotes=row.freq_quotes or 0,
+            wsExact=row.freq_exact or 0,
+            freq=row.freq_total or 0,
+            freqQuotes=row.freq_quotes or 0,
+            freqExact=row.freq_exact or 0,
+            region=row.region or 225,
+            status=row.status or "queued",
+            group=row.group or None,
+            updatedAt=row.updated_at,
         )
-        for idx, row in enumerate(sliced, start=1 + offset)
+        for row in rows
     ]
     return PhraseListResponse(items=items, nextCursor=next_cursor)
 
@@ -158,11 +144,22 @@ class GroupUpdatePayload(BaseModel):
 
 @router.post("/phrases/enqueue")
 def enqueue_phrases(payload: EnqueuePayload) -> dict:
-    normalized = [phrase.strip() for phrase in payload.phrases if phrase and phrase.strip()]
-    if not normalized:
+    if not any(phrase and phrase.strip() for phrase in payload.phrases):
         raise HTTPException(status_code=422, detail="Список фраз пуст.")
-    inserted = frequency_service.enqueue_masks(normalized, payload.region)
-    return {"inserted": inserted}
+    return frequency_service.enqueue_masks_bulk(payload.phrases, payload.region)
+
+
+@router.post("/phrases/import")
+def import_phrases(
+    file: UploadFile = File(...),
+    region: int = Form(225),
+) -> dict:
+    """Импорт фраз из текстового файла (одна фраза на строку) потоком, без чтения в память."""
+    lines = io.TextIOWrapper(file.file, encoding="utf-8-sig", errors="replace")
+    try:
+        return frequency_service.enqueue_masks_bulk(lines, region)
+    finally:
+        lines.detach()
 
 
 @router.post("/phrases/delete")
@@ -191,29 +188,42 @@ def delete_phrases_root(payload: IdsPayload) -> dict:
 @router.get("/export")
 def export_phrases(
     *,
-    limit: int = Query(5000, ge=1, le=25000),
+    fmt: str = Query("csv", alias="format", pattern="^(csv|xlsx)$", description="Формат файла: csv/xlsx"),
     status: Optional[str] = Query(None, description="Статус записей для экспорта"),
+    group: Optional[str] = Query(None, description="Группа фраз"),
+    region: Optional[int] = Query(None, description="Регион"),
+    search: Optional[str] = Query(None, description="Фильтр по части фразы"),
+    mode: str = Query("substring", description="Режим поиска: substring/prefix/tokens"),
+    columns: Optional[str] = Query(None, description="Колонки через запятую, например phrase,ws,group"),
+    limit: Optional[int] = Query(None, ge=1, description="Ограничение числа строк (по умолчанию без ограничения)"),
+    gzip: bool = Query(False, description="Сжать ответ gzip (Content-Encoding)"),
 ) -> StreamingResponse:
-    """Выгрузить фразы в CSV, чтобы UI мог скачать файл без падения."""
-    status_filter = status if status and status != "all" else None
-    rows = frequency_service.export_results(limit=limit, status=status_filter)
-    buffer = io.StringIO()
-    writer = csv.writer(buffer, delimiter=";")
-    writer.writerow(["id", "phrase", "WS", "\"WS\"", "!WS", "group", "region", "status", "updatedAt"])
-    for row in rows:
-        writer.writerow([
-            row.id,
-            row.mask,
-            row.freq_total,
-            getattr(row, "freq_quotes", 0),
-            row.freq_exact,
-            getattr(row, "group", "") or "",
-            row.region,
-            row.status,
-            row.updated_at.isoformat() if row.updated_at else "",
-        ])
-    buffer.seek(0)
+    """Выгрузить фразы потоком: строки читаются пачками и сразу уходят клиенту."""
+    if fmt == "xlsx" and not exporter.XLSX_AVAILABLE:
+        raise HTTPException(status_code=501, detail="Выгрузка в XLSX требует openpyxl.")
+
+    keys = frequency_service.resolve_export_columns(columns.split(",") if columns else None)
+    headers_row = [frequency_service.EXPORT_COLUMNS[key][0] for key in keys]
+    batches = frequency_service.iter_export_batches(
+        columns=keys,
+        search=search,
+        search_mode=mode,
+        status=status,
+        group=group,
+        region=region,
+        limit=limit,
+    )
+    if fmt == "xlsx":
+        body = exporter.iter_xlsx(headers_row, batches)
+        media_type = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    else:
+        body = exporter.iter_csv(headers_row, batches)
+        media_type = "text/csv; charset=utf-8"
+
     headers = {
-        "Content-Disposition": "attachment; filename=data_export.csv"
+        "Content-Disposition": f"attachment; filename=data_export.{fmt}"
     }
-    return StreamingResponse(buffer, media_type="text/csv", headers=headers)
+    if gzip:
+        body = exporter.iter_gzip(body)
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(body, media_type=media_type, headers=headers)
@@ -84,6 +84,14 @@ def get_regions():
     ]
 
 
+@router.get("/cache")
+def get_cache_stats():
+    """Счётчики кэша частотностей (попадания в памяти/БД, промахи)"""
+    from services.frequency_cache import frequency_cache
+
+    return frequency_cache.stats()
+
+
 @router.get("/health")
 def health_check():
     """Проверка работоспособности Wordstat API"""
@@ -2,9 +2,14 @@
 
 from pathlib import Path
 from contextlib import contextmanager
+import atexit
 import json
+import logging
 import os
+import queue
 import sqlite3
+import threading
+import time
 import uuid
 
 from sqlalchemy import create_engine, inspect, text, event
@@ -23,11 +28,69 @@ else:
 
 DATABASE_URL = f'sqlite:///{DB_PATH.as_posix()}'
 
+# Общие PRAGMA для всех соединений процесса (SQLAlchemy и сырые sqlite3)
+SQLITE_PRAGMAS = (
+    ("journal_mode", "WAL"),
+    ("synchronous", "NORMAL"),
+    ("foreign_keys", "ON"),
+    ("busy_timeout", "30000"),
+    ("cache_size", "-65536"),        # 64 МБ страничного кэша на соединение
+    ("temp_store", "MEMORY"),
+    ("mmap_size", "268435456"),      # 256 МБ
+)
+READER_POOL_SIZE = 4
+# Пассивный checkpoint WAL каждые N записывающих транзакций или раз в M секунд
+CHECKPOINT_EVERY = 500
+CHECKPOINT_INTERVAL = 60.0
+# Сколько ORM-транзакция ждёт писателя процесса; дальше — как раньше, на busy_timeout
+ORM_WRITER_TIMEOUT = 30.0
+
 
 class Base(DeclarativeBase):
     pass
 
 
+def _ensure_freq_fts(engine) -> None:
+    """Триграммный FTS5-индекс по freq_results (mask + group), синхронизируемый триггерами."""
+    with engine.begin() as conn:
+        exists = conn.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'freq_results_fts'")
+        ).first()
+        if not exists:
+            try:
+                conn.execute(text("""
+                    CREATE VIRTUAL TABLE freq_results_fts USING fts5(
+                        mask, "group",
+                        content='freq_results',
+                        content_rowid='id',
+                        tokenize='trigram'
+                    )
+                """))
+            except Exception:
+                # SQLite без FTS5/trigram (< 3.34): поиск останется на casefold()-скане
+                return
+            conn.execute(text("INSERT INTO freq_results_fts(freq_results_fts) VALUES ('rebuild')"))
+
+        conn.execute(text("""
+            CREATE TRIGGER IF NOT EXISTS freq_results_fts_ai AFTER INSERT ON freq_results BEGIN
+                INSERT INTO freq_results_fts(rowid, mask, "group") VALUES (new.id, new.mask, new."group");
+            END
+        """))
+        conn.execute(text("""
+            CREATE TRIGGER IF NOT EXISTS freq_results_fts_ad AFTER DELETE ON freq_results BEGIN
+                INSERT INTO freq_results_fts(freq_results_fts, rowid, mask, "group")
+                VALUES ('delete', old.id, old.mask, old."group");
+            END
+        """))
+        conn.execute(text("""
+            CREATE TRIGGER IF NOT EXISTS freq_results_fts_au AFTER UPDATE OF mask, "group" ON freq_results BEGIN
+                INSERT INTO freq_results_fts(freq_results_fts, rowid, mask, "group")
+                VALUES ('delete', old.id, old.mask, old."group");
+                INSERT INTO freq_results_fts(rowid, mask, "group") VALUES (new.id, new.mask, new."group");
+            END
+        """))
+
+
 def ensure_schema() -> None:
     """Perform lightweight SQLite migrations for the tasks table."""
     engine = ensure_schema.engine  # type: ignore[attr-defined]
@@ -87,6 +150,18 @@ def ensure_schema() -> None:
             '''))
             conn.execute(text("CREATE INDEX IF NOT EXISTS idx_cluster_stem ON clusters(stem)"))
 
+        # Кэш частотностей Wordstat: (нормализованная фраза, режим ws/qws/bws, регион)
+        conn.execute(text('''
+            CREATE TABLE IF NOT EXISTS wordstat_cache (
+                query_key TEXT NOT NULL,
+                mode TEXT NOT NULL,
+                region INTEGER NOT NULL,
+                value INTEGER NOT NULL,
+                fetched_at REAL NOT NULL,
+                PRIMARY KEY (query_key, mode, region)
+            ) WITHOUT ROWID
+        '''))
+
         groups_table_exists = inspector.has_table('groups')
         if not groups_table_exists:
             conn.execute(text('''
@@ -301,6 +376,19 @@ def ensure_schema() -> None:
             conn.execute(text("CREATE INDEX IF NOT EXISTS idx_freq_status ON freq_results(status)"))
             conn.execute(text("CREATE INDEX IF NOT EXISTS idx_freq_updated ON freq_results(updated_at)"))
 
+    with engine.begin() as conn:
+        columns = {row[1] for row in conn.execute(text('PRAGMA table_info(freq_results)'))}
+        if 'freq_quotes' not in columns:
+            conn.execute(text("ALTER TABLE freq_results ADD COLUMN freq_quotes INTEGER NOT NULL DEFAULT 0"))
+        if 'group' not in columns:
+            conn.execute(text('ALTER TABLE freq_results ADD COLUMN "group" VARCHAR(100)'))
+        # Индексы под кейсет-пагинацию /api/data/phrases: (фильтр, updated_at, rowid)
+        conn.execute(text("CREATE INDEX IF NOT EXISTS idx_freq_updated ON freq_results(updated_at)"))
+        conn.execute(text("CREATE INDEX IF NOT EXISTS idx_freq_status_updated ON freq_results(status, updated_at)"))
+        conn.execute(text('CREATE INDEX IF NOT EXISTS idx_freq_group_updated ON freq_results("group", updated_at)'))
+
+    _ensure_freq_fts(engine)
+
     with engine.begin() as conn:
         info_rows = list(conn.execute(text('PRAGMA table_info(tasks)')))
         if not info_rows:
@@ -361,18 +449,28 @@ engine = create_engine(
     DATABASE_URL, 
     echo=False, 
     future=True,
-    connect_args={"check_same_thread": False}
+    connect_args={"check_same_thread": False, "timeout": 30}
 )
 
 
+def _casefold(value):
+    return value.casefold() if isinstance(value, str) else value
+
+
+def apply_pragmas(dbapi_conn) -> None:
+    """PRAGMA и пользовательские функции для нового соединения."""
+    cursor = dbapi_conn.cursor()
+    for name, value in SQLITE_PRAGMAS:
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+    # SQLite lower() понимает только ASCII - для кириллицы нужен Python casefold
+    dbapi_conn.create_function("casefold", 1, _casefold, deterministic=True)
+
+
 # Enable WAL mode for better concurrency
 @event.listens_for(engine, "connect")
 def set_sqlite_pragma(dbapi_conn, connection_record):
-    cursor = dbapi_conn.cursor()
-    cursor.execute("PRAGMA journal_mode=WAL")
-    cursor.execute("PRAGMA synchronous=NORMAL")
-    cursor.execute("PRAGMA foreign_keys=ON")
-    cursor.close()
+    apply_pragmas(dbapi_conn)
 
 
 ensure_schema.engine = engine  # type: ignore[attr-defined]
@@ -386,22 +484,172 @@ SessionLocal = sessionmaker(
 )
 
 
+class ConnectionManager:
+    """
+    Сырые sqlite3-соединения процесса: пул читателей и один писатель.
+
+    Писатель один на процесс и берётся под блокировкой, транзакция
+    открывается через BEGIN IMMEDIATE — конкурирующие записи ждут в очереди
+    (и в busy_timeout), а не падают с «database is locked» на апгрейде
+    блокировки. Соединения создаются один раз, PRAGMA не повторяются.
+
+    ORM-сессии (SessionLocal) ходят через пул SQLAlchemy, но каждая их
+    транзакция занимает ту же блокировку писателя — см. события engine ниже.
+    """
+
+    def __init__(self, path: Path, readers: int = READER_POOL_SIZE):
+        self.path = Path(path)
+        self.max_readers = max(1, readers)
+        self._readers: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._reader_count = 0
+        self._reader_lock = threading.Lock()
+        self._writer: sqlite3.Connection | None = None
+        self._writer_lock = threading.RLock()
+        self._writer_depth = 0
+        self._writes = 0
+        self._last_checkpoint = time.monotonic()
+
+    def _connect(self, *, read_only: bool = False) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30, isolation_level=None)
+        apply_pragmas(conn)
+        if read_only:
+            conn.execute("PRAGMA query_only=ON")
+        conn.row_factory = sqlite3.Row  # Access columns by name
+        return conn
+
+    @contextmanager
+    def reader(self):
+        try:
+            conn = self._readers.get_nowait()
+        except queue.Empty:
+            with self._reader_lock:
+                create = self._reader_count < self.max_readers
+                if create:
+                    self._reader_count += 1
+            conn = self._connect(read_only=True) if create else self._readers.get()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self._readers.put(conn)
+
+    @contextmanager
+    def writer(self):
+        with self._writer_lock:
+            if self._writer is None:
+                self._writer = self._connect()
+            conn = self._writer
+            outermost = self._writer_depth == 0
+            self._writer_depth += 1
+            try:
+                if outermost:
+                    conn.execute("BEGIN IMMEDIATE")
+                yield conn
+                if outermost and conn.in_transaction:
+                    conn.commit()
+            except Exception:
+                if outermost and conn.in_transaction:
+                    conn.rollback()
+                raise
+            finally:
+                self._writer_depth -= 1
+            if outermost:
+                self._writes += 1
+                if (self._writes % CHECKPOINT_EVERY == 0
+                        or time.monotonic() - self._last_checkpoint >= CHECKPOINT_INTERVAL):
+                    self.checkpoint()
+
+    def hold_writer(self, timeout: float = -1) -> bool:
+        """Занять писатель процесса для чужого соединения (ORM-транзакции)."""
+        return self._writer_lock.acquire(timeout=timeout)
+
+    def release_writer(self) -> None:
+        self._writer_lock.release()
+
+    def checkpoint(self, mode: str = "PASSIVE") -> None:
+        """wal_checkpoint вне транзакции писателя; PASSIVE не ждёт читателей."""
+        with self._writer_lock:
+            if self._writer is None or self._writer.in_transaction:
+                return
+            try:
+                self._writer.execute(f"PRAGMA wal_checkpoint({mode})")
+            except sqlite3.Error:
+                pass
+            self._last_checkpoint = time.monotonic()
+
+    def close(self) -> None:
+        self.checkpoint("TRUNCATE")
+        with self._writer_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+        while True:
+            try:
+                self._readers.get_nowait().close()
+            except queue.Empty:
+                break
+        with self._reader_lock:
+            self._reader_count = 0
+
+
+connections = ConnectionManager(DB_PATH)
+atexit.register(connections.close)
+
+
+# Транзакция ORM-сессии держит писатель процесса от начала до commit/rollback,
+# поэтому commit сессии и BEGIN IMMEDIATE писателя не спорят за файл и не
+# ловят SQLITE_BUSY. Чтение через SessionLocal тоже становится в эту очередь;
+# быстрые чтения без блокировки — get_read_connection().
+@event.listens_for(engine, "begin")
+def _orm_hold_writer(conn):
+    if conn.info.get("holds_writer"):
+        return
+    if connections.hold_writer(ORM_WRITER_TIMEOUT):
+        conn.info["holds_writer"] = True
+    else:
+        logging.getLogger(__name__).warning("ORM transaction started without the writer lock")
+
+
+def _orm_release_writer(info) -> None:
+    if info.pop("holds_writer", False):
+        try:
+            connections.release_writer()
+        except RuntimeError:
+            # Сессию закрыли из другого потока — RLock отпустить нельзя
+            logging.getLogger(__name__).error("ORM writer lock released from a foreign thread")
+
+
+@event.listens_for(engine, "commit")
+@event.listens_for(engine, "rollback")
+def _orm_end_transaction(conn):
+    _orm_release_writer(conn.info)
+
+
+@event.listens_for(engine, "reset")
+def _orm_reset_connection(dbapi_conn, connection_record, reset_state):
+    # Соединение вернулось в пул, минуя commit/rollback
+    _orm_release_writer(connection_record.info)
+
+
 @contextmanager
 def get_db_connection():
-    """Context manager for direct SQLite connection (for batch operations)."""
-    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
-    conn.execute("PRAGMA journal_mode=WAL")
-    conn.execute("PRAGMA synchronous=NORMAL")
-    conn.execute("PRAGMA foreign_keys=ON")
-    conn.row_factory = sqlite3.Row  # Access columns by name
-    try:
+    """Context manager for direct SQLite connection (for batch operations).
+
+    Общий писатель процесса: транзакция BEGIN IMMEDIATE, commit на выходе.
+    """
+    with connections.writer() as conn:
+        yield conn
+
+
+@contextmanager
+def get_read_connection():
+    """Соединение из пула читателей (только чтение, без транзакции записи)."""
+    with connections.reader() as conn:
         yield conn
-        conn.commit()
-    except Exception:
-        conn.rollback()
-        raise
-    finally:
-        conn.close()
 
 
-__all__ = ['Base', 'engine', 'SessionLocal', 'DB_PATH', 'ensure_schema', 'get_db_connection']
+__all__ = [
+    'Base', 'engine', 'SessionLocal', 'DB_PATH', 'ensure_schema',
+    'get_db_connection', 'get_read_connection', 'connections', 'apply_pragmas',
+]
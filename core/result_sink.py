@@ -0,0 +1,245 @@
+"""Write-behind writer for freq_results.
+
+Parsers report status changes and frequencies per mask; a background thread
+coalesces them by (mask, region) and writes each batch with a single
+``executemany`` upsert once ``max_batch`` masks are pending or
+``flush_interval`` seconds have passed. Calls never touch SQLite themselves,
+so they are safe from the asyncio loop.
+"""
+from __future__ import annotations
+
+import atexit
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from .db import DB_PATH, apply_pragmas, connections
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class _Flush:
+    def __init__(self) -> None:
+        self.done = threading.Event()
+
+
+def _timestamp() -> str:
+    return datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S.%f")
+
+
+class FrequencyResultSink:
+    """Coalescing batched upserts into freq_results."""
+
+    def __init__(
+        self,
+        db_path: Path | str = DB_PATH,
+        *,
+        max_batch: int = 200,
+        flush_interval: float = 0.25,
+    ):
+        self.db_path = Path(db_path)
+        self.max_batch = max(1, max_batch)
+        self.flush_interval = max(0.01, flush_interval)
+        self.written = 0
+        self.flushes = 0
+        self.dropped = 0
+        self._queue: "queue.SimpleQueue[Any]" = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._closed = False
+        self._sql: Optional[str] = None
+        self._conn: Optional[sqlite3.Connection] = None
+
+    # ------------------------------------------------------------------ API
+
+    def status(self, mask: str, region: int, status: str, error: Optional[str] = None) -> None:
+        """Record a status change; every call counts as one attempt."""
+        self._put({"mask": mask, "region": region, "status": status, "error": error, "attempts": 1})
+
+    def result(
+        self,
+        mask: str,
+        region: int,
+        freq_total: int,
+        *,
+        freq_quotes: Optional[int] = None,
+        freq_exact: Optional[int] = None,
+        status: str = "ok",
+    ) -> None:
+        """Record a parsed frequency; clears the previous error."""
+        self._put({
+            "mask": mask,
+            "region": region,
+            "status": status,
+            "freq_total": freq_total,
+            "freq_quotes": freq_quotes,
+            "freq_exact": freq_exact,
+            "clear_error": True,
+        })
+
+    def flush(self, timeout: Optional[float] = 10.0) -> bool:
+        """Block until everything queued so far is on disk."""
+        if self._thread is None:
+            return True
+        marker = _Flush()
+        self._queue.put(marker)
+        return marker.done.wait(timeout)
+
+    async def aflush(self, timeout: Optional[float] = 10.0) -> bool:
+        import asyncio
+
+        return await asyncio.to_thread(self.flush, timeout)
+
+    def close(self, timeout: float = 10.0) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        if self._thread is not None:
+            self._queue.put(_STOP)
+            self._thread.join(timeout)
+
+    # ------------------------------------------------------------ internals
+
+    def _put(self, op: Dict[str, Any]) -> None:
+        if self._closed:
+            raise RuntimeError("FrequencyResultSink is closed")
+        op["mask"] = op["mask"].strip()
+        if not op["mask"]:
+            return
+        op["ts"] = _timestamp()
+        self._ensure_thread()
+        self._queue.put(op)
+
+    def _ensure_thread(self) -> None:
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="freq-result-sink", daemon=True)
+                self._thread.start()
+
+    @staticmethod
+    def _merge(pending: Dict[Tuple[str, int], Dict[str, Any]], op: Dict[str, Any]) -> None:
+        key = (op["mask"], op["region"])
+        row = pending.get(key)
+        if row is None:
+            row = pending[key] = {
+                "mask": op["mask"],
+                "region": op["region"],
+                "status": op["status"],
+                "freq_total": None,
+                "freq_quotes": None,
+                "freq_exact": None,
+                "attempts": 0,
+                "error": None,
+                "clear_error": 0,
+                "ts": op["ts"],
+            }
+        row["status"] = op["status"]
+        row["ts"] = op["ts"]
+        row["attempts"] += op.get("attempts", 0)
+        for column in ("freq_total", "freq_quotes", "freq_exact"):
+            if op.get(column) is not None:
+                row[column] = op[column]
+        if op.get("clear_error"):
+            row["error"] = None
+            row["clear_error"] = 1
+        elif op.get("error"):
+            row["error"] = op["error"]
+            row["clear_error"] = 0
+
+    def _run(self) -> None:
+        pending: Dict[Tuple[str, int], Dict[str, Any]] = {}
+        waiters: list[_Flush] = []
+        deadline = time.monotonic() + self.flush_interval
+        stopping = False
+        while not stopping:
+            try:
+                item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                item = None
+            if item is _STOP:
+                stopping = True
+            elif isinstance(item, _Flush):
+                waiters.append(item)
+            elif item is not None:
+                self._merge(pending, item)
+
+            now = time.monotonic()
+            if pending and (stopping or waiters or len(pending) >= self.max_batch or now >= deadline):
+                self._write(list(pending.values()))
+                pending = {}
+            if now >= deadline:
+                deadline = now + self.flush_interval
+            for waiter in waiters:
+                waiter.done.set()
+            waiters = []
+        if self._conn is not None:
+            self._conn.close()
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        # Для основной базы пишем через общий писатель процесса
+        if self.db_path.resolve() == connections.path.resolve():
+            with connections.writer() as conn:
+                yield conn
+            return
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            apply_pragmas(self._conn)
+        with self._conn:
+            yield self._conn
+
+    def _build_sql(self, conn: sqlite3.Connection) -> str:
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(freq_results)")}
+        freq_columns = [c for c in ("freq_total", "freq_quotes", "freq_exact") if c in columns]
+        insert_cols = ", ".join(freq_columns)
+        insert_vals = ", ".join(f"COALESCE(:{c}, 0)" for c in freq_columns)
+        updates = ",\n                ".join(f"{c} = COALESCE(:{c}, freq_results.{c})" for c in freq_columns)
+        return f"""
+            INSERT INTO freq_results (mask, region, status, {insert_cols}, attempts, error, created_at, updated_at)
+            VALUES (:mask, :region, :status, {insert_vals}, :attempts, :error, :ts, :ts)
+            ON CONFLICT(mask, region) DO UPDATE SET
+                status = excluded.status,
+                {updates},
+                attempts = freq_results.attempts + excluded.attempts,
+                error = CASE WHEN :clear_error THEN NULL ELSE COALESCE(:error, freq_results.error) END,
+                updated_at = excluded.updated_at
+        """
+
+    def _write(self, rows: list[Dict[str, Any]]) -> None:
+        try:
+            with self._transaction() as conn:
+                if self._sql is None:
+                    self._sql = self._build_sql(conn)
+                conn.executemany(self._sql, rows)
+            self.written += len(rows)
+            self.flushes += 1
+        except sqlite3.Error as exc:
+            self.dropped += len(rows)
+            logger.error("freq_results batch write failed (%s rows): %s", len(rows), exc)
+
+
+_default_sink: Optional[FrequencyResultSink] = None
+_default_lock = threading.Lock()
+
+
+def get_result_sink() -> FrequencyResultSink:
+    """Process-wide sink for the configured DB_PATH, flushed on interpreter exit."""
+    global _default_sink
+    with _default_lock:
+        if _default_sink is None:
+            _default_sink = FrequencyResultSink()
+            atexit.register(_default_sink.close)
+        return _default_sink
+
+
+__all__ = ["FrequencyResultSink", "get_result_sink"]
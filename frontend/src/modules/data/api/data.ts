@@ -22,7 +22,7 @@ export interface FrequencyRowDto {
 
 export interface PhraseListResponse {
   items: FrequencyRowDto[];
-  nextCursor: number | null;
+  nextCursor: string | null;
 }
 
 export interface GroupRowDto {
@@ -61,7 +61,7 @@ export interface FetchPhraseParams {
   search?: string;
   status?: string;
   q?: string;
-  cursor?: number;
+  cursor?: string;
   sort?: string;
 }
 
@@ -1255,6 +1255,7 @@ class AccountsTabExtended(QWidget):
             except Exception as exc:
                 result_container["error"] = str(exc)
             finally:
+                loop.run_until_complete(client.close())
                 loop.close()
 
         thread = Thread(target=check_task)
@@ -11,8 +11,7 @@ from PySide6.QtWidgets import (
     QLabel,
     QHBoxLayout,
     QPushButton,
-    QTreeWidget,
-    QTreeWidgetItem,
+    QTreeView,
     QMenu,
     QInputDialog,
     QComboBox,
@@ -20,6 +19,8 @@ from PySide6.QtWidgets import (
 from PySide6.QtCore import Qt, Signal, QPoint
 from PySide6.QtGui import QAction, QColor, QFont, QIcon
 
+from .widgets.group_tree_model import GroupTreeModel
+
 
 class KeysPanel(QWidget):
     """Правая панель с ключами во всю высоту (как в Key Collector - файл 45)"""
@@ -78,6 +79,7 @@ class KeysPanel(QWidget):
         # Фильтр "Все" (как в Key Collector)
         self.filter_combo = QComboBox()
         self.filter_combo.addItems(["Все", "С фразами", "Пустые", "Корзина"])
+        self.filter_combo.currentTextChanged.connect(lambda _: self._filter_groups(self.search_edit.text()))
         layout.addWidget(self.filter_combo)
         
         # Поиск по группам
@@ -87,8 +89,11 @@ class KeysPanel(QWidget):
         layout.addWidget(self.search_edit)
         
         # ДЕРЕВО групп с раскрытием (как в Key Collector!)
-        self.groups_tree = QTreeWidget()
-        self.groups_tree.setHeaderLabels(["Группа / Фраза", ""])  # 2 колонки
+        # Фразы подгружаются моделью порциями при раскрытии группы
+        self.groups_model = GroupTreeModel(self)
+        self.groups_tree = QTreeView()
+        self.groups_tree.setModel(self.groups_model)
+        self.groups_tree.setUniformRowHeights(True)
         self.groups_tree.setColumnWidth(0, 300)
         self.groups_tree.setContextMenuPolicy(Qt.CustomContextMenu)
         self.groups_tree.customContextMenuRequested.connect(self._groups_context_menu)
@@ -96,25 +101,18 @@ class KeysPanel(QWidget):
         self.groups_tree.setRootIsDecorated(True)  # Показываем стрелки раскрытия
         self.groups_tree.setIndentation(15)
         self.groups_tree.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
-        self.groups_tree.setHorizontalScrollMode(QTreeWidget.ScrollPerPixel)
+        self.groups_tree.setHorizontalScrollMode(QTreeView.ScrollPerPixel)
         
         layout.addWidget(self.groups_tree, 1)
     
     def _filter_groups(self, text: str):
-        """Фильтровать группы по поисковому запросу"""
-        text = text.lower().strip()
-        
-        # Фильтруем дерево
-        root = self.groups_tree.invisibleRootItem()
-        for i in range(root.childCount()):
-            item = root.child(i)
-            group_name = item.text(0).lower()
-            
-            # Показываем/скрываем в зависимости от поиска
-            if not text or text in group_name:
-                item.setHidden(False)
-            else:
-                item.setHidden(True)
+        """Фильтровать группы по поисковому запросу и режиму из списка"""
+        visible = self.groups_model.set_filter(text, self.filter_combo.currentText())
+        self.phrases_filtered.emit(visible)
+
+    def _current_group_name(self):
+        """Имя выбранной группы (None, если выбрана фраза или корзина)"""
+        return self.groups_model.group_name(self.groups_tree.currentIndex())
     
     def clear(self):
         """Очистить панель"""
@@ -134,69 +132,25 @@ class KeysPanel(QWidget):
         self._render_groups()
 
     def _render_groups(self):
-        """Отрисовать ДЕРЕВО групп с фразами (как в Key Collector!)"""
-        self.groups_tree.clear()
-        
-        # Добавляем "Корзина (0)" первой (как в Key Collector)
-        trash = QTreeWidgetItem(["Корзина (0)", ""])
-        trash.setForeground(0, QColor("#999"))
-        self.groups_tree.addTopLevelItem(trash)
-        
-        for group_name, data in self._groups.items():
-            # Поддержка двух форматов
-            if isinstance(data, dict):
-                name = data.get('name', str(group_name))
-                phrases = data.get('phrases', [])
-            else:
-                name = str(group_name)
-                phrases = data if isinstance(data, list) else []
-            
-            # Формат: "название (количество)"
-            count = len(phrases)
-            
-            # Создаем корневой элемент группы
-            group_item = QTreeWidgetItem([f"{name} ({count})", ""])
-            
-            # Применяем стиль к группе
-            font = group_item.font(0)
-            font.setBold(True)
-            group_item.setFont(0, font)
-            
-            # Цвет по умолчанию для группы
-            group_color = data.get('color') if isinstance(data, dict) else None
-            if group_color:
-                group_item.setBackground(0, QColor(group_color))
-            
-            if count == 0:
-                group_item.setForeground(0, QColor("#999"))
-            
-            # Добавляем фразы как дочерние элементы
-            for phrase_data in phrases:
-                phrase_text = phrase_data.get("phrase", phrase_data) if isinstance(phrase_data, dict) else phrase_data
-                
-                # Создаем элемент фразы
-                phrase_item = QTreeWidgetItem([phrase_text, ""])
-                phrase_item.setForeground(0, QColor("#ddd"))
-                
-                group_item.addChild(phrase_item)
-            
-            self.groups_tree.addTopLevelItem(group_item)
-        
-        # Раскрываем все группы по умолчанию
-        self.groups_tree.expandAll()
+        """Отрисовать ДЕРЕВО групп с фразами (как в Key Collector!)
+
+        Модель применяет изменения диффом: раскрытые группы и прокрутка
+        сохраняются, фразы подгружаются только при раскрытии.
+        """
+        self.groups_model.set_groups(self._groups)
     
     def _groups_context_menu(self, pos: QPoint):
         """Контекстное меню на дереве групп"""
         menu = QMenu(self)
         
-        item = self.groups_tree.itemAt(pos)
+        group_name = self.groups_model.group_name(self.groups_tree.indexAt(pos))
         
         # Создать группу
         create_action = QAction("➕ Создать группу", self)
         create_action.triggered.connect(self._create_group_in_tree)
         menu.addAction(create_action)
         
-        if item and not item.parent():  # Только для групп, не для фраз
+        if group_name:  # Только для групп, не для фраз
             menu.addSeparator()
             
             # Переименовать
@@ -243,10 +197,10 @@ class KeysPanel(QWidget):
             
             # Экспорт группы
             export_action = QAction("📥 Экспортировать группу", self)
-            export_action.triggered.connect(lambda: self._export_group(item))
+            export_action.triggered.connect(lambda: self._export_group(group_name))
             menu.addAction(export_action)
         
-        menu.exec(self.groups_tree.mapToGlobal(pos))
+        menu.exec(self.groups_tree.viewport().mapToGlobal(pos))
     
     def _create_group_in_tree(self):
         """Создать новую группу"""
@@ -271,11 +225,10 @@ class KeysPanel(QWidget):
     
     def _rename_group(self):
         """Переименовать выбранную группу"""
-        item = self.groups_tree.currentItem()
-        if not item or item.parent():  # Игнорируем если это фраза, а не группа
+        old_name = self._current_group_name()
+        if not old_name:  # Игнорируем если это фраза, а не группа
             return
-        
-        old_name = item.text(0).split(" (")[0]  # Убираем счетчик
+
         new_name, ok = QInputDialog.getText(
             self,
             "Переименовать группу",
@@ -299,12 +252,11 @@ class KeysPanel(QWidget):
     
     def _delete_group_from_tree(self):
         """Удалить выбранную группу"""
-        item = self.groups_tree.currentItem()
-        if not item or item.parent():  # Игнорируем если это фраза
+        group_name = self._current_group_name()
+        if not group_name:  # Игнорируем если это фраза
             return
         
-        group_name = item.text(0).split(" (")[0]
-        phrases_count = item.childCount()
+        phrases_count = len(self.groups_model.phrases(group_name))
         
         from PySide6.QtWidgets import QMessageBox
         reply = QMessageBox.question(
@@ -320,17 +272,13 @@ class KeysPanel(QWidget):
                 self._render_groups()
                 print(f"[OK] Группа удалена: {group_name}")
     
-    def _export_group(self, item: QTreeWidgetItem):
+    def _export_group(self, group_name: str):
         """Экспортировать группу в CSV"""
         from PySide6.QtWidgets import QFileDialog, QMessageBox
         from pathlib import Path
         import csv
         
-        group_name = item.text(0)
-        phrases = self._groups.get(group_name, [])
-        
-        if isinstance(phrases, dict):
-            phrases = phrases.get('phrases', [])
+        phrases = self.groups_model.phrases(group_name)
         
         if not phrases:
             QMessageBox.warning(self, "Экспорт", "Группа пуста")
@@ -361,15 +309,13 @@ class KeysPanel(QWidget):
 
     def _set_group_color(self, color_code: str):
         """Назначить цвет группе (как в Key Collector)"""
-        item = self.groups_tree.currentItem()
-        if not item or item.parent():  # Только для групп
+        group_name = self._current_group_name()
+        if not group_name:  # Только для групп
             return
         
-        group_name = item.text(0).split(" (")[0]
-        
         # Применяем цвет
+        self.groups_model.set_group_color(group_name, color_code)
         if color_code:
-            item.setBackground(0, QColor(color_code))
             # Сохраняем в данных группы
             if group_name in self._groups:
                 if isinstance(self._groups[group_name], dict):
@@ -383,7 +329,6 @@ class KeysPanel(QWidget):
                     }
         else:
             # Убираем цвет
-            item.setBackground(0, QColor("transparent"))
             if group_name in self._groups and isinstance(self._groups[group_name], dict):
                 self._groups[group_name].pop('color', None)
         
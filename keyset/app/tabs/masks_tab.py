@@ -2,6 +2,7 @@
 from __future__ import annotations
 
 from collections import defaultdict
+from itertools import islice
 
 from PySide6.QtWidgets import (
     QHBoxLayout,
@@ -14,6 +15,14 @@ from PySide6.QtWidgets import (
     QLineEdit,
 )
 
+try:
+    from ...services import phrase_tools
+except ImportError:
+    from services import phrase_tools
+
+# Сколько пересечений выводить в поле результата
+INTERSECT_LIMIT = 200_000
+
 
 class MasksTab(QWidget):
     """
@@ -96,13 +105,17 @@ class MasksTab(QWidget):
             )
         else:
             blocks = list(groups.values())
-            phrases = set()
-            prefix = blocks[0]
-            suffix = blocks[1]
-            for left in prefix:
-                for right in suffix:
-                    phrases.add(f"{left} {right}")
-            phrases = sorted(phrases)
+            total = phrase_tools.estimate_combinations(blocks)
+            combos = phrase_tools.iter_combinations(
+                blocks, normalization=phrase_tools.NormalizationOptions(lowercase=False)
+            )
+            phrases = sorted(islice(combos, INTERSECT_LIMIT))
+            if total > INTERSECT_LIMIT:
+                QMessageBox.information(
+                    self,
+                    "Пересечения",
+                    f"Комбинаций до {total}, показаны первые {INTERSECT_LIMIT}.",
+                )
         self._result.setPlainText("\n".join(phrases))
 
     def _send_to_parsing(self) -> None:
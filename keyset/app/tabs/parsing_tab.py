@@ -3,7 +3,6 @@ from __future__ import annotations
 
 import asyncio
 import csv
-import json
 import sys
 import time
 from collections import defaultdict
@@ -29,8 +28,7 @@ from PySide6.QtWidgets import (
     QTextEdit,
     QLabel,
     QCheckBox,
-    QTableWidget,
-    QTableWidgetItem,
+    QTableView,
     QProgressBar,
     QFileDialog,
     QAbstractItemView,
@@ -50,7 +48,9 @@ from ..dialogs.wordstat_dropdown_widget import WordstatDropdownWidget
 from ..dialogs.parsing_dialogs import StopwordsDialog, FilterDialog, DuplicatesDialog
 from ..keys_panel import KeysPanel
 from ..widgets.activity_log import ActivityLogWidget
+from ..widgets.phrase_table_model import PhraseFilter, PhraseFilterProxyModel, PhraseTableModel
 from ...core.icons import icon
+from ...core.session_journal import SessionJournal
 
 try:
     from ...services.accounts import list_accounts
@@ -500,10 +500,16 @@ class ParsingTab(QWidget):
         
         # Выпадающий виджет для кнопки "Частотка"
         self._wordstat_dropdown = None
+
+        # Снимок + журнал изменений сессии (пишутся только изменения)
+        self._journal = SessionJournal(SESSION_FILE)
         
         self.setup_ui()
         self._wire_signals()
         self._restore_session_state()
+        self.table_model.phrases_appended.connect(self._journal.add_phrases)
+        self.table_model.rows_removed.connect(self._journal.remove_rows)
+        self.table_model.cleared.connect(self._journal.clear)
 
     def _normalize_wordstat_settings(self, settings: Dict[str, Any] | None) -> Dict[str, Any]:
         """Привести любые настройки частотки к единообразному виду."""
@@ -584,48 +590,6 @@ class ParsingTab(QWidget):
         short = " / ".join(parts)
         return f"{short} ({region_id})"
 
-    def _ensure_item(self, row: int, column: int) -> QTableWidgetItem:
-        item = self.table.item(row, column)
-        if item is None:
-            item = QTableWidgetItem("")
-            self.table.setItem(row, column, item)
-        return item
-
-    def _set_cell_text(self, row: int, column: int, text: Any) -> None:
-        item = self._ensure_item(row, column)
-        item.setText("" if text is None else str(text))
-
-    def _set_frequency_cell(
-        self,
-        row: int,
-        column: int,
-        value: Any,
-        *,
-        region_id: int | None = None,
-        status: str | None = None,
-    ) -> None:
-        freq = self._coerce_freq(value)
-        item = self._ensure_item(row, column)
-        item.setText(str(freq))
-        item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
-        meta = item.data(Qt.UserRole)
-        if not isinstance(meta, dict):
-            meta = {}
-        if region_id is not None:
-            meta["region_id"] = region_id
-        if status:
-            meta["status"] = status
-        meta["value"] = freq
-        item.setData(Qt.UserRole, meta)
-
-    def _set_status_cell(self, row: int, text: str, *, status_meta: dict | None = None) -> None:
-        column = self._status_column_index()
-        item = self._ensure_item(row, column)
-        item.setText(text)
-        item.setTextAlignment(Qt.AlignCenter)
-        if status_meta is not None:
-            item.setData(Qt.UserRole, status_meta)
-
     def _configure_table_columns(self, region_map: Dict[int, str] | None) -> None:
         if not hasattr(self, "table"):
             return
@@ -648,14 +612,13 @@ class ParsingTab(QWidget):
         self._region_order = [rid for rid, _ in ordered_items]
         self._region_labels = {rid: label for rid, label in ordered_items}
 
-        status_col = self._status_column_index()
-        self.table.setColumnCount(status_col + 1)
-
-        headers = ["✓", "№", "Фраза"]
-        headers.extend(self._short_region_label(label, rid) for rid, label in ordered_items)
-        headers.append("Статус")
-        self.table.setHorizontalHeaderLabels(headers)
+        changed = self.table_model.set_regions(
+            [(rid, self._short_region_label(label, rid)) for rid, label in ordered_items]
+        )
+        if not changed:
+            return
 
+        status_col = self._status_column_index()
         self.table.setColumnWidth(0, 36)
         self.table.setColumnWidth(1, 48)
         self.table.setColumnWidth(2, 420)
@@ -663,14 +626,6 @@ class ParsingTab(QWidget):
             self.table.setColumnWidth(3 + idx, 160)
         self.table.setColumnWidth(status_col, 100)
 
-        for row in range(self.table.rowCount()):
-            self._ensure_checkbox(row)
-            self._ensure_item(row, 1)
-            self._ensure_item(row, 2)
-            for idx in range(len(self._region_order)):
-                self._ensure_item(row, 3 + idx)
-            self._ensure_item(row, status_col)
-
     def setup_ui(self) -> None:
         """Создание интерфейса вкладки парсинга в стиле Key Collector"""
         from PySide6.QtWidgets import (
@@ -713,10 +668,15 @@ class ParsingTab(QWidget):
 
         left_layout.addLayout(control_buttons)
         
-        # Таблица фраз
-        self.table = QTableWidget()
+        # Таблица фраз: модель по колонкам + прокси для фильтров
+        self.table_model = PhraseTableModel(self)
+        self.table_proxy = PhraseFilterProxyModel(self)
+        self.table_proxy.setSourceModel(self.table_model)
+        self.table = QTableView()
+        self.table.setModel(self.table_proxy)
         self._configure_table_columns(self._active_regions)
         self.table.verticalHeader().setVisible(False)
+        self.table.verticalHeader().setDefaultSectionSize(24)
         self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
         self.table.setSelectionMode(QAbstractItemView.NoSelection)
         self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
@@ -1087,120 +1047,33 @@ class ParsingTab(QWidget):
 
     def _insert_phrase_row(self, phrase: str, ws: str = "", status: str = "—", checked: bool = True) -> None:
         self._configure_table_columns(self._active_regions)
-        row_idx = self.table.rowCount()
-        self.table.insertRow(row_idx)
-
-        checkbox = QCheckBox()
-        checkbox.setChecked(checked)
-        checkbox_container = QWidget()
-        checkbox_layout = QHBoxLayout(checkbox_container)
-        checkbox_layout.setContentsMargins(0, 0, 0, 0)
-        checkbox_layout.setAlignment(Qt.AlignCenter)
-        checkbox_layout.addWidget(checkbox)
-        self.table.setCellWidget(row_idx, 0, checkbox_container)
-
-        self._set_cell_text(row_idx, 1, row_idx + 1)
-        self._set_cell_text(row_idx, 2, phrase)
-        for idx in range(len(self._region_order)):
-            self._set_cell_text(row_idx, 3 + idx, ws if idx == 0 else "")
-        self._set_cell_text(row_idx, self._status_column_index(), status)
-
-    def _renumber_rows(self) -> None:
-        for row in range(self.table.rowCount()):
-            self._set_cell_text(row, 1, row + 1)
-
-    def _get_checkbox(self, row: int) -> QCheckBox | None:
-        widget = self.table.cellWidget(row, 0)
-        if isinstance(widget, QCheckBox):
-            return widget
-        if widget:
-            checkbox = widget.findChild(QCheckBox)
-            if isinstance(checkbox, QCheckBox):
-                return checkbox
-        return None
-
-    def _ensure_checkbox(self, row: int, checked: bool | None = None) -> QCheckBox | None:
-        checkbox = self._get_checkbox(row)
-        if checkbox is None:
-            checkbox = QCheckBox()
-            container = QWidget()
-            layout = QHBoxLayout(container)
-            layout.setContentsMargins(0, 0, 0, 0)
-            layout.setAlignment(Qt.AlignCenter)
-            layout.addWidget(checkbox)
-            self.table.setCellWidget(row, 0, container)
-        if checked is not None and checkbox is not None:
-            checkbox.setChecked(checked)
-        return checkbox
+        freq = self._coerce_freq(ws) if str(ws).strip() else -1
+        self.table_model.append_phrases([phrase], checked=checked, status=status, freq=freq)
 
     def _get_all_phrases(self) -> List[str]:
-        phrases: List[str] = []
-        for row in range(self.table.rowCount()):
-            phrase_item = self.table.item(row, 2)
-            if phrase_item:
-                phrase = phrase_item.text().strip()
-                if phrase:
-                    phrases.append(phrase)
-        return phrases
+        return self.table_model.phrases()
 
     def _get_selected_phrases(self) -> List[str]:
-        selected: List[str] = []
-        for row in range(self.table.rowCount()):
-            checkbox = self._get_checkbox(row)
-            if not checkbox or not checkbox.isChecked():
-                continue
-            phrase_item = self.table.item(row, 2)
-            if phrase_item:
-                phrase = phrase_item.text().strip()
-                if phrase:
-                    selected.append(phrase)
-        return selected
+        model = self.table_model
+        return [model.phrase(row) for row in model.checked_rows()]
 
     def _mark_phrases_pending(self, phrases: List[str]) -> None:
-        pending = set(phrases)
-        for row in range(self.table.rowCount()):
-            phrase_item = self.table.item(row, 2)
-            if not phrase_item:
-                continue
-            if phrase_item.text().strip() in pending:
-                for idx in range(len(self._region_order)):
-                    self._set_cell_text(row, 3 + idx, "")
-                self._set_cell_text(row, self._status_column_index(), "⏳")
+        self.table_model.mark_pending(phrases)
 
     def save_session_state(self, partial_results: List[Dict[str, Any]] | None = None) -> None:
-        """Сохранить состояние парсинга, чтобы восстановить его при следующем запуске."""
-        try:
-            SESSION_FILE.parent.mkdir(parents=True, exist_ok=True)
-        except Exception as exc:  # pragma: no cover - best effort
-            print(f"[ERROR] Failed to prepare session directory: {exc}")
-            return
+        """Сохранить состояние парсинга, чтобы восстановить его при следующем запуске.
 
-        phrases = self._get_all_phrases()
-        state: Dict[str, Any] = {
-            "timestamp": datetime.now().isoformat(),
-            "phrases": phrases,
-            "settings": self._last_settings,
-            "manual_buffer": self._manual_phrases_cache,
-        }
+        Фразы попадают в журнал сразу при изменении таблицы; здесь дописываются
+        настройки, буфер ручного ввода и только новые/изменившиеся результаты.
+        """
+        self._journal.set_settings(self._last_settings)
+        self._journal.set_manual_buffer(self._manual_phrases_cache)
         if partial_results is not None:
-            state["partial_results"] = partial_results
-
-        try:
-            with SESSION_FILE.open("w", encoding="utf-8") as fh:
-                json.dump(state, fh, ensure_ascii=False, indent=2)
-        except Exception as exc:
-            print(f"[ERROR] Failed to save session: {exc}")
+            self._journal.record_results(partial_results)
 
     def load_session_state(self) -> Dict[str, Any] | None:
         """Загрузить сохранённое состояние парсинга, если оно доступно."""
-        if not SESSION_FILE.exists():
-            return None
-        try:
-            with SESSION_FILE.open("r", encoding="utf-8") as fh:
-                return json.load(fh)
-        except Exception as exc:
-            print(f"[ERROR] Failed to load session: {exc}")
-            return None
+        return self._journal.load()
 
     def _restore_session_state(self) -> None:
         """Восстановить состояние парсинга после перезапуска приложения."""
@@ -1210,10 +1083,9 @@ class ParsingTab(QWidget):
 
         phrases = state.get("phrases") or []
         if phrases:
-            self.table.setRowCount(0)
-            for phrase in phrases:
-                self._insert_phrase_row(phrase, checked=False)
-            self._renumber_rows()
+            self.table_model.clear()
+            self._configure_table_columns(self._active_regions)
+            self.table_model.append_phrases(phrases, checked=False)
             self._manual_phrases_cache = "\n".join(phrases)
         else:
             self._manual_phrases_cache = ""
@@ -1295,37 +1167,7 @@ class ParsingTab(QWidget):
 
         self._configure_table_columns(combined_regions)
         self._active_regions = dict(combined_regions)
-
-        for row in range(self.table.rowCount()):
-            self._ensure_checkbox(row)
-            phrase_item = self.table.item(row, 2)
-            if not phrase_item:
-                continue
-            phrase = phrase_item.text()
-            region_values = phrase_region_values.get(phrase, {})
-            region_status_map = phrase_statuses.get(phrase, {})
-
-            if not region_values and not region_status_map:
-                self._set_status_cell(row, "⏱")
-                continue
-
-            has_alert = False
-            status_meta: Dict[int, str] = {}
-            for idx, region_id in enumerate(self._region_order):
-                status = region_status_map.get(region_id)
-                if status is None:
-                    status = "NO_DATA" if phrase in phrase_region_values else "OK"
-                status = str(status).strip().upper().replace(" ", "_")
-                if status in {"FAILED", "ERROR"}:
-                    status = "NO_DATA"
-                freq_value = region_values.get(region_id, 0)
-                if status == "NO_DATA":
-                    has_alert = True
-                self._set_frequency_cell(row, 3 + idx, freq_value, region_id=region_id, status=status)
-                status_meta[region_id] = status
-
-            status_text = "⚠️" if has_alert else "✓"
-            self._set_status_cell(row, status_text, status_meta=status_meta)
+        self.table_model.apply_results(phrase_region_values, phrase_statuses)
 
         for phrase, regions in phrase_region_values.items():
             status_map = phrase_statuses.get(phrase) or {}
@@ -1371,9 +1213,8 @@ class ParsingTab(QWidget):
 
     def _select_all_rows(self):
         """Выбрать все строки в таблице"""
-        for row in range(self.table.rowCount()):
-            self._ensure_checkbox(row, True)
-        self._append_log(f"✓ Отмечено фраз: {self.table.rowCount()}")
+        self.table_model.set_all_checked(True)
+        self._append_log(f"✓ Отмечено фраз: {self.table_model.rowCount()}")
 
     def select_all(self):
         """Выбрать все строки в таблице (публичный метод)"""
@@ -1381,8 +1222,7 @@ class ParsingTab(QWidget):
 
     def _deselect_all_rows(self):
         """Снять выбор со всех строк"""
-        for row in range(self.table.rowCount()):
-            self._ensure_checkbox(row, False)
+        self.table_model.set_all_checked(False)
         self._append_log("✗ Все отметки сняты")
 
     def deselect_all(self):
@@ -1391,11 +1231,8 @@ class ParsingTab(QWidget):
 
     def _invert_selection(self):
         """Инвертировать выбор строк"""
-        for row in range(self.table.rowCount()):
-            checkbox = self._get_checkbox(row)
-            if checkbox:
-                checkbox.setChecked(not checkbox.isChecked())
-        selected = len(self._get_selected_phrases())
+        self.table_model.invert_checked()
+        selected = self.table_model.checked_count()
         self._append_log(f"🔄 Отметки инвертированы ({selected} строк)")
 
     def invert_selection(self):
@@ -1416,15 +1253,8 @@ class ParsingTab(QWidget):
             return
         
         filter_text = filter_text.strip().lower()
-        count = 0
-        
-        for row in range(self.table.rowCount()):
-            phrase_item = self.table.item(row, 2)
-            if phrase_item and filter_text in phrase_item.text().lower():
-                checkbox = self._get_checkbox(row)
-                if checkbox:
-                    checkbox.setChecked(True)
-                    count += 1
+        matched = PhraseFilter(search_text=filter_text).matching_rows(self.table_model)
+        count = self.table_model.check_rows(matched, True)
         
         self._append_log(f"🔍 Найдено и выбрано {count} фраз по фильтру '{filter_text}'")
 
@@ -1668,14 +1498,7 @@ class ParsingTab(QWidget):
         group_name = group_item.text(0)
         group_id = group_item.data(0, Qt.UserRole)
         
-        selected_rows = []
-        for row in range(self.table.rowCount()):
-            checkbox = self._get_checkbox(row)
-            if checkbox and checkbox.isChecked():
-                phrase_item = self.table.item(row, 2)
-                if phrase_item:
-                    phrase = phrase_item.text()
-                    selected_rows.append((row, phrase))
+        selected_rows = [(row, self.table_model.phrase(row)) for row in self.table_model.checked_rows()]
         
         if not selected_rows:
             QMessageBox.warning(self, "Ошибка", "Выберите фразы для перемещения!")
@@ -1843,13 +1666,12 @@ class ParsingTab(QWidget):
         if not normalized:
             return 0
 
-        for phrase in normalized:
-            self._insert_phrase_row(phrase, checked=checked)
+        self._configure_table_columns(self._active_regions)
+        self.table_model.append_phrases(normalized, checked=checked)
 
-        self._renumber_rows()
         source_label = source or "фраз"
         self._append_log(
-            f"➕ Добавлено {source_label}: {len(normalized)} (всего: {self.table.rowCount()})"
+            f"➕ Добавлено {source_label}: {len(normalized)} (всего: {self.table_model.rowCount()})"
         )
         return len(normalized)
 
@@ -1915,29 +1737,24 @@ class ParsingTab(QWidget):
 
     def _on_delete_phrases(self):
         """Удалить выбранные фразы из таблицы"""
-        rows_to_remove = [
-            row for row in range(self.table.rowCount())
-            if (checkbox := self._get_checkbox(row)) and checkbox.isChecked()
-        ]
+        rows_to_remove = self.table_model.checked_rows()
         if not rows_to_remove:
-            rows_to_remove = [idx.row() for idx in self.table.selectionModel().selectedRows()]
+            rows_to_remove = self.table_proxy.source_rows(
+                idx.row() for idx in self.table.selectionModel().selectedRows()
+            )
 
         if not rows_to_remove:
             self._append_log("❌ Нет отмеченных строк для удаления")
             return
 
-        unique_rows = sorted(set(rows_to_remove), reverse=True)
-        for row in unique_rows:
-            self.table.removeRow(row)
-
-        self._renumber_rows()
+        removed = self.table_model.remove_rows(rows_to_remove)
 
-        self._append_log(f"🗑️ Удалено строк: {len(unique_rows)} (осталось: {self.table.rowCount()})")
+        self._append_log(f"🗑️ Удалено строк: {removed} (осталось: {self.table_model.rowCount()})")
 
     def _on_clear_results(self):
         """Очистить все результаты из таблицы"""
-        row_count = self.table.rowCount()
-        self.table.setRowCount(0)
+        row_count = self.table_model.rowCount()
+        self.table_model.clear()
         self._append_log(f"🗑️ Таблица очищена ({row_count} строк удалено)")
 
     def _on_batch_parsing(self):
@@ -2052,6 +1869,7 @@ class ParsingTab(QWidget):
 
             # Обрабатываем результаты
             total_found = 0
+            found_phrases: List[str] = []
             for parent_phrase, suggestions in results.items():
                 if not suggestions:
                     self._append_log(f"📂 '{parent_phrase}' → подсказок не найдено")
@@ -2065,20 +1883,20 @@ class ParsingTab(QWidget):
                     shows = item["shows"]
                     self._append_log(f"  • {phrase} ({shows} показов)")
 
-                    # Добавляем в таблицу
-                    self._insert_phrase_row(phrase, status="OK", checked=False)
+                    found_phrases.append(phrase)
                     total_found += 1
 
                 if len(suggestions) > 10:
                     self._append_log(f"  ... и еще {len(suggestions) - 10} фраз")
 
-                    # Добавляем остальные в таблицу (без логов)
+                    # Остальные добавляем в таблицу без логов
                     for item in suggestions[10:]:
-                        phrase = item["phrase"]
-                        self._insert_phrase_row(phrase, status="OK", checked=False)
+                        found_phrases.append(item["phrase"])
                         total_found += 1
 
-            self._renumber_rows()
+            # Добавляем в таблицу одной вставкой
+            self._configure_table_columns(self._active_regions)
+            self.table_model.append_phrases(found_phrases, status="OK", checked=False)
             self._append_log(f"\n✅ Парсинг завершен! Добавлено фраз: {total_found}")
 
         except Exception as e:
@@ -2367,7 +2185,6 @@ class ParsingTab(QWidget):
         self.status_label.setText("🟢 Готово")
 
         normalized_rows = self._populate_results(all_results)
-        self._renumber_rows()
 
         self._append_log("=" * 70)
         self._append_log(f"✅ ПАРСИНГ ЗАВЕРШЕН")
@@ -2378,7 +2195,7 @@ class ParsingTab(QWidget):
         
     def _on_export_clicked(self):
         """Экспорт результатов в CSV с 2 колонками: Фраза и Частотность"""
-        if self.table.rowCount() == 0:
+        if self.table_model.rowCount() == 0:
             self._append_log("❌ Нет результатов для экспорта")
             return
 
@@ -2393,26 +2210,12 @@ class ParsingTab(QWidget):
             try:
                 import csv
 
-                # Собираем данные: фраза + WS (колонки 2 и 3)
-                export_data = []
-                for row in range(self.table.rowCount()):
-                    phrase_item = self.table.item(row, 2)  # Колонка "Фраза"
-                    ws_item = self.table.item(row, 3)      # Колонка "WS"
-
-                    if phrase_item and ws_item:
-                        phrase = phrase_item.text()
-                        ws_text = ws_item.text()
-
-                        # Конвертируем частотность в число
-                        try:
-                            ws_value = int(float(ws_text)) if ws_text else 0
-                        except (ValueError, TypeError):
-                            ws_value = 0
-
-                        export_data.append({
-                            'phrase': phrase,
-                            'frequency': ws_value
-                        })
+                # Собираем данные: фраза + WS первого региона
+                model = self.table_model
+                export_data = [
+                    {'phrase': model.phrase(row), 'frequency': max(model.value(row), 0)}
+                    for row in range(model.rowCount())
+                ]
 
                 # Сортируем по частотности (по убыванию - самые популярные сверху)
                 export_data.sort(key=lambda x: x['frequency'], reverse=True)
@@ -2447,28 +2250,14 @@ class ParsingTab(QWidget):
 
             # Импортируем морфологию
             try:
-                from ...services.morphology import match_stopword
+                from ...services.morphology import StopwordMatcher
             except ImportError:
-                from services.morphology import match_stopword
+                from services.morphology import StopwordMatcher
 
-            removed_count = 0
-            rows_to_remove = []
-
-            for row in range(self.keys_table.rowCount()):
-                phrase_item = self.keys_table.item(row, 0)
-                if not phrase_item:
-                    continue
-                phrase = phrase_item.text()
-
-                for stopword in stopwords:
-                    if match_stopword(phrase, stopword, mode):
-                        rows_to_remove.append(row)
-                        break
-
-            # Удаляем строки в обратном порядке
-            for row in sorted(rows_to_remove, reverse=True):
-                self.keys_table.removeRow(row)
-                removed_count += 1
+            matcher = StopwordMatcher(stopwords, mode)
+            model = self.table_model
+            rows_to_remove = [row for row in range(model.rowCount()) if matcher.matches(model.phrase(row))]
+            removed_count = model.remove_rows(rows_to_remove)
 
             mode_names = {
                 'exact': 'точное совпадение',
@@ -2484,49 +2273,16 @@ class ParsingTab(QWidget):
         if dialog.exec() == QDialog.Accepted:
             filters = dialog.get_filters()
 
-            visible_count = 0
-            for row in range(self.keys_table.rowCount()):
-                show_row = True
-
-                # Фильтр по частоте
-                freq_item = self.keys_table.item(row, 1)
-                if freq_item:
-                    try:
-                        freq = int(freq_item.text())
-                        if not (filters['freq_min'] <= freq <= filters['freq_max']):
-                            show_row = False
-                    except ValueError:
-                        pass
-
-                # Фильтр по количеству слов
-                phrase_item = self.keys_table.item(row, 0)
-                if phrase_item and show_row:
-                    words_count = len(phrase_item.text().split())
-                    if not (filters['words_min'] <= words_count <= filters['words_max']):
-                        show_row = False
-
-                # Фильтр по тексту
-                if filters['search_text'] and show_row:
-                    if phrase_item and filters['search_text'].lower() not in phrase_item.text().lower():
-                        show_row = False
-
-                self.keys_table.setRowHidden(row, not show_row)
-                if show_row:
-                    visible_count += 1
-
-            self._append_log(f"🔍 Фильтр применен: видно {visible_count} из {self.keys_table.rowCount()} фраз")
+            self.table_proxy.set_phrase_filter(PhraseFilter.from_dialog(filters))
+            visible_count = self.table_proxy.rowCount()
+            self._append_log(f"🔍 Фильтр применен: видно {visible_count} из {self.table_model.rowCount()} фраз")
 
     def _on_duplicates_clicked(self):
         """Обработчик кнопки Дубли"""
         phrases_dict = {}
         duplicates = []
 
-        for row in range(self.keys_table.rowCount()):
-            phrase_item = self.keys_table.item(row, 0)
-            if not phrase_item:
-                continue
-            phrase = phrase_item.text()
-
+        for row, phrase in enumerate(self.table_model.phrases()):
             if phrase in phrases_dict:
                 if phrase not in duplicates:
                     duplicates.append(phrase)
@@ -2546,20 +2302,10 @@ class ParsingTab(QWidget):
                 rows = phrases_dict[phrase][1:]
                 rows_to_remove.extend(rows)
 
-            # Удаляем в обратном порядке
-            for row in sorted(rows_to_remove, reverse=True):
-                self.keys_table.removeRow(row)
+            self.table_model.remove_rows(rows_to_remove)
 
             self._append_log(f"🔄 Удалено дублей: {len(rows_to_remove)}")
 
     def add_table_checkboxes(self):
-        """Добавить чекбоксы в первый столбец таблицы"""
-        if not hasattr(self, 'keys_table'):
-            return
-
-        for row in range(self.keys_table.rowCount()):
-            item = self.keys_table.item(row, 0)
-            if item:
-                item.setFlags(item.flags() | Qt.ItemIsUserCheckable)
-                item.setCheckState(Qt.Unchecked)
-
+        """Чекбоксы первого столбца: в модели они есть всегда, достаточно показать колонку."""
+        self.table.setColumnHidden(PhraseTableModel.CHECK_COLUMN, False)
@@ -3,4 +3,4 @@
 Helper widgets used across the KeySet GUI.
 """
 
-__all__ = ["toolbar", "activity_log"]
+__all__ = ["toolbar", "activity_log", "phrase_table_model", "group_tree_model"]
@@ -0,0 +1,439 @@
+# -*- coding: utf-8 -*-
+"""
+Модель дерева групп правой панели (KeysPanel).
+
+Фразы группы подгружаются порциями через canFetchMore/fetchMore только при
+раскрытии. Новый набор групп применяется как дифф: изменённые группы
+обновляются на месте, удалённые и добавленные — вставкой/удалением строк.
+Фильтр строит список видимых групп по заранее свёрнутым именам, без
+скрытия строк по одной.
+"""
+from __future__ import annotations
+
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from PySide6.QtCore import QAbstractItemModel, QModelIndex, Qt
+from PySide6.QtGui import QColor, QFont
+
+TRASH_NAME = "Корзина"
+# Сколько фраз подгружать за один fetchMore
+FETCH_BATCH = 500
+
+FILTER_ALL = "Все"
+FILTER_WITH_PHRASES = "С фразами"
+FILTER_EMPTY = "Пустые"
+FILTER_TRASH = "Корзина"
+
+_GROUP_ID = 0
+_MUTED = QColor("#999")
+_PHRASE_COLOR = QColor("#ddd")
+
+
+class _GroupNode:
+    __slots__ = ("uid", "name", "folded", "phrases", "color", "loaded", "is_trash")
+
+    def __init__(self, uid: int, name: str, phrases: List[str], color: Optional[str] = None, is_trash: bool = False):
+        self.uid = uid
+        self.name = name
+        self.folded = name.casefold()
+        self.phrases = phrases
+        self.color = color
+        self.loaded = 0
+        self.is_trash = is_trash
+
+
+def _phrase_text(entry: Any) -> str:
+    if isinstance(entry, dict):
+        return str(entry.get("phrase", ""))
+    return str(entry)
+
+
+def normalize_groups(groups: Dict[Any, Any]) -> List[Tuple[str, List[str], Optional[str]]]:
+    """{name: [phrases]} или {id: {'name', 'phrases', 'color'}} -> [(name, phrases, color)]."""
+    normalized: List[Tuple[str, List[str], Optional[str]]] = []
+    for key, data in (groups or {}).items():
+        if isinstance(data, dict):
+            name = str(data.get("name", key))
+            phrases = data.get("phrases", [])
+            color = data.get("color") or None
+        else:
+            name = str(key)
+            phrases = data if isinstance(data, list) else []
+            color = None
+        normalized.append((name, [_phrase_text(entry) for entry in phrases], color))
+    return normalized
+
+
+class GroupTreeModel(QAbstractItemModel):
+    """Двухуровневое дерево: группы -> фразы. Корзина всегда первая."""
+
+    def __init__(self, parent=None) -> None:
+        super().__init__(parent)
+        self._next_uid = 1
+        self._trash = _GroupNode(self._take_uid(), TRASH_NAME, [], is_trash=True)
+        self._nodes: Dict[int, _GroupNode] = {self._trash.uid: self._trash}
+        self._by_name: Dict[str, int] = {}
+        self._order: List[int] = []
+        self._visible: List[int] = []
+        self._row_of: Dict[int, int] = {}
+        self._filter_text = ""
+        self._filter_mode = FILTER_ALL
+        # Пока вставляются/удаляются строки, fetchMore из слотов на сигналы модели не догружает
+        self._fetching = False
+        self._visible = self._compute_visible()
+        self._reindex()
+
+    def _take_uid(self) -> int:
+        uid = self._next_uid
+        self._next_uid += 1
+        return uid
+
+    # ------------------------------------------------------------ Qt API
+
+    def index(self, row: int, column: int, parent: QModelIndex = QModelIndex()) -> QModelIndex:
+        if column < 0 or column > 1 or row < 0:
+            return QModelIndex()
+        if not parent.isValid():
+            if row >= len(self._visible):
+                return QModelIndex()
+            return self.createIndex(row, column, _GROUP_ID)
+        if parent.internalId() != _GROUP_ID:
+            return QModelIndex()
+        node = self._node_at(parent.row())
+        if node is None or row >= node.loaded:
+            return QModelIndex()
+        return self.createIndex(row, column, node.uid)
+
+    def parent(self, index: QModelIndex = QModelIndex()) -> QModelIndex:  # type: ignore[override]
+        if not index.isValid() or index.internalId() == _GROUP_ID:
+            return QModelIndex()
+        row = self._row_of.get(index.internalId())
+        if row is None:
+            return QModelIndex()
+        return self.createIndex(row, 0, _GROUP_ID)
+
+    def rowCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        if not parent.isValid():
+            return len(self._visible)
+        if parent.internalId() != _GROUP_ID or parent.column() != 0:
+            return 0
+        node = self._node_at(parent.row())
+        return node.loaded if node else 0
+
+    def columnCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        return 2
+
+    def hasChildren(self, parent: QModelIndex = QModelIndex()) -> bool:
+        if not parent.isValid():
+            return bool(self._visible)
+        if parent.internalId() != _GROUP_ID or parent.column() != 0:
+            return False
+        node = self._node_at(parent.row())
+        return bool(node and node.phrases)
+
+    def canFetchMore(self, parent: QModelIndex) -> bool:
+        if self._fetching or not parent.isValid() or parent.internalId() != _GROUP_ID:
+            return False
+        node = self._node_at(parent.row())
+        return bool(node and node.loaded < len(node.phrases))
+
+    def fetchMore(self, parent: QModelIndex) -> None:
+        if not self.canFetchMore(parent):
+            return
+        node = self._node_at(parent.row())
+        upto = min(len(node.phrases), node.loaded + FETCH_BATCH)
+        self._insert_phrase_rows(parent, node, upto)
+
+    def _insert_phrase_rows(self, parent: QModelIndex, node: _GroupNode, upto: int) -> None:
+        self._fetching = True
+        try:
+            self.beginInsertRows(parent, node.loaded, upto - 1)
+            node.loaded = upto
+            self.endInsertRows()
+        finally:
+            self._fetching = False
+
+    def headerData(self, section: int, orientation: Qt.Orientation, role: int = Qt.DisplayRole) -> Any:
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return "Группа / Фраза" if section == 0 else ""
+        return None
+
+    def flags(self, index: QModelIndex) -> Qt.ItemFlags:
+        if not index.isValid():
+            return Qt.NoItemFlags
+        return Qt.ItemIsEnabled | Qt.ItemIsSelectable
+
+    def data(self, index: QModelIndex, role: int = Qt.DisplayRole) -> Any:
+        if not index.isValid():
+            return None
+        if index.internalId() == _GROUP_ID:
+            node = self._node_at(index.row())
+            if node is None:
+                return None
+            if index.column() != 0:
+                return "" if role == Qt.DisplayRole else None
+            if role == Qt.DisplayRole:
+                return f"{node.name} ({len(node.phrases)})"
+            if role == Qt.UserRole:
+                return node.name
+            if role == Qt.FontRole and not node.is_trash:
+                font = QFont()
+                font.setBold(True)
+                return font
+            if role == Qt.BackgroundRole and node.color:
+                return QColor(node.color)
+            if role == Qt.ForegroundRole and (node.is_trash or not node.phrases):
+                return _MUTED
+            return None
+
+        node = self._nodes.get(index.internalId())
+        if node is None or index.row() >= len(node.phrases):
+            return None
+        if index.column() != 0:
+            return "" if role == Qt.DisplayRole else None
+        if role in (Qt.DisplayRole, Qt.UserRole):
+            return node.phrases[index.row()]
+        if role == Qt.ForegroundRole:
+            return _PHRASE_COLOR
+        return None
+
+    # ----------------------------------------------------------- helpers
+
+    def _node_at(self, row: int) -> Optional[_GroupNode]:
+        if 0 <= row < len(self._visible):
+            return self._nodes.get(self._visible[row])
+        return None
+
+    def _reindex(self) -> None:
+        self._row_of = {uid: row for row, uid in enumerate(self._visible)}
+
+    def _accepts(self, node: _GroupNode) -> bool:
+        mode = self._filter_mode
+        if node.is_trash:
+            return mode in (FILTER_ALL, FILTER_TRASH) and (not self._filter_text or self._filter_text in node.folded)
+        if mode == FILTER_TRASH:
+            return False
+        if mode == FILTER_WITH_PHRASES and not node.phrases:
+            return False
+        if mode == FILTER_EMPTY and node.phrases:
+            return False
+        return not self._filter_text or self._filter_text in node.folded
+
+    def _compute_visible(self) -> List[int]:
+        nodes = self._nodes
+        candidates = [self._trash.uid, *self._order]
+        if not self._filter_text and self._filter_mode == FILTER_ALL:
+            return candidates
+        return [uid for uid in candidates if self._accepts(nodes[uid])]
+
+    def group_index(self, name: str) -> QModelIndex:
+        uid = self._by_name.get(name)
+        row = self._row_of.get(uid) if uid is not None else None
+        return QModelIndex() if row is None else self.createIndex(row, 0, _GROUP_ID)
+
+    def group_name(self, index: QModelIndex) -> Optional[str]:
+        """Имя группы для индекса группы (None — фраза, корзина или пусто)."""
+        if not index.isValid() or index.internalId() != _GROUP_ID:
+            return None
+        node = self._node_at(index.row())
+        return None if node is None or node.is_trash else node.name
+
+    def phrases(self, name: str) -> List[str]:
+        uid = self._by_name.get(name)
+        return list(self._nodes[uid].phrases) if uid is not None else []
+
+    def group_names(self) -> List[str]:
+        return [self._nodes[uid].name for uid in self._order]
+
+    def visible_group_count(self) -> int:
+        return sum(1 for uid in self._visible if not self._nodes[uid].is_trash)
+
+    def _emit_group_changed(self, uid: int) -> None:
+        row = self._row_of.get(uid)
+        if row is not None:
+            self.dataChanged.emit(self.createIndex(row, 0, _GROUP_ID), self.createIndex(row, 1, _GROUP_ID))
+
+    # ------------------------------------------------------------ filter
+
+    def set_filter(self, text: str = "", mode: Optional[str] = None) -> int:
+        """Применить поиск/режим фильтра; возвращает число видимых групп."""
+        self._filter_text = (text or "").strip().casefold()
+        if mode is not None:
+            self._filter_mode = mode
+        self._refilter()
+        return self.visible_group_count()
+
+    def _refilter(self) -> None:
+        visible = self._compute_visible()
+        if visible == self._visible:
+            return
+        # Фразы в сброшенной модели не загружены — сбрасываем и счётчики
+        self.beginResetModel()
+        for node in self._nodes.values():
+            node.loaded = 0
+        self._visible = visible
+        self._reindex()
+        self.endResetModel()
+
+    # ---------------------------------------------------------- groups
+
+    def set_groups(self, groups: Dict[Any, Any]) -> None:
+        """Применить новый набор групп как дифф к текущему."""
+        incoming = normalize_groups(groups)
+        incoming_names = {name for name, _, _ in incoming}
+        kept_new_order = [name for name, _, _ in incoming if name in self._by_name]
+        kept_old_order = [self._nodes[uid].name for uid in self._order if self._nodes[uid].name in incoming_names]
+        if kept_new_order != kept_old_order or len(incoming_names) != len(incoming):
+            self._rebuild(incoming)
+            return
+
+        # Удалённые группы
+        removed = [uid for uid in self._order if self._nodes[uid].name not in incoming_names]
+        if removed:
+            removed_set = set(removed)
+            self._remove_visible_rows(sorted(self._row_of[uid] for uid in removed if uid in self._row_of))
+            self._order = [uid for uid in self._order if uid not in removed_set]
+            for uid in removed:
+                node = self._nodes.pop(uid)
+                self._by_name.pop(node.name, None)
+
+        # Изменённые и новые — новые встают на свои места во входном порядке
+        added: Set[int] = set()
+        order: List[int] = []
+        for name, phrases, color in incoming:
+            uid = self._by_name.get(name)
+            if uid is None:
+                node = _GroupNode(self._take_uid(), name, phrases, color)
+                self._nodes[node.uid] = node
+                self._by_name[name] = node.uid
+                added.add(node.uid)
+                uid = node.uid
+            else:
+                self._update_node(self._nodes[uid], phrases, color)
+            order.append(uid)
+        self._order = order
+
+        if added:
+            shown = set(self._visible)
+            target = [
+                uid for uid in (self._trash.uid, *order)
+                if uid in shown or (uid in added and self._accepts(self._nodes[uid]))
+            ]
+            row = 0
+            while row < len(target):
+                if target[row] not in added:
+                    row += 1
+                    continue
+                end = row
+                while end < len(target) and target[end] in added:
+                    end += 1
+                self._fetching = True
+                try:
+                    self.beginInsertRows(QModelIndex(), row, end - 1)
+                    self._visible[row:row] = target[row:end]
+                    self._reindex()
+                    self.endInsertRows()
+                finally:
+                    self._fetching = False
+                row = end
+
+        # В режимах «С фразами»/«Пустые» группа могла сменить видимость
+        if self._filter_mode in (FILTER_WITH_PHRASES, FILTER_EMPTY):
+            self._refilter()
+
+    def _rebuild(self, incoming: List[Tuple[str, List[str], Optional[str]]]) -> None:
+        self.beginResetModel()
+        self._nodes = {self._trash.uid: self._trash}
+        self._trash.loaded = 0
+        self._by_name = {}
+        self._order = []
+        for name, phrases, color in incoming:
+            if name in self._by_name:
+                node = self._nodes[self._by_name[name]]
+                node.phrases = node.phrases + phrases
+                continue
+            node = _GroupNode(self._take_uid(), name, phrases, color)
+            self._nodes[node.uid] = node
+            self._by_name[name] = node.uid
+            self._order.append(node.uid)
+        self._visible = self._compute_visible()
+        self._reindex()
+        self.endResetModel()
+
+    def _remove_visible_rows(self, rows: List[int]) -> None:
+        """Убрать строки верхнего уровня непрерывными диапазонами, с конца."""
+        if not rows:
+            return
+        ranges: List[Tuple[int, int]] = []
+        start = prev = rows[0]
+        for row in rows[1:]:
+            if row == prev + 1:
+                prev = row
+                continue
+            ranges.append((start, prev))
+            start = prev = row
+        ranges.append((start, prev))
+        for first, last in reversed(ranges):
+            self.beginRemoveRows(QModelIndex(), first, last)
+            for uid in self._visible[first:last + 1]:
+                self._nodes[uid].loaded = 0
+            del self._visible[first:last + 1]
+            self._reindex()
+            self.endRemoveRows()
+
+    def _update_node(self, node: _GroupNode, phrases: List[str], color: Optional[str]) -> None:
+        if node.phrases == phrases and node.color == color:
+            return
+        node.color = color
+        if node.phrases == phrases:
+            self._emit_group_changed(node.uid)
+            return
+
+        row = self._row_of.get(node.uid)
+        if row is None:
+            node.phrases = phrases
+            node.loaded = 0
+            return
+
+        parent = self.createIndex(row, 0, _GROUP_ID)
+        old_loaded = node.loaded
+        fully_loaded = old_loaded > 0 and old_loaded == len(node.phrases)
+        keep = min(old_loaded, len(phrases))
+        if old_loaded > keep:
+            self._fetching = True
+            try:
+                self.beginRemoveRows(parent, keep, old_loaded - 1)
+                # Оставшиеся строки меняются ниже через dataChanged, хвост уже новый
+                node.phrases = node.phrases[:keep] + phrases[keep:]
+                node.loaded = keep
+                self.endRemoveRows()
+            finally:
+                self._fetching = False
+        node.phrases = phrases
+        # Слот на сигнал выше мог уже вызвать fetchMore — считаем от node.loaded.
+        # Вставка идёт до dataChanged, чтобы его слоты видели готовое состояние
+        shown = node.loaded
+        # Раскрытая и полностью загруженная группа показывает новые фразы сразу
+        if fully_loaded and len(phrases) > shown:
+            self._insert_phrase_rows(parent, node, min(len(phrases), shown + FETCH_BATCH))
+        if keep:
+            self.dataChanged.emit(self.index(0, 0, parent), self.index(keep - 1, 1, parent))
+        self._emit_group_changed(node.uid)
+
+    def set_group_color(self, name: str, color: Optional[str]) -> None:
+        uid = self._by_name.get(name)
+        if uid is None:
+            return
+        self._nodes[uid].color = color or None
+        self._emit_group_changed(uid)
+
+
+__all__ = [
+    "GroupTreeModel",
+    "normalize_groups",
+    "FETCH_BATCH",
+    "FILTER_ALL",
+    "FILTER_WITH_PHRASES",
+    "FILTER_EMPTY",
+    "FILTER_TRASH",
+]
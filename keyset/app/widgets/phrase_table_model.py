@@ -0,0 +1,464 @@
+# -*- coding: utf-8 -*-
+"""
+Модель таблицы фраз вкладки «Парсинг».
+
+Данные хранятся по колонкам: список фраз, bytearray-флаги отметок, массив
+частот на каждый регион и список статусов. QTableView рисует только видимые
+строки, поэтому вставка, отметки и обновление результатов не создают
+виджетов и QTableWidgetItem на каждую ячейку. Индекс «фраза → строки»
+позволяет обновлять результаты точечно через dataChanged.
+"""
+from __future__ import annotations
+
+from array import array
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from PySide6.QtCore import QAbstractTableModel, QModelIndex, QSortFilterProxyModel, Qt, Signal
+
+# Частота ещё не получена — ячейка пустая
+EMPTY_FREQ = -1
+PENDING_STATUS = "⏳"
+NO_RESULT_STATUS = "⏱"
+_INVERT = bytes.maketrans(b"\x00\x01", b"\x01\x00")
+
+
+class PhraseTableModel(QAbstractTableModel):
+    """Колонки: ✓, №, Фраза, по колонке на регион, Статус."""
+
+    CHECK_COLUMN = 0
+    NUMBER_COLUMN = 1
+    PHRASE_COLUMN = 2
+    FIRST_REGION_COLUMN = 3
+
+    # Изменения списка фраз (для журнала сессии)
+    phrases_appended = Signal(list)
+    rows_removed = Signal(list)
+    cleared = Signal()
+
+    def __init__(self, parent=None) -> None:
+        super().__init__(parent)
+        self._phrases: List[str] = []
+        self._folded: List[str] = []
+        self._checked = bytearray()
+        self._status: List[str] = []
+        self._region_order: List[int] = []
+        self._region_headers: List[str] = []
+        self._values: Dict[int, array] = {}
+        self._region_status: Dict[int, List[Optional[str]]] = {}
+        self._index: Dict[str, List[int]] = {}
+        self._pending: set[int] = set()
+
+    # ------------------------------------------------------------ Qt API
+
+    def rowCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self._phrases)
+
+    def columnCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        return 0 if parent.isValid() else self.status_column + 1
+
+    def headerData(self, section: int, orientation: Qt.Orientation, role: int = Qt.DisplayRole) -> Any:
+        if orientation != Qt.Horizontal or role != Qt.DisplayRole:
+            return None
+        if section == self.CHECK_COLUMN:
+            return "✓"
+        if section == self.NUMBER_COLUMN:
+            return "№"
+        if section == self.PHRASE_COLUMN:
+            return "Фраза"
+        if section == self.status_column:
+            return "Статус"
+        offset = section - self.FIRST_REGION_COLUMN
+        if 0 <= offset < len(self._region_headers):
+            return self._region_headers[offset]
+        return None
+
+    def flags(self, index: QModelIndex) -> Qt.ItemFlags:
+        if not index.isValid():
+            return Qt.NoItemFlags
+        flags = Qt.ItemIsEnabled | Qt.ItemIsSelectable
+        if index.column() == self.CHECK_COLUMN:
+            flags |= Qt.ItemIsUserCheckable
+        return flags
+
+    def data(self, index: QModelIndex, role: int = Qt.DisplayRole) -> Any:
+        if not index.isValid():
+            return None
+        row, column = index.row(), index.column()
+        if row >= len(self._phrases):
+            return None
+
+        if column == self.CHECK_COLUMN:
+            if role == Qt.CheckStateRole:
+                return Qt.Checked if self._checked[row] else Qt.Unchecked
+            return None
+        if role == Qt.TextAlignmentRole:
+            if column == self.status_column:
+                return int(Qt.AlignCenter)
+            if column >= self.FIRST_REGION_COLUMN:
+                return int(Qt.AlignRight | Qt.AlignVCenter)
+            return None
+        if column == self.NUMBER_COLUMN:
+            return row + 1 if role == Qt.DisplayRole else None
+        if column == self.PHRASE_COLUMN:
+            return self._phrases[row] if role in (Qt.DisplayRole, Qt.EditRole) else None
+        if column == self.status_column:
+            if role == Qt.DisplayRole:
+                return self._status[row]
+            if role == Qt.UserRole:
+                return self.status_meta(row)
+            return None
+
+        region_id = self._region_order[column - self.FIRST_REGION_COLUMN]
+        value = self._values[region_id][row]
+        if role == Qt.DisplayRole:
+            return "" if value == EMPTY_FREQ else str(value)
+        if role == Qt.UserRole:
+            status = self._region_status[region_id][row]
+            meta: Dict[str, Any] = {"region_id": region_id, "value": max(value, 0)}
+            if status:
+                meta["status"] = status
+            return meta
+        return None
+
+    def setData(self, index: QModelIndex, value: Any, role: int = Qt.EditRole) -> bool:
+        if not index.isValid() or index.column() != self.CHECK_COLUMN or role != Qt.CheckStateRole:
+            return False
+        state = value.value if hasattr(value, "value") else value
+        self._checked[index.row()] = 1 if state == Qt.Checked.value else 0
+        self.dataChanged.emit(index, index, [Qt.CheckStateRole])
+        return True
+
+    # ----------------------------------------------------------- columns
+
+    @property
+    def status_column(self) -> int:
+        return self.FIRST_REGION_COLUMN + len(self._region_order)
+
+    @property
+    def region_order(self) -> List[int]:
+        return list(self._region_order)
+
+    def set_regions(self, regions: Sequence[Tuple[int, str]]) -> bool:
+        """Задать колонки регионов; уже собранные частоты сохраняются. True — если колонки изменились."""
+        order = [region_id for region_id, _ in regions]
+        headers = [header for _, header in regions]
+        if order == self._region_order and headers == self._region_headers:
+            return False
+        self.beginResetModel()
+        size = len(self._phrases)
+        for region_id in order:
+            if region_id not in self._values:
+                self._values[region_id] = array("q", [EMPTY_FREQ]) * size
+                self._region_status[region_id] = [None] * size
+        self._region_order = order
+        self._region_headers = headers
+        self.endResetModel()
+        return True
+
+    # -------------------------------------------------------------- rows
+
+    def phrase(self, row: int) -> str:
+        return self._phrases[row]
+
+    def phrases(self) -> List[str]:
+        return list(self._phrases)
+
+    def rows_for(self, phrase: str) -> List[int]:
+        return list(self._index.get(phrase, ()))
+
+    def value(self, row: int, region_id: Optional[int] = None) -> int:
+        """Частота строки в регионе (по умолчанию — в первом); EMPTY_FREQ, если её нет."""
+        if region_id is None:
+            if not self._region_order:
+                return EMPTY_FREQ
+            region_id = self._region_order[0]
+        column = self._values.get(region_id)
+        return column[row] if column is not None else EMPTY_FREQ
+
+    def word_count(self, row: int) -> int:
+        return len(self._phrases[row].split())
+
+    def folded(self, row: int) -> str:
+        return self._folded[row]
+
+    def status_meta(self, row: int) -> Dict[int, str]:
+        return {
+            region_id: status
+            for region_id in self._region_order
+            if (status := self._region_status[region_id][row]) is not None
+        }
+
+    def append_phrases(
+        self,
+        phrases: Iterable[str],
+        *,
+        checked: bool = True,
+        status: str = "—",
+        freq: int = EMPTY_FREQ,
+    ) -> int:
+        """Добавить фразы одной вставкой; freq попадает в первый регион."""
+        new = [str(phrase).strip() for phrase in phrases]
+        new = [phrase for phrase in new if phrase]
+        if not new:
+            return 0
+        first = len(self._phrases)
+        count = len(new)
+        self.beginInsertRows(QModelIndex(), first, first + count - 1)
+        self._phrases.extend(new)
+        self._folded.extend(phrase.lower() for phrase in new)
+        self._checked.extend(b"\x01" * count if checked else b"\x00" * count)
+        self._status.extend([status] * count)
+        for position, region_id in enumerate(self._region_order):
+            fill = freq if position == 0 else EMPTY_FREQ
+            self._values[region_id].extend(array("q", [fill]) * count)
+            self._region_status[region_id].extend([None] * count)
+        for region_id in set(self._values) - set(self._region_order):
+            self._values[region_id].extend(array("q", [EMPTY_FREQ]) * count)
+            self._region_status[region_id].extend([None] * count)
+        for offset, phrase in enumerate(new):
+            self._index.setdefault(phrase, []).append(first + offset)
+        self.endInsertRows()
+        self.phrases_appended.emit(new)
+        return count
+
+    def remove_rows(self, rows: Iterable[int]) -> int:
+        """Удалить строки по номерам (в любом порядке)."""
+        doomed = {row for row in rows if 0 <= row < len(self._phrases)}
+        if not doomed:
+            return 0
+        keep = [row for row in range(len(self._phrases)) if row not in doomed]
+        self.beginResetModel()
+        self._phrases = [self._phrases[row] for row in keep]
+        self._folded = [self._folded[row] for row in keep]
+        self._checked = bytearray(self._checked[row] for row in keep)
+        self._status = [self._status[row] for row in keep]
+        for region_id, column in self._values.items():
+            self._values[region_id] = array("q", (column[row] for row in keep))
+            statuses = self._region_status[region_id]
+            self._region_status[region_id] = [statuses[row] for row in keep]
+        remap = {old: new for new, old in enumerate(keep)}
+        self._pending = {remap[row] for row in self._pending if row in remap}
+        self._rebuild_index()
+        self.endResetModel()
+        self.rows_removed.emit(sorted(doomed))
+        return len(doomed)
+
+    def clear(self) -> None:
+        self.beginResetModel()
+        self._phrases.clear()
+        self._folded.clear()
+        self._checked = bytearray()
+        self._status.clear()
+        for region_id in list(self._values):
+            self._values[region_id] = array("q")
+            self._region_status[region_id] = []
+        self._index.clear()
+        self._pending.clear()
+        self.endResetModel()
+        self.cleared.emit()
+
+    def _rebuild_index(self) -> None:
+        self._index = {}
+        for row, phrase in enumerate(self._phrases):
+            self._index.setdefault(phrase, []).append(row)
+
+    # ------------------------------------------------------------ checks
+
+    def is_checked(self, row: int) -> bool:
+        return bool(self._checked[row])
+
+    def checked_rows(self) -> List[int]:
+        checked = self._checked
+        return [row for row in range(len(checked)) if checked[row]]
+
+    def checked_count(self) -> int:
+        return self._checked.count(1)
+
+    def set_all_checked(self, checked: bool) -> None:
+        self._checked = bytearray(b"\x01" * len(self._phrases) if checked else len(self._phrases))
+        self._emit_check_changed()
+
+    def invert_checked(self) -> None:
+        self._checked = bytearray(self._checked.translate(_INVERT))
+        self._emit_check_changed()
+
+    def check_rows(self, rows: Iterable[int], checked: bool = True) -> int:
+        flag = 1 if checked else 0
+        count = 0
+        for row in rows:
+            self._checked[row] = flag
+            count += 1
+        if count:
+            self._emit_check_changed()
+        return count
+
+    def _emit_check_changed(self) -> None:
+        if self._phrases:
+            self.dataChanged.emit(
+                self.index(0, self.CHECK_COLUMN),
+                self.index(len(self._phrases) - 1, self.CHECK_COLUMN),
+                [Qt.CheckStateRole],
+            )
+
+    # ----------------------------------------------------------- results
+
+    def mark_pending(self, phrases: Iterable[str]) -> None:
+        """Очистить частоты у фраз, отправленных в парсинг, и поставить ⏳."""
+        rows = sorted({row for phrase in set(phrases) for row in self._index.get(phrase, ())})
+        for row in rows:
+            for region_id in self._region_order:
+                self._values[region_id][row] = EMPTY_FREQ
+                self._region_status[region_id][row] = None
+            self._status[row] = PENDING_STATUS
+        self._pending.update(rows)
+        self._emit_rows_changed(rows)
+
+    def apply_results(
+        self,
+        values: Dict[str, Dict[int, int]],
+        statuses: Dict[str, Dict[int, str]],
+    ) -> int:
+        """
+        Записать результаты по индексу фраз и обновить только затронутые строки.
+
+        Регион без статуса у фразы с результатами считается NO_DATA. Фразы,
+        ждавшие результата (⏳) и не получившие его, помечаются ⏱.
+        Возвращает число обновлённых строк.
+        """
+        touched: List[int] = []
+        for phrase in values.keys() | statuses.keys():
+            rows = self._index.get(phrase)
+            if not rows:
+                continue
+            region_values = values.get(phrase, {})
+            region_statuses = statuses.get(phrase, {})
+            for row in rows:
+                has_alert = False
+                for region_id in self._region_order:
+                    status = _normalize_status(region_statuses.get(region_id, "NO_DATA"))
+                    if status == "NO_DATA":
+                        has_alert = True
+                    self._values[region_id][row] = max(int(region_values.get(region_id, 0)), 0)
+                    self._region_status[region_id][row] = status
+                self._status[row] = "⚠️" if has_alert else "✓"
+                touched.append(row)
+
+        self._pending.difference_update(touched)
+        for row in self._pending:
+            self._status[row] = NO_RESULT_STATUS
+        touched.extend(self._pending)
+        self._pending.clear()
+        self._emit_rows_changed(touched)
+        return len(touched)
+
+    def _emit_rows_changed(self, rows: Iterable[int]) -> None:
+        """dataChanged по непрерывным диапазонам затронутых строк."""
+        ordered = sorted(set(rows))
+        if not ordered:
+            return
+        last_column = self.status_column
+        start = prev = ordered[0]
+        for row in ordered[1:] + [None]:
+            if row is not None and row == prev + 1:
+                prev = row
+                continue
+            self.dataChanged.emit(self.index(start, self.FIRST_REGION_COLUMN), self.index(prev, last_column))
+            if row is not None:
+                start = prev = row
+
+
+def _normalize_status(value: Any) -> str:
+    status = str(value or "OK").strip().upper().replace(" ", "_")
+    return "OK" if status == "OK" else "NO_DATA"
+
+
+class PhraseFilter:
+    """Условия фильтра фраз (диалог «Фильтры» и выделение по тексту)."""
+
+    def __init__(
+        self,
+        *,
+        freq_min: Optional[int] = None,
+        freq_max: Optional[int] = None,
+        words_min: Optional[int] = None,
+        words_max: Optional[int] = None,
+        search_text: str = "",
+    ) -> None:
+        self.freq_min = freq_min
+        self.freq_max = freq_max
+        self.words_min = words_min
+        self.words_max = words_max
+        self.search_text = (search_text or "").strip().lower()
+
+    @classmethod
+    def from_dialog(cls, filters: Dict[str, Any]) -> "PhraseFilter":
+        return cls(
+            freq_min=filters.get("freq_min"),
+            freq_max=filters.get("freq_max"),
+            words_min=filters.get("words_min"),
+            words_max=filters.get("words_max"),
+            search_text=filters.get("search_text") or "",
+        )
+
+    def is_empty(self) -> bool:
+        return (
+            not self.search_text
+            and self.freq_min is None and self.freq_max is None
+            and self.words_min is None and self.words_max is None
+        )
+
+    def accepts(self, model: PhraseTableModel, row: int) -> bool:
+        # Строки без частоты не отсекаются по диапазону частот
+        freq = model.value(row)
+        if freq != EMPTY_FREQ:
+            if self.freq_min is not None and freq < self.freq_min:
+                return False
+            if self.freq_max is not None and freq > self.freq_max:
+                return False
+        if self.words_min is not None or self.words_max is not None:
+            words = model.word_count(row)
+            if self.words_min is not None and words < self.words_min:
+                return False
+            if self.words_max is not None and words > self.words_max:
+                return False
+        return not self.search_text or self.search_text in model.folded(row)
+
+    def matching_rows(self, model: PhraseTableModel) -> List[int]:
+        return [row for row in range(model.rowCount()) if self.accepts(model, row)]
+
+
+class PhraseFilterProxyModel(QSortFilterProxyModel):
+    """Прокси, скрывающий строки, которые не проходят PhraseFilter."""
+
+    def __init__(self, parent=None) -> None:
+        super().__init__(parent)
+        self._filter: Optional[PhraseFilter] = None
+
+    @property
+    def phrase_filter(self) -> Optional[PhraseFilter]:
+        return self._filter
+
+    def set_phrase_filter(self, phrase_filter: Optional[PhraseFilter]) -> None:
+        self._filter = None if phrase_filter is None or phrase_filter.is_empty() else phrase_filter
+        # invalidate() перестраивает отображение целиком: при смене фильтра на
+        # десятках тысяч строк это на порядок быстрее построчных сигналов invalidateFilter()
+        self.invalidate()
+
+    def filterAcceptsRow(self, source_row: int, source_parent: QModelIndex) -> bool:
+        if self._filter is None:
+            return True
+        model = self.sourceModel()
+        if not isinstance(model, PhraseTableModel):
+            return True
+        return self._filter.accepts(model, source_row)
+
+    def source_rows(self, proxy_rows: Iterable[int]) -> List[int]:
+        return [self.mapToSource(self.index(row, 0)).row() for row in proxy_rows]
+
+
+__all__ = [
+    "EMPTY_FREQ",
+    "PhraseTableModel",
+    "PhraseFilter",
+    "PhraseFilterProxyModel",
+]
@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+"""
+Журнал состояния вкладки «Парсинг».
+
+Снимок (parsing_session.json) пишется редко и атомарно: во временный файл,
+fsync и os.replace. Между снимками изменения дописываются в журнал
+parsing_session.journal.jsonl по строке на операцию — добавленные фразы,
+удалённые строки, новые результаты, настройки. Стоимость записи
+пропорциональна изменению, а не размеру сессии. Оборванная при падении
+последняя строка журнала отбрасывается, а сам журнал обрезается по
+последней целой строке.
+
+Снимок и журнал помечены номером поколения: журнал применяется, только
+если его поколение совпадает со снимком, поэтому падение между заменой
+снимка и обнулением журнала не приводит к повторному применению операций.
+"""
+from __future__ import annotations
+
+import json
+import os
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Снимок перестраивается, когда журнал перерос его и этот минимум
+COMPACT_MIN_BYTES = 4 * 1024 * 1024
+
+_ResultKey = Tuple[str, int]
+
+
+def _result_key(row: Dict[str, Any]) -> _ResultKey:
+    try:
+        region = int(row.get("region_id") or 225)
+    except (TypeError, ValueError):
+        region = 225
+    return str(row.get("phrase", "")).strip(), region
+
+
+class SessionJournal:
+    """Снимок + журнал операций с состоянием, зеркалируемым в памяти."""
+
+    def __init__(self, snapshot_path: Path | str, *, compact_min_bytes: int = COMPACT_MIN_BYTES) -> None:
+        self.snapshot_path = Path(snapshot_path)
+        self.journal_path = self.snapshot_path.with_suffix(".journal.jsonl")
+        self.compact_min_bytes = compact_min_bytes
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._snapshot_size = 0
+        self._journal_size = 0
+        self._timestamp: Optional[str] = None
+        self._phrases: List[str] = []
+        self._results: Dict[_ResultKey, Dict[str, Any]] = {}
+        self._settings: Optional[Dict[str, Any]] = None
+        self._manual_buffer: Optional[str] = None
+        self._loaded = False
+
+    # ------------------------------------------------------------------ read
+
+    def load(self) -> Dict[str, Any] | None:
+        """Прочитать снимок и доиграть журнал; None — если сессии нет."""
+        with self._lock:
+            self._load_locked()
+            if not self._phrases and not self._results and self._settings is None and self._manual_buffer is None:
+                return None
+            return self._state_locked()
+
+    def _load_locked(self) -> None:
+        self._loaded = True
+        snapshot: Dict[str, Any] = {}
+        if self.snapshot_path.exists():
+            try:
+                with self.snapshot_path.open("r", encoding="utf-8") as fh:
+                    snapshot = json.load(fh)
+                self._snapshot_size = self.snapshot_path.stat().st_size
+            except (OSError, ValueError) as exc:
+                print(f"[ERROR] Failed to load session snapshot: {exc}")
+                snapshot = {}
+
+        self._generation = int(snapshot.get("generation") or 0)
+        self._timestamp = snapshot.get("timestamp")
+        self._phrases = [str(p) for p in snapshot.get("phrases") or []]
+        self._results = {}
+        for row in snapshot.get("partial_results") or []:
+            if isinstance(row, dict):
+                self._results[_result_key(row)] = row
+        settings = snapshot.get("settings")
+        self._settings = settings if isinstance(settings, dict) else None
+        buffer_text = snapshot.get("manual_buffer")
+        self._manual_buffer = buffer_text if isinstance(buffer_text, str) else None
+
+        self._journal_size = 0
+        if not self.journal_path.exists():
+            return
+        try:
+            with self.journal_path.open("r+b") as fh:
+                header = self._read_record(fh.readline())
+                if not header or header.get("op") != "begin" or int(header.get("generation", -1)) != self._generation:
+                    # Журнал от старого поколения уже вошёл в снимок
+                    return
+                good = fh.tell()
+                for line in fh:
+                    record = self._read_record(line)
+                    if record is None:
+                        # Недописанная при падении строка: обрезаем по последней
+                        # целой, иначе следующая запись склеится с ней
+                        fh.truncate(good)
+                        break
+                    self._apply(record)
+                    good += len(line)
+            self._journal_size = good
+        except OSError as exc:
+            print(f"[ERROR] Failed to replay session journal: {exc}")
+
+    @staticmethod
+    def _read_record(line: bytes) -> Optional[Dict[str, Any]]:
+        if not line.endswith(b"\n"):
+            return None
+        try:
+            record = json.loads(line)
+        except ValueError:
+            return None
+        return record if isinstance(record, dict) else None
+
+    def _apply(self, record: Dict[str, Any]) -> None:
+        op = record.get("op")
+        if op == "add":
+            self._phrases.extend(str(p) for p in record.get("phrases") or [])
+        elif op == "remove":
+            doomed = set(record.get("rows") or [])
+            self._phrases = [p for i, p in enumerate(self._phrases) if i not in doomed]
+        elif op == "clear":
+            self._phrases = []
+            self._results = {}
+        elif op == "results":
+            for row in record.get("rows") or []:
+                if isinstance(row, dict):
+                    self._results[_result_key(row)] = row
+        elif op == "settings":
+            settings = record.get("settings")
+            self._settings = settings if isinstance(settings, dict) else None
+        elif op == "buffer":
+            text = record.get("text")
+            self._manual_buffer = text if isinstance(text, str) else None
+        if record.get("ts"):
+            self._timestamp = record["ts"]
+
+    def _state_locked(self) -> Dict[str, Any]:
+        state: Dict[str, Any] = {
+            "timestamp": self._timestamp or datetime.now().isoformat(),
+            "phrases": list(self._phrases),
+            "settings": self._settings,
+            "manual_buffer": self._manual_buffer,
+        }
+        if self._results:
+            state["partial_results"] = list(self._results.values())
+        return state
+
+    # ----------------------------------------------------------------- write
+
+    def add_phrases(self, phrases: Iterable[str]) -> None:
+        phrases = [str(p) for p in phrases]
+        if phrases:
+            self._append({"op": "add", "phrases": phrases})
+
+    def remove_rows(self, rows: Iterable[int]) -> None:
+        rows = sorted(set(int(r) for r in rows))
+        if rows:
+            self._append({"op": "remove", "rows": rows})
+
+    def clear(self) -> None:
+        self._append({"op": "clear"})
+
+    def set_settings(self, settings: Optional[Dict[str, Any]]) -> None:
+        if settings != self._settings:
+            self._append({"op": "settings", "settings": settings})
+
+    def set_manual_buffer(self, text: Optional[str]) -> None:
+        if text != self._manual_buffer:
+            self._append({"op": "buffer", "text": text})
+
+    def record_results(self, rows: Iterable[Dict[str, Any]]) -> int:
+        """Дописать только новые или изменившиеся результаты. Возвращает их число."""
+        with self._lock:
+            fresh = [row for row in rows if self._results.get(_result_key(row)) != row]
+        if fresh:
+            self._append({"op": "results", "rows": fresh})
+        return len(fresh)
+
+    def _append(self, record: Dict[str, Any]) -> None:
+        record["ts"] = datetime.now().isoformat()
+        line = json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n"
+        with self._lock:
+            if not self._loaded:
+                self._load_locked()
+            try:
+                self.journal_path.parent.mkdir(parents=True, exist_ok=True)
+                if not self.journal_path.exists() or self._journal_size == 0:
+                    self._reset_journal_locked()
+                with self.journal_path.open("a", encoding="utf-8") as fh:
+                    fh.write(line)
+                self._journal_size += len(line.encode("utf-8"))
+            except OSError as exc:
+                print(f"[ERROR] Failed to append session journal: {exc}")
+                return
+            self._apply(record)
+            if self._journal_size > max(self.compact_min_bytes, self._snapshot_size):
+                self._compact_locked()
+
+    # ------------------------------------------------------------ compaction
+
+    def compact(self) -> None:
+        """Записать полный снимок и начать пустой журнал нового поколения."""
+        with self._lock:
+            if not self._loaded:
+                self._load_locked()
+            self._compact_locked()
+
+    def _compact_locked(self) -> None:
+        state = self._state_locked()
+        state["generation"] = self._generation + 1
+        try:
+            self.snapshot_path.parent.mkdir(parents=True, exist_ok=True)
+            _atomic_write(self.snapshot_path, json.dumps(state, ensure_ascii=False, separators=(",", ":")))
+        except OSError as exc:
+            print(f"[ERROR] Failed to write session snapshot: {exc}")
+            return
+        self._generation += 1
+        self._snapshot_size = self.snapshot_path.stat().st_size
+        self._reset_journal_locked()
+
+    def _reset_journal_locked(self) -> None:
+        header = json.dumps({"op": "begin", "generation": self._generation}) + "\n"
+        _atomic_write(self.journal_path, header)
+        self._journal_size = len(header)
+
+
+def _atomic_write(path: Path, text: str) -> None:
+    tmp = path.with_name(path.name + ".tmp")
+    with tmp.open("w", encoding="utf-8") as fh:
+        fh.write(text)
+        fh.flush()
+        os.fsync(fh.fileno())
+    os.replace(tmp, path)
+
+
+__all__ = ["SessionJournal", "COMPACT_MIN_BYTES"]
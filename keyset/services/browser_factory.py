@@ -1,14 +1,11 @@
 from __future__ import annotations
 
-import base64
 import json
 import os
 import shutil
 import socket
 import subprocess
 import time
-import urllib.error
-import urllib.request
 from dataclasses import dataclass, field
 from pathlib import Path
 from typing import Any, Callable, Dict, Optional, List
@@ -20,14 +17,14 @@ try:
     from ..core.models import Account
     from ..utils.proxy import proxy_to_playwright
     from ..utils.text_fix import WORDSTAT_FETCH_NORMALIZER_SCRIPT
-    from .proxy_manager import Proxy, ProxyManager
+    from .proxy_manager import Proxy, ProxyManager, proxy_preflight
     from .chrome_launcher import ChromeLauncher
 except ImportError:
     from core.db import SessionLocal
     from core.models import Account
     from utils.proxy import proxy_to_playwright
     from utils.text_fix import WORDSTAT_FETCH_NORMALIZER_SCRIPT
-    from .proxy_manager import Proxy, ProxyManager
+    from .proxy_manager import Proxy, ProxyManager, proxy_preflight
     from .chrome_launcher import ChromeLauncher
 
 BASE_DIR = ChromeLauncher.BASE_DIR
@@ -161,6 +158,25 @@ def _prepare_proxy(
     return None, parsed
 
 
+def _navigate(page: Any, url: str, manager: ProxyManager, proxy_id: Optional[str]) -> None:
+    """Открыть *url*; исход навигации уходит в телеметрию прокси."""
+    started = time.perf_counter()
+    try:
+        response = page.goto(url, wait_until="networkidle")
+    except Exception:
+        # networkidle мог не наступить — пробуем без ожидания тишины в сети
+        started = time.perf_counter()
+        try:
+            response = page.goto(url)
+        except Exception as exc:
+            manager.report_failure(proxy_id, str(exc))
+            return
+    if response is not None and response.status == 403:
+        manager.report_ban(proxy_id, "HTTP 403")
+    else:
+        manager.report_success(proxy_id, (time.perf_counter() - started) * 1000)
+
+
 def for_account(
     account_id: int,
     *,
@@ -276,8 +292,10 @@ def for_account(
             launch_kwargs["channel"] = "chrome"
         try:
             browser = playwright.chromium.launch_persistent_context(**launch_kwargs)
-        except Exception:
+        except Exception as exc:
             playwright.stop()
+            if proxy_obj:
+                manager.report_failure(proxy_obj.id, str(exc))
             manager.release(proxy_obj)
             raise
         browser.add_init_script(script=WORDSTAT_FETCH_NORMALIZER_SCRIPT)
@@ -294,13 +312,7 @@ def for_account(
         except Exception:
             pass
         if target_url:
-            try:
-                page.goto(target_url, wait_until="networkidle")
-            except Exception:
-                try:
-                    page.goto(target_url)
-                except Exception:
-                    pass
+            _navigate(page, target_url, manager, proxy_obj.id if proxy_obj else None)
 
         print(
             f"[BF] PW persistent (proxy={'none' if not proxy_obj else proxy_obj.id}) "
@@ -424,22 +436,16 @@ def for_account(
         pass
     if target_url:
         try:
-            navigated = False
-            try:
-                current_url = page.url
-            except Exception:
-                current_url = ""
-            if not current_url or current_url in {"about:blank", "chrome://newtab/"}:
-                page.goto(target_url, wait_until="networkidle")
-                navigated = True
-            if not navigated:
-                new_page = context.new_page()
-                new_page.goto(target_url, wait_until="networkidle")
+            current_url = page.url
         except Exception:
+            current_url = ""
+        target_page = page
+        if current_url and current_url not in {"about:blank", "chrome://newtab/"}:
             try:
-                page.goto(target_url)
+                target_page = context.new_page()
             except Exception:
-                pass
+                target_page = page
+        _navigate(target_page, target_url, manager, proxy_obj.id if proxy_obj else None)
     print(
         f"[BF] CDP attach (proxy={'none' if not proxy_obj else proxy_obj.id}) "
         f"preflight_ip={preflight.get('ip')}"
@@ -522,45 +528,21 @@ def _preflight_proxy(
     if not proxy_obj and not proxy_kwargs:
         return {"ok": True, "ip": None, "error": None}
 
-    scheme = None
-    server = None
-    username = None
-    password = None
-    if proxy_obj:
-        server = proxy_obj.server
-        scheme = proxy_obj.type
-        username = proxy_obj.username
-        password = proxy_obj.password
-    elif proxy_kwargs:
-        server = proxy_kwargs.get("server")
-        username = proxy_kwargs.get("username")
-        password = proxy_kwargs.get("password")
-        if server:
-            scheme = server.split("://")[0]
-
-    if not server:
-        return {"ok": False, "ip": None, "error": "Proxy server not specified"}
-
-    if scheme and scheme.lower().startswith("socks"):
-        # urllib не умеет socks, пропускаем проверку — Playwright подключит сам
-        return {"ok": True, "ip": None, "error": None}
-
-    if "://" not in server:
-        server = f"{scheme or 'http'}://{server}"
-
-    proxies = {"http": server, "https": server}
-    handler = urllib.request.ProxyHandler(proxies)
-    opener = urllib.request.build_opener(handler)
-    if username:
-        creds = f"{username}:{password or ''}".encode("utf-8")
-        opener.addheaders = [("Proxy-Authorization", f"Basic {base64.b64encode(creds).decode('ascii')}")]
-
-    try:
-        with opener.open("https://api.ipify.org", timeout=10) as response:
-            ip = response.read().decode("utf-8").strip()
-            return {"ok": True, "ip": ip, "error": None}
-    except Exception as exc:
-        return {"ok": False, "ip": None, "error": str(exc)}
+    if proxy_obj is None:
+        server = (proxy_kwargs or {}).get("server")
+        if not server:
+            return {"ok": False, "ip": None, "error": "Proxy server not specified"}
+        scheme = server.split("://")[0] if "://" in server else "http"
+        proxy_obj = Proxy(
+            id="adhoc",
+            label="adhoc",
+            type=scheme,
+            server=server,
+            username=proxy_kwargs.get("username"),
+            password=proxy_kwargs.get("password"),
+        )
+    # Кешированная проверка: повторный запуск не ждёт ipify
+    return proxy_preflight(proxy_obj)
 
 
 def _wire_logging(page: Any) -> None:
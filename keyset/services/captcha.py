@@ -1,27 +1,121 @@
 """
 Сервис работы с капчами
 Поддержка: RuCaptcha, CapMonster, 2Captcha
+
+Клиент держит один aiohttp-сеанс с пулом соединений на весь срок жизни.
+Капчи отправляются параллельно, а ответы собирает единственный цикл
+опроса: у RuCaptcha/2Captcha — пачкой через res.php?action=get&ids=...,
+у CapMonster (multi-ID запроса нет) — параллельными getTaskResult за один
+проход. Первый опрос идёт через FIRST_POLL_DELAY, следующий — ближе к
+типичному времени решения (скользящее среднее по уже решённым капчам),
+дальше интервал растёт до POLL_MAX_INTERVAL. В состояние аккаунта
+передаётся только настоящий исход решения, сетевые сбои — нет.
+
+Сеанс, ожидающие задачи и цикл опроса привязаны к циклу событий: общий
+клиент из get_captcha_service можно звать из нескольких потоков со своими
+циклами, и они не мешают друг другу.
 """
 
 from __future__ import annotations
 import asyncio
+import threading
+import weakref
 import aiohttp
-from typing import Optional, Dict, Any
-from pathlib import Path
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional, Any, Tuple
+
+# Соединений в пуле одного клиента
+POOL_LIMIT = 20
+# Сколько ждать решения одной капчи, сек
+SOLVE_TIMEOUT = 120.0
+# Начальная оценка времени решения, пока нет своих замеров
+DEFAULT_SOLVE_TIME = 12.0
+SOLVE_TIME_ALPHA = 0.3
+# Первый опрос: быстрые решения не ждут среднего времени
+FIRST_POLL_DELAY = 2.5
+MIN_POLL_INTERVAL = 1.0
+POLL_MAX_INTERVAL = 10.0
+POLL_BACKOFF = 1.5
+# Предел id в одном res.php?action=get&ids=...
+BATCH_SIZE = 100
+# Запас сверх timeout на последний опрос; дольше ждут только при сломанном опросе
+WAIT_GRACE = 30.0
+
+# Капча не решена по существу; ошибки ключа, счёта и сети аккаунт не касаются
+UNSOLVED_ERRORS = frozenset({
+    "ERROR_CAPTCHA_UNSOLVABLE",
+    "ERROR_BAD_DUPLICATES",
+    "timeout",
+})
+
+Reporter = Callable[[int, Optional[str], Optional[str]], None]
+
+
+class CaptchaError(Exception):
+    """Отказ сервиса; code — код ошибки (ERROR_CAPTCHA_UNSOLVABLE, timeout, ...)."""
+
+    def __init__(self, code: str):
+        super().__init__(code)
+        self.code = code
+
+
+def report_to_accounts(account_id: int, solution: Optional[str], error: Optional[str]) -> None:
+    """Записать исход решения в аккаунт: решено — ok, не решено — капча с кулдауном."""
+    try:
+        from . import accounts
+    except ImportError:
+        from services import accounts
+
+    if solution:
+        accounts.mark_ok(account_id)
+    elif error in UNSOLVED_ERRORS:
+        accounts.mark_captcha(account_id)
+
+
+@dataclass
+class _Pending:
+    id: str
+    future: asyncio.Future
+    submitted: float
+    next_poll: float
+    interval: float
+
+
+@dataclass
+class _LoopState:
+    """Всё, что живёт в одном цикле событий: сеанс, ожидающие задачи, опрос."""
+
+    session: aiohttp.ClientSession
+    wakeup: asyncio.Event
+    pending: Dict[str, _Pending] = field(default_factory=dict)
+    poller: Optional[asyncio.Task] = None
 
 
 class CaptchaService:
     """Универсальный клиент для решения капч"""
-    
-    def __init__(self, api_key: str, service: str = "rucaptcha"):
+
+    def __init__(
+        self,
+        api_key: str,
+        service: str = "rucaptcha",
+        *,
+        base_url: Optional[str] = None,
+        reporter: Optional[Reporter] = report_to_accounts,
+        timeout: float = SOLVE_TIMEOUT,
+    ):
         """
         Args:
             api_key: API ключ сервиса
             service: rucaptcha | capmonster | 2captcha
+            base_url: свой адрес API (локальная заглушка в тестах)
+            reporter: куда сообщать исход решения для account_id
+            timeout: сколько ждать решения одной капчи, сек
         """
         self.api_key = api_key
         self.service = service.lower()
-        
+        self.reporter = reporter
+        self.timeout = timeout
+
         # URL endpoints
         self.endpoints = {
             "rucaptcha": {
@@ -30,179 +124,347 @@ class CaptchaService:
             },
             "capmonster": {
                 "in": "https://api.capmonster.cloud/createTask",
-                "res": "https://api.capmonster.cloud/getTaskResult"
+                "res": "https://api.capmonster.cloud/getTaskResult",
+                "balance": "https://api.capmonster.cloud/getBalance"
             },
             "2captcha": {
                 "in": "https://2captcha.com/in.php",
                 "res": "https://2captcha.com/res.php"
             }
         }
-        
+
         if self.service not in self.endpoints:
             raise ValueError(f"Неподдерживаемый сервис: {service}")
-    
+
+        if base_url:
+            base = base_url.rstrip("/")
+            self.endpoints[self.service] = {
+                name: f"{base}/{url.rsplit('/', 1)[1]}"
+                for name, url in self.endpoints[self.service].items()
+            }
+
+        # Скользящее среднее времени от отправки до готовности, сек
+        self.solve_time = DEFAULT_SOLVE_TIME
+        self._states: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, _LoopState]" = weakref.WeakKeyDictionary()
+        self._states_lock = threading.Lock()
+
+    @property
+    def _urls(self) -> Dict[str, str]:
+        return self.endpoints[self.service]
+
+    def _state(self) -> _LoopState:
+        loop = asyncio.get_running_loop()
+        with self._states_lock:
+            state = self._states.get(loop)
+            if state is None:
+                state = self._states[loop] = _LoopState(session=self._new_session(), wakeup=asyncio.Event())
+            elif state.session.closed:
+                state.session = self._new_session()
+            return state
+
+    @staticmethod
+    def _new_session() -> aiohttp.ClientSession:
+        return aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=POOL_LIMIT),
+            timeout=aiohttp.ClientTimeout(total=30),
+        )
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        return self._state().session
+
+    async def close(self) -> None:
+        """Остановить опрос, отменить ожидающие решения и закрыть сеанс текущего цикла."""
+        with self._states_lock:
+            state = self._states.pop(asyncio.get_running_loop(), None)
+        if state is None:
+            return
+        if state.poller is not None and not state.poller.done():
+            state.poller.cancel()
+            try:
+                await state.poller
+            except asyncio.CancelledError:
+                pass
+        self._fail(state, list(state.pending.values()), "ERROR_CLOSED")
+        if not state.session.closed:
+            await state.session.close()
+
+    async def __aenter__(self) -> "CaptchaService":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
     async def get_balance(self) -> float:
         """Получить баланс на счету"""
         try:
+            session = self._get_session()
             if self.service == "capmonster":
-                async with aiohttp.ClientSession() as session:
-                    async with session.post(
-                        "https://api.capmonster.cloud/getBalance",
-                        json={"clientKey": self.api_key},
-                        timeout=aiohttp.ClientTimeout(total=10)
-                    ) as resp:
-                        data = await resp.json()
-                        return float(data.get("balance", 0))
+                async with session.post(
+                    self._urls["balance"],
+                    json={"clientKey": self.api_key},
+                    timeout=aiohttp.ClientTimeout(total=10)
+                ) as resp:
+                    data = await resp.json(content_type=None)
+                    return float(data.get("balance", 0))
             else:
                 # RuCaptcha / 2Captcha
-                async with aiohttp.ClientSession() as session:
-                    async with session.get(
-                        self.endpoints[self.service]["res"],
-                        params={"key": self.api_key, "action": "getbalance"},
-                        timeout=aiohttp.ClientTimeout(total=10)
-                    ) as resp:
-                        text = await resp.text()
-                        return float(text.strip())
+                async with session.get(
+                    self._urls["res"],
+                    params={"key": self.api_key, "action": "getbalance"},
+                    timeout=aiohttp.ClientTimeout(total=10)
+                ) as resp:
+                    text = await resp.text()
+                    return float(text.strip())
         except Exception as e:
             print(f"[Captcha] Ошибка получения баланса: {e}")
             return 0.0
-    
-    async def solve_image(self, image_base64: str, **kwargs) -> Optional[str]:
+
+    async def solve_image(self, image_base64: str, *, account_id: Optional[int] = None, **kwargs) -> Optional[str]:
         """
         Решить капчу с картинки
-        
+
         Args:
             image_base64: Изображение в base64
+            account_id: аккаунт, в который записать исход решения
             **kwargs: Дополнительные параметры (numeric, min_len, max_len, etc)
-        
+
         Returns:
             Текст капчи или None при ошибке
         """
+        solution: Optional[str] = None
+        error: Optional[str] = None
         try:
-            if self.service == "capmonster":
-                return await self._solve_capmonster(image_base64, **kwargs)
-            else:
-                return await self._solve_rucaptcha(image_base64, **kwargs)
-        except Exception as e:
+            task_id = await self._submit(image_base64, **kwargs)
+            solution = await self._wait(task_id)
+        except CaptchaError as e:
+            print(f"[Captcha] Ошибка решения: {e.code}")
+            error = e.code
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError, KeyError) as e:
+            # Сбой связи с сервисом ничего не говорит об аккаунте
             print(f"[Captcha] Ошибка решения: {e}")
             return None
-    
-    async def _solve_rucaptcha(self, image_base64: str, **kwargs) -> Optional[str]:
-        """RuCaptcha / 2Captcha решение"""
-        async with aiohttp.ClientSession() as session:
-            # Отправляем капчу
-            data = {
-                "key": self.api_key,
-                "method": "base64",
-                "body": image_base64,
-                "json": 1
-            }
-            data.update(kwargs)
-            
-            async with session.post(
-                self.endpoints[self.service]["in"],
-                data=data,
-                timeout=aiohttp.ClientTimeout(total=30)
-            ) as resp:
-                result = await resp.json()
-                if result.get("status") != 1:
-                    print(f"[Captcha] Ошибка отправки: {result.get('request')}")
-                    return None
-                
-                captcha_id = result["request"]
-            
-            # Ждем решения (до 60 секунд)
-            for attempt in range(24):
-                await asyncio.sleep(2.5)
-                
-                async with session.get(
-                    self.endpoints[self.service]["res"],
-                    params={
-                        "key": self.api_key,
-                        "action": "get",
-                        "id": captcha_id,
-                        "json": 1
-                    },
-                    timeout=aiohttp.ClientTimeout(total=10)
-                ) as resp:
-                    result = await resp.json()
-                    
-                    if result.get("status") == 1:
-                        return result["request"]
-                    
-                    if result.get("request") not in ["CAPCHA_NOT_READY", "ERROR_CAPTCHA_UNSOLVABLE"]:
-                        print(f"[Captcha] Ошибка решения: {result.get('request')}")
-                        return None
-            
-            print("[Captcha] Превышен таймаут ожидания")
-            return None
-    
-    async def _solve_capmonster(self, image_base64: str, **kwargs) -> Optional[str]:
-        """CapMonster решение"""
-        async with aiohttp.ClientSession() as session:
-            # Создаем задачу
-            task_data = {
-                "clientKey": self.api_key,
-                "task": {
-                    "type": "ImageToTextTask",
-                    "body": image_base64
-                }
-            }
-            
+        await self._report(account_id, solution, error)
+        return solution
+
+    async def solve_many(self, images: Iterable[str], **kwargs) -> List[Optional[str]]:
+        """Решить несколько капч параллельно; порядок ответов — как у картинок."""
+        return list(await asyncio.gather(*(self.solve_image(image, **kwargs) for image in images)))
+
+    # ------------------------------------------------------------ отправка
+
+    async def _submit(self, image_base64: str, **kwargs) -> str:
+        session = self._get_session()
+        if self.service == "capmonster":
+            task: Dict[str, Any] = {"type": "ImageToTextTask", "body": image_base64}
             # Добавляем параметры если есть
-            if kwargs.get("numeric"):
-                task_data["task"]["numeric"] = kwargs["numeric"]
-            if kwargs.get("minLength"):
-                task_data["task"]["minLength"] = kwargs["minLength"]
-            if kwargs.get("maxLength"):
-                task_data["task"]["maxLength"] = kwargs["maxLength"]
-            
-            async with session.post(
-                self.endpoints[self.service]["in"],
-                json=task_data,
-                timeout=aiohttp.ClientTimeout(total=30)
-            ) as resp:
-                result = await resp.json()
-                if result.get("errorId"):
-                    print(f"[Captcha] Ошибка создания задачи: {result.get('errorDescription')}")
-                    return None
-                
-                task_id = result["taskId"]
-            
-            # Ждем решения
-            for attempt in range(24):
-                await asyncio.sleep(2.5)
-                
+            for name in ("numeric", "minLength", "maxLength"):
+                if kwargs.get(name):
+                    task[name] = kwargs[name]
+            async with session.post(self._urls["in"], json={"clientKey": self.api_key, "task": task}) as resp:
+                result = await resp.json(content_type=None)
+            if result.get("errorId"):
+                raise CaptchaError(result.get("errorCode") or str(result.get("errorDescription")))
+            return str(result["taskId"])
+
+        data = {
+            "key": self.api_key,
+            "method": "base64",
+            "body": image_base64,
+            "json": 1
+        }
+        data.update(kwargs)
+        async with session.post(self._urls["in"], data=data) as resp:
+            result = await resp.json(content_type=None)
+        if result.get("status") != 1:
+            raise CaptchaError(str(result.get("request")))
+        return str(result["request"])
+
+    # --------------------------------------------------------------- опрос
+
+    async def _wait(self, task_id: str) -> str:
+        state = self._state()
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        interval = max(MIN_POLL_INTERVAL, self.solve_time / 4)
+        pending = _Pending(
+            id=task_id,
+            future=loop.create_future(),
+            submitted=now,
+            next_poll=now + max(MIN_POLL_INTERVAL, min(FIRST_POLL_DELAY, self.solve_time * 0.8)),
+            interval=interval,
+        )
+        state.pending[task_id] = pending
+        if state.poller is None or state.poller.done():
+            state.poller = loop.create_task(self._poll_loop(state))
+            state.poller.add_done_callback(lambda task: self._poller_done(state, task))
+        state.wakeup.set()
+        try:
+            # Опрос сам снимает задачу по timeout; сверх запаса ждать нечего
+            return await asyncio.wait_for(pending.future, self.timeout + WAIT_GRACE)
+        except asyncio.TimeoutError:
+            raise CaptchaError("ERROR_POLL_STALLED") from None
+        finally:
+            state.pending.pop(task_id, None)
+
+    def _poller_done(self, state: _LoopState, task: asyncio.Task) -> None:
+        if task.cancelled() or task.exception() is None:
+            return
+        # Опрос упал — ожидающие решения иначе не дождались бы ответа
+        print(f"[Captcha] Цикл опроса остановился: {task.exception()!r}")
+        self._fail(state, list(state.pending.values()), "ERROR_POLLER")
+
+    async def _poll_loop(self, state: _LoopState) -> None:
+        loop = asyncio.get_running_loop()
+        while state.pending:
+            now = loop.time()
+            due = min(p.next_poll for p in state.pending.values())
+            if due > now:
+                state.wakeup.clear()
+                try:
+                    await asyncio.wait_for(state.wakeup.wait(), due - now)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            # Прихватываем и то, что созреет вот-вот: лишний id в пачке бесплатен
+            batch = [
+                p for p in state.pending.values()
+                if p.next_poll <= now + MIN_POLL_INTERVAL and not p.future.done()
+            ]
+            try:
+                results = await self._fetch_results([p.id for p in batch])
+            except CaptchaError as e:
+                self._fail(state, batch, e.code)
+                continue
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                print(f"[Captcha] Ошибка опроса: {e}")
+                results = {}
+
+            now = loop.time()
+            for p in batch:
+                if p.future.done():
+                    state.pending.pop(p.id, None)
+                    continue
+                status, value = results.get(p.id, ("wait", None))
+                if status == "ready":
+                    self._observe(now - p.submitted)
+                    p.future.set_result(value)
+                elif status == "error":
+                    p.future.set_exception(CaptchaError(value))
+                elif now - p.submitted >= self.timeout:
+                    p.future.set_exception(CaptchaError("timeout"))
+                if p.future.done():
+                    state.pending.pop(p.id, None)
+                else:
+                    p.interval = min(POLL_MAX_INTERVAL, p.interval * POLL_BACKOFF)
+                    # Раньше типичного времени решения ответа почти никогда нет
+                    p.next_poll = max(now + p.interval, p.submitted + self.solve_time * 0.8)
+                    if p.submitted + self.timeout < p.next_poll:
+                        p.next_poll = max(now, p.submitted + self.timeout)
+
+    async def _fetch_results(self, ids: List[str]) -> Dict[str, Tuple[str, Optional[str]]]:
+        """Состояние задач: ("ready", текст) | ("wait", None) | ("error", код)."""
+        session = self._get_session()
+        results: Dict[str, Tuple[str, Optional[str]]] = {}
+
+        if self.service == "capmonster":
+            async def fetch(task_id: str) -> None:
                 async with session.post(
-                    self.endpoints[self.service]["res"],
-                    json={
-                        "clientKey": self.api_key,
-                        "taskId": task_id
-                    },
+                    self._urls["res"],
+                    json={"clientKey": self.api_key, "taskId": int(task_id) if task_id.isdigit() else task_id},
                     timeout=aiohttp.ClientTimeout(total=10)
                 ) as resp:
-                    result = await resp.json()
-                    
-                    if result.get("status") == "ready":
-                        return result["solution"]["text"]
-                    
-                    if result.get("errorId"):
-                        print(f"[Captcha] Ошибка получения результата: {result.get('errorDescription')}")
-                        return None
-            
-            print("[Captcha] Превышен таймаут ожидания")
-            return None
+                    data = await resp.json(content_type=None)
+                if data.get("errorId"):
+                    results[task_id] = ("error", data.get("errorCode") or str(data.get("errorDescription")))
+                elif data.get("status") == "ready":
+                    results[task_id] = ("ready", (data.get("solution") or {}).get("text"))
+
+            await asyncio.gather(*(fetch(task_id) for task_id in ids))
+            return results
+
+        for start in range(0, len(ids), BATCH_SIZE):
+            chunk = ids[start:start + BATCH_SIZE]
+            async with session.get(
+                self._urls["res"],
+                params={"key": self.api_key, "action": "get", "ids": ",".join(chunk)},
+                timeout=aiohttp.ClientTimeout(total=10)
+            ) as resp:
+                text = (await resp.text()).strip()
+            answers = text.split("|")
+            if len(answers) != len(chunk):
+                if text.startswith("ERROR_") or text == "IP_BANNED":
+                    raise CaptchaError(text)
+                raise ValueError(f"Неожиданный ответ res.php: {text[:100]}")
+            for task_id, answer in zip(chunk, answers):
+                if answer == "CAPCHA_NOT_READY":
+                    continue
+                if answer.startswith("ERROR_"):
+                    results[task_id] = ("error", answer)
+                else:
+                    results[task_id] = ("ready", answer)
+        return results
+
+    def _observe(self, elapsed: float) -> None:
+        self.solve_time += SOLVE_TIME_ALPHA * (elapsed - self.solve_time)
+
+    def _fail(self, state: _LoopState, pending: Iterable[_Pending], code: str) -> None:
+        for p in pending:
+            state.pending.pop(p.id, None)
+            if not p.future.done():
+                p.future.set_exception(CaptchaError(code))
+
+    async def _report(self, account_id: Optional[int], solution: Optional[str], error: Optional[str]) -> None:
+        if account_id is None or self.reporter is None:
+            return
+        loop = asyncio.get_running_loop()
+        try:
+            # Запись в БД синхронная — не держим ею цикл событий
+            await loop.run_in_executor(None, self.reporter, account_id, solution, error)
+        except Exception as e:
+            print(f"[Captcha] Не удалось обновить аккаунт {account_id}: {e}")
+
+
+class RuCaptchaClient(CaptchaService):
+    """Клиент RuCaptcha."""
+
+    def __init__(self, api_key: str, **kwargs):
+        super().__init__(api_key, "rucaptcha", **kwargs)
+
+
+_services: Dict[Tuple[str, str], CaptchaService] = {}
+_services_lock = threading.Lock()
+
+
+def get_captcha_service(api_key: str, service: str = "rucaptcha") -> CaptchaService:
+    """Общий клиент на пару ключ/сервис: в каждом цикле событий — один пул и один опрос."""
+    key = (api_key, service.lower())
+    with _services_lock:
+        client = _services.get(key)
+        if client is None:
+            client = _services[key] = CaptchaService(api_key, service)
+        return client
 
 
 # Удобные функции для быстрого использования
 
 async def check_balance(api_key: str, service: str = "rucaptcha") -> float:
     """Проверить баланс"""
-    captcha = CaptchaService(api_key, service)
-    return await captcha.get_balance()
+    return await get_captcha_service(api_key, service).get_balance()
 
 
 async def solve_captcha(api_key: str, image_base64: str, service: str = "rucaptcha", **kwargs) -> Optional[str]:
     """Решить капчу"""
-    captcha = CaptchaService(api_key, service)
-    return await captcha.solve_image(image_base64, **kwargs)
+    return await get_captcha_service(api_key, service).solve_image(image_base64, **kwargs)
+
+
+__all__ = [
+    "CaptchaError",
+    "CaptchaService",
+    "RuCaptchaClient",
+    "UNSOLVED_ERRORS",
+    "check_balance",
+    "get_captcha_service",
+    "report_to_accounts",
+    "solve_captcha",
+]
@@ -1,35 +1,45 @@
 # -*- coding: utf-8 -*-
 """Упрощённый KeywordMultiplier для MVP."""
 from __future__ import annotations
-from typing import List, Dict
+from itertools import islice
+from typing import Dict, Iterator, List, Tuple
+
+try:
+    from .phrase_tools import PhraseDeduplicator
+except ImportError:
+    from services.phrase_tools import PhraseDeduplicator
+
 
 class KeywordMultiplier:
     def multiply(self, tree_data: Dict, max_kw: int = 10000) -> List[Dict]:
-        # Простая генерация: собираем комбинации core + attributes
+        return list(islice(self.iter_multiply(tree_data), max(0, max_kw)))
+
+    def estimate(self, tree_data: Dict) -> int:
+        """Сколько комбинаций будет перебрано (до дедупликации)."""
+        cores, attrs = self._split(tree_data)
+        return max(len(cores), 1) * max(len(attrs), 1)
+
+    def iter_multiply(self, tree_data: Dict) -> Iterator[Dict]:
+        # Простая генерация: комбинации core + attributes, лениво и без повторов
+        cores, attrs = self._split(tree_data)
+        seen = PhraseDeduplicator(self.estimate(tree_data))
+        for c in cores or ['']:
+            if attrs:
+                for a in attrs:
+                    kw = f"{c} {a}".strip()
+                    if kw and seen.add(kw):
+                        yield {'keyword': kw, 'intent': 'INFORMATIONAL', 'score': 0.6, 'original': kw}
+            elif c and seen.add(c):
+                yield {'keyword': c, 'intent': 'INFORMATIONAL', 'score': 0.5, 'original': c}
+
+    @staticmethod
+    def _split(tree_data: Dict) -> Tuple[List[str], List[str]]:
         cores = []
         attrs = []
         for b in tree_data.get('branches', []):
             t = (b.get('type') or 'CORE').upper()
             if t == 'CORE':
-                cores.append(b.get('title','').strip())
-            else:
-                attrs.append(b.get('title','').strip())
-        combos = []
-        for c in cores or ['']:
-            if attrs:
-                for a in attrs:
-                    kw = f"{c} {a}".strip()
-                    if kw:
-                        combos.append({'keyword': kw, 'intent': 'INFORMATIONAL', 'score': 0.6, 'original': kw})
+                cores.append(b.get('title', '').strip())
             else:
-                if c:
-                    combos.append({'keyword': c, 'intent': 'INFORMATIONAL', 'score': 0.5, 'original': c})
-        # дедупликация
-        uniq = []
-        seen = set()
-        for r in combos:
-            k = r['keyword']
-            if k not in seen:
-                uniq.append(r)
-                seen.add(k)
-        return uniq[:max_kw]
+                attrs.append(b.get('title', '').strip())
+        return cores, attrs
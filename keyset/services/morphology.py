@@ -4,6 +4,9 @@
 Использует pymorphy3 для лемматизации
 """
 
+from collections import deque
+from functools import lru_cache
+
 try:
     import pymorphy3
     MORPH_AVAILABLE = True
@@ -12,17 +15,23 @@ except ImportError:
     MORPH_AVAILABLE = False
     morph = None
 
+# Сколько различных словоформ держим в кэше лемм
+LEMMA_CACHE_SIZE = 100_000
 
-def lemmatize_word(word: str) -> str:
-    """Получить лемму слова (начальная форма)"""
-    if not MORPH_AVAILABLE or not word:
-        return word.lower()
 
+@lru_cache(maxsize=LEMMA_CACHE_SIZE)
+def _normal_form(word: str) -> str:
     try:
-        parsed = morph.parse(word.lower())[0]
-        return parsed.normal_form
+        return morph.parse(word)[0].normal_form
     except Exception:
+        return word
+
+
+def lemmatize_word(word: str) -> str:
+    """Получить лемму слова (начальная форма)"""
+    if not MORPH_AVAILABLE or not word:
         return word.lower()
+    return _normal_form(word.lower())
 
 
 def lemmatize_phrase(phrase: str) -> str:
@@ -74,21 +83,93 @@ def match_stopword(phrase: str, stopword: str, mode: str = 'partial') -> bool:
     return False
 
 
+class _AhoCorasick:
+    """Автомат Ахо–Корасик: есть ли в тексте хоть одно из слов."""
+
+    def __init__(self, words):
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [False]
+        for word in words:
+            state = 0
+            for char in word:
+                nxt = self._goto[state].get(char)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[state][char] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append(False)
+                state = nxt
+            self._out[state] = True
+
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(char, 0)
+                self._fail[nxt] = target if target != nxt else 0
+                self._out[nxt] = self._out[nxt] or self._out[self._fail[nxt]]
+
+    def search(self, text: str) -> bool:
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if out[state]:
+                return True
+        return False
+
+
+class StopwordMatcher:
+    """
+    Скомпилированный набор стоп-слов для одного режима match_stopword.
+
+    Стоп-слова разбираются один раз: exact/independent/morphological сводятся
+    к поиску в множестве, partial — к одному проходу автомата по фразе.
+    """
+
+    def __init__(self, stopwords: list[str], mode: str = 'partial'):
+        self.mode = mode
+        words = [w.lower() for w in stopwords if w and w.strip()]
+        self._automaton = None
+        self._words: set[str] = set()
+
+        if mode == 'partial':
+            self._automaton = _AhoCorasick(set(words)) if words else None
+        elif mode == 'morphological' and MORPH_AVAILABLE:
+            self._words = {lemmatize_word(w) for w in words}
+        elif mode in ('exact', 'independent', 'morphological'):
+            self._words = set(words)
+
+    def matches(self, phrase: str) -> bool:
+        mode = self.mode
+        if mode == 'partial':
+            return self._automaton is not None and self._automaton.search(phrase.lower())
+        if not self._words:
+            return False
+        if mode == 'exact':
+            return phrase.lower() in self._words
+        if mode == 'morphological' and MORPH_AVAILABLE:
+            return any(lemmatize_word(w) in self._words for w in phrase.split())
+        if mode in ('independent', 'morphological'):
+            return any(w in self._words for w in phrase.lower().split())
+        return False
+
+    def filter(self, phrases: list[str]) -> list[str]:
+        return [phrase for phrase in phrases if not self.matches(phrase)]
+
+
 def filter_by_stopwords(phrases: list[str], stopwords: list[str], mode: str = 'partial') -> list[str]:
     """
     Отфильтровать фразы по стоп-словам
 
     Возвращает список фраз БЕЗ стоп-слов
     """
-    filtered = []
-    for phrase in phrases:
-        has_stopword = False
-        for stopword in stopwords:
-            if match_stopword(phrase, stopword, mode):
-                has_stopword = True
-                break
-
-        if not has_stopword:
-            filtered.append(phrase)
-
-    return filtered
+    return StopwordMatcher(stopwords, mode).filter(phrases)
@@ -12,18 +12,28 @@ independently of the GUI or worker processes.
 """
 from __future__ import annotations
 
-from dataclasses import dataclass, field
-from itertools import product
+from bisect import insort
+from collections import Counter
+from dataclasses import dataclass, field, replace
+from itertools import islice, product
 from typing import Callable, Iterable, Iterator, Sequence
+import hashlib
+import math
 import re
 
 __all__ = [
     "NormalizationOptions",
     "FilterOptions",
     "generate_combinations",
+    "iter_combinations",
+    "estimate_combinations",
+    "PhraseDeduplicator",
+    "BLOOM_MAX_BYTES",
+    "chunked",
     "normalize_phrases",
     "filter_phrases",
     "tokenize",
+    "lemma_tokenize",
     "cluster_phrases",
     "Cluster",
     "walk_clusters",
@@ -50,15 +60,16 @@ class NormalizationOptions:
                 phrase = phrase.replace(ch, " ")
         phrase = phrase.strip()
         if self.collapse_whitespace:
-            phrase = re.sub(r"\s+", " ", phrase)
+            phrase = _SPACE_RE.sub(" ", phrase)
         if self.lowercase:
             phrase = phrase.lower()
         if self.strip_punctuation:
-            phrase = re.sub(r'[^\w\s]+', ' ', phrase)
+            phrase = _PUNCT_RE.sub(' ', phrase)
         return phrase
 
 
 _PUNCT_RE = re.compile(r'[^\w\s]+', flags=re.UNICODE)
+_SPACE_RE = re.compile(r"\s+")
 _TOKEN_RE = re.compile(r"[\w-]+", flags=re.UNICODE)
 
 
@@ -111,6 +122,179 @@ class CompiledFilter:
 # ---------------------------------------------------------------------------
 
 
+def estimate_combinations(dictionaries: Sequence[Sequence[str]]) -> int:
+    """Number of phrases :func:`iter_combinations` will try, before dedup.
+
+    Cheap to compute, so callers can warn about or cap a job before anything
+    is generated.
+    """
+
+    total = 0
+    for col in dictionaries:
+        if col:
+            total = (total or 1) * len(col)
+    return total
+
+
+# Memory budget of the Bloom filter behind PhraseDeduplicator
+BLOOM_MAX_BYTES = 64 * 1024 * 1024
+
+
+class PhraseDeduplicator:
+    """Streaming "seen before?" check with bounded memory.
+
+    Up to *exact_limit* phrases are kept in a set. Past that the deduplicator
+    switches to a Bloom filter sized for *capacity* items, which costs about
+    ``-1.44 * log2(error_rate)`` bits per phrase; a false positive drops a
+    phrase that was not actually seen, with probability ~*error_rate*.
+
+    The filter never takes more than *max_bytes*: a larger *capacity* (say, a
+    raw :func:`estimate_combinations` of a big job) is cut down to what fits.
+    With the defaults (64 MiB, 1e-4) that is ~28M distinct phrases at the
+    nominal error rate; past it the rate grows — ~2% at 56M, ~40% at 112M —
+    so jobs that large should be deduplicated downstream instead.
+    """
+
+    def __init__(
+        self,
+        capacity: int = 0,
+        *,
+        exact_limit: int = 1_000_000,
+        error_rate: float = 1e-4,
+        max_bytes: int = BLOOM_MAX_BYTES,
+    ) -> None:
+        self.exact_limit = max(0, exact_limit)
+        self.error_rate = min(max(error_rate, 1e-9), 0.5)
+        self.max_bits = max(64, max_bytes * 8)
+        fits = int(self.max_bits * math.log(2) ** 2 / -math.log(self.error_rate))
+        self.capacity = max(min(capacity, fits), min(self.exact_limit, fits), 1)
+        self._seen: set[str] | None = set()
+        self._bits = bytearray()
+        self._size = 0
+        self._hashes = 0
+
+    @property
+    def exact(self) -> bool:
+        return self._seen is not None
+
+    def add(self, phrase: str) -> bool:
+        """Remember *phrase*; return False if it was (probably) seen before."""
+
+        if self._seen is not None:
+            if phrase in self._seen:
+                return False
+            if len(self._seen) < self.exact_limit:
+                self._seen.add(phrase)
+                return True
+            self._switch_to_bloom()
+        return self._bloom_add(phrase)
+
+    def _switch_to_bloom(self) -> None:
+        size = min(self.max_bits, max(8, int(-self.capacity * math.log(self.error_rate) / (math.log(2) ** 2))))
+        self._size = size
+        self._hashes = max(1, round(size / self.capacity * math.log(2)))
+        self._bits = bytearray((size + 7) // 8)
+        seen, self._seen = self._seen or (), None
+        for phrase in seen:
+            self._bloom_add(phrase)
+
+    def _bloom_add(self, phrase: str) -> bool:
+        digest = hashlib.blake2b(phrase.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        bits = self._bits
+        fresh = False
+        for i in range(self._hashes):
+            pos = (h1 + i * h2) % self._size
+            mask = 1 << (pos & 7)
+            if not bits[pos >> 3] & mask:
+                bits[pos >> 3] |= mask
+                fresh = True
+        return fresh
+
+
+def iter_combinations(
+    dictionaries: Sequence[Sequence[str]],
+    *,
+    glue: str = " ",
+    prefix: str = "",
+    suffix: str = "",
+    template: str | None = None,
+    normalization: NormalizationOptions | None = None,
+    deduplicator: PhraseDeduplicator | None = None,
+) -> Iterator[str]:
+    """Lazily yield the cartesian product of word lists as phrases.
+
+    Arguments match :func:`generate_combinations`. Nothing is materialised
+    besides the columns themselves, so the output can be streamed straight
+    into a bulk enqueue (``services.frequency.enqueue_masks_bulk`` reads its
+    input lazily) or cut into batches with :func:`chunked`. When
+    ``normalization.deduplicate`` is set, repeats are dropped on the fly via
+    *deduplicator* (one sized from :func:`estimate_combinations` by default).
+    """
+
+    if not dictionaries:
+        return
+    sequences = [list(col) for col in dictionaries if col]
+    if not sequences:
+        return
+
+    normalizer = normalization.apply if normalization else None
+    if normalization and normalization.deduplicate and deduplicator is None:
+        deduplicator = PhraseDeduplicator(estimate_combinations(sequences))
+    elif not (normalization and normalization.deduplicate):
+        deduplicator = None
+
+    for phrase in _iter_raw_combinations(sequences, glue, template):
+        if prefix or suffix:
+            phrase = f"{prefix}{phrase}{suffix}"
+        if normalizer is not None:
+            phrase = normalizer(phrase)
+        if not phrase:
+            continue
+        if deduplicator is not None and not deduplicator.add(phrase):
+            continue
+        yield phrase
+
+
+def _iter_raw_combinations(sequences: list[list[str]], glue: str, template: str | None) -> Iterator[str]:
+    if template:
+        # Parse the template once: literals alternate with column indices
+        pieces = re.split(r"\{(\d+)\}", template)
+        literals = pieces[0::2]
+        slots: list[int | str] = []
+        for pos, ref in enumerate(pieces[1::2]):
+            idx = int(ref)
+            slots.append(idx if idx < len(sequences) else f"{{{ref}}}")
+            slots.append(literals[pos + 1])
+        head = literals[0]
+        for parts in product(*sequences):
+            yield head + "".join(parts[slot] if isinstance(slot, int) else slot for slot in slots)
+        return
+
+    # The joined head is built once per combination of all but the last column
+    *heads, last = sequences
+    if not heads:
+        yield from last
+        return
+    for parts in product(*heads):
+        stem = glue.join(parts) + glue
+        for word in last:
+            yield stem + word
+
+
+def chunked(items: Iterable[str], size: int) -> Iterator[list[str]]:
+    """Split a (lazy) stream into lists of at most *size* items."""
+
+    iterator = iter(items)
+    size = max(1, size)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
 def generate_combinations(
     dictionaries: Sequence[Sequence[str]],
     *,
@@ -122,6 +306,10 @@ def generate_combinations(
 ) -> list[str]:
     """Return the cartesian product of word lists as phrases.
 
+    Materialised form of :func:`iter_combinations`; prefer the iterator for
+    large jobs. Unlike the iterator, deduplication here is always exact: the
+    whole result is in memory anyway.
+
     Parameters
     ----------
     dictionaries:
@@ -136,28 +324,16 @@ def generate_combinations(
         Optional :class:`NormalizationOptions` applied to the final phrase.
     """
 
-    if not dictionaries:
-        return []
-    sequences = [list(col) for col in dictionaries if col]
-    if not sequences:
-        return []
-
-    normalizer = normalization.apply if normalization else (lambda s: s)
-    phrases: list[str] = []
-    for parts in product(*sequences):
-        if template:
-            phrase = template
-            for idx, part in enumerate(parts):
-                phrase = phrase.replace(f"{{{idx}}}", part)
-        else:
-            phrase = glue.join(parts)
-        phrase = f"{prefix}{phrase}{suffix}" if prefix or suffix else phrase
-        phrase = normalizer(phrase)
-        if phrase:
-            phrases.append(phrase)
-    if normalization and normalization.deduplicate:
-        phrases = list(dict.fromkeys(phrases))
-    return phrases
+    deduplicate = bool(normalization and normalization.deduplicate)
+    phrases = iter_combinations(
+        dictionaries,
+        glue=glue,
+        prefix=prefix,
+        suffix=suffix,
+        template=template,
+        normalization=replace(normalization, deduplicate=False) if deduplicate else normalization,
+    )
+    return list(dict.fromkeys(phrases)) if deduplicate else list(phrases)
 
 
 def normalize_phrases(
@@ -206,6 +382,18 @@ def tokenize(phrase: str, *, keep_digits: bool = True) -> list[str]:
     return tokens
 
 
+def lemma_tokenize(phrase: str, *, keep_digits: bool = True) -> list[str]:
+    """Like :func:`tokenize`, but maps every token to its lemma.
+
+    Uses :mod:`services.morphology` (pymorphy3); without it tokens are only
+    lower-cased, so the result equals :func:`tokenize`.
+    """
+
+    from .morphology import lemmatize_word
+
+    return [lemmatize_word(token) for token in tokenize(phrase, keep_digits=keep_digits)]
+
+
 @dataclass(slots=True)
 class Cluster:
     """Simple phrase cluster based on token overlap."""
@@ -229,9 +417,21 @@ def cluster_phrases(
     *,
     similarity: float = 0.5,
     tokenizer: Callable[[str], Iterable[str]] | None = None,
+    lemmatize: bool = False,
 ) -> list[Cluster]:
     """Group phrases by Jaccard similarity of token sets.
 
+    A phrase joins the first (oldest) cluster that already holds a member with
+    Jaccard index >= *similarity*; otherwise it starts a new cluster.
+
+    Tokens are encoded as integers ordered from rare to common, and every
+    member is indexed only by the prefix of its token set that any match has
+    to share (prefix filtering). Postings are bucketed by set size and by how
+    many tokens follow the indexed one, so buckets that cannot reach the
+    required overlap are never scanned; the rest are checked with the exact
+    Jaccard index. The result is identical to comparing every phrase against
+    every member, without the quadratic cost.
+
     Parameters
     ----------
     phrases:
@@ -240,29 +440,103 @@ def cluster_phrases(
         Minimum Jaccard index (0..1) to join the same cluster.
     tokenizer:
         Optional callable to obtain tokens. Defaults to :func:`tokenize`.
+    lemmatize:
+        Use :func:`lemma_tokenize` when no *tokenizer* is given.
     """
 
     if similarity <= 0:
         similarity = 0.0
     if similarity > 1:
         similarity = 1.0
-    get_tokens = tokenizer or tokenize
+    get_tokens = tokenizer or (lemma_tokenize if lemmatize else tokenize)
+    items = [(phrase, set(get_tokens(phrase))) for phrase in phrases]
 
     clusters: list[Cluster] = []
-    for phrase in phrases:
-        tokens = set(get_tokens(phrase))
+    if similarity == 0.0:
+        # Any similarity passes: every phrase joins the first cluster
+        for phrase, tokens in items:
+            if clusters:
+                clusters[0].add(phrase, tokens)
+            else:
+                clusters.append(Cluster([phrase], [tokens]))
+        return clusters
+
+    # Rare tokens get small ids, so prefixes consist of the most selective tokens
+    frequency: Counter[str] = Counter()
+    for _, tokens in items:
+        frequency.update(tokens)
+    ranked = sorted(frequency.items(), key=lambda kv: (kv[1], kv[0]))
+    token_ids = {token: idx for idx, (token, _) in enumerate(ranked)}
+
+    # (token id, set size, tokens after it) -> (sorted cluster ids, {cluster: member sets})
+    buckets: dict[tuple[int, int, int], tuple[list[int], dict[int, list[frozenset[int]]]]] = {}
+    # Lowest cluster holding an identical token set
+    known: dict[frozenset[int], int] = {}
+    eps = 1e-9  # float slack always widens the search, never narrows it
+    overlap_ratio = similarity / (1 + similarity)
+
+    # Two empty token sets count as identical (Jaccard 1), so they share a cluster
+    empty_target: int | None = None
+
+    for phrase, tokens in items:
         if not tokens:
-            clusters.append(Cluster([phrase], [set()]))
+            if empty_target is None:
+                empty_target = len(clusters)
+                clusters.append(Cluster([phrase], [set()]))
+            else:
+                clusters[empty_target].add(phrase, set())
             continue
-        placed = False
-        for cluster in clusters:
-            best = max(_jaccard(tokens, existing) for existing in cluster.tokens or [set()])
-            if best >= similarity:
-                cluster.add(phrase, tokens)
-                placed = True
-                break
-        if not placed:
+        ids = sorted(token_ids[token] for token in tokens)
+        size = len(ids)
+        encoded = frozenset(ids)
+        prefix = size - math.ceil(similarity * size - eps) + 1
+        sizes = range(max(1, math.ceil(similarity * size - eps)), int(size / similarity + eps) + 1)
+
+        target = known.get(encoded)
+        for pos, token_id in enumerate(ids[:prefix]):
+            rest = size - pos - 1
+            for other in sizes:
+                need = math.ceil(overlap_ratio * (size + other) - eps)
+                if rest + 1 < need:
+                    continue
+                # A match whose first shared token is this one keeps >= need-1 tokens after it
+                for other_rest in range(max(0, need - 1), other):
+                    bucket = buckets.get((token_id, other, other_rest))
+                    if bucket is None:
+                        continue
+                    order, members = bucket
+                    for cluster_idx in order:
+                        if target is not None and cluster_idx >= target:
+                            break
+                        for member in members[cluster_idx]:
+                            common = len(encoded & member)
+                            if common / (size + other - common) >= similarity:
+                                target = cluster_idx
+                                break
+                        if target == cluster_idx:
+                            break
+
+        if target is None:
+            target = len(clusters)
             clusters.append(Cluster([phrase], [tokens]))
+        else:
+            clusters[target].add(phrase, tokens)
+
+        if known.get(encoded) == target:
+            continue  # the same set is already indexed for this cluster
+        known[encoded] = target
+        for pos, token_id in enumerate(ids[:prefix]):
+            key = (token_id, size, size - pos - 1)
+            bucket = buckets.get(key)
+            if bucket is None:
+                bucket = buckets[key] = ([], {})
+            order, members = bucket
+            group = members.get(target)
+            if group is None:
+                insort(order, target)
+                members[target] = [encoded]
+            else:
+                group.append(encoded)
     return clusters
 
 
@@ -5,184 +5,238 @@
 
 import aiohttp
 import asyncio
+import re
 import time
-from typing import Optional, Dict, Any
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, Optional, Tuple
 
+# ip-api отдаёт внешний IP и страну одним HTTP-запросом (без TLS через прокси)
+CHECK_URL = "http://ip-api.com/json/?fields=status,countryCode,city,query"
+DEFAULT_CONCURRENCY = 100
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
 
-async def test_proxy(proxy_url: Optional[str], timeout: int = 10) -> Dict[str, Any]:
+
+def _result(ok: bool, latency_ms: int, *, ip: Optional[str] = None, geo: Optional[str] = None,
+            error: Optional[str] = None) -> Dict[str, Any]:
+    return {"ok": ok, "ip": ip, "geo": geo, "latency_ms": latency_ms, "error": error}
+
+
+def _parse_proxy(proxy_url: str) -> Tuple[str, Optional[aiohttp.BasicAuth], bool]:
+    """Разобрать строку прокси в (url без логина, BasicAuth, is_socks)."""
+    # Формат: ip:port@user:pass (из KeySet)
+    if '@' in proxy_url and not proxy_url.startswith('http') and not proxy_url.startswith('socks'):
+        parts = proxy_url.split('@')
+        if len(parts) == 2:
+            user, password = parts[1].split(':', 1)
+            return f"http://{parts[0]}", aiohttp.BasicAuth(user, password), False
+        return f"http://{proxy_url}", None, False
+    if proxy_url.startswith('socks'):
+        return proxy_url, None, True
+    # Формат: http://user:pass@ip:port
+    if '@' in proxy_url and '://' in proxy_url:
+        match = re.match(r'(https?://)([^:]+):([^@]+)@(.+)', proxy_url)
+        if match:
+            protocol, user, password, host_port = match.groups()
+            return f"{protocol}{host_port}", aiohttp.BasicAuth(user, password), False
+        return proxy_url, None, False
+    if not proxy_url.startswith('http'):
+        return f"http://{proxy_url}", None, False
+    return proxy_url, None, False
+
+
+def _open_session(timeout: float, *, limit: int = DEFAULT_CONCURRENCY, connector: Any = None) -> aiohttp.ClientSession:
+    return aiohttp.ClientSession(
+        connector=connector or aiohttp.TCPConnector(limit=limit, ssl=False, ttl_dns_cache=300),
+        timeout=aiohttp.ClientTimeout(total=timeout),
+        headers={"User-Agent": USER_AGENT},
+    )
+
+
+async def _fetch_exit(session: aiohttp.ClientSession, url: str, **kwargs: Any) -> Tuple[str, Optional[str]]:
+    async with session.get(url, **kwargs) as response:
+        response.raise_for_status()
+        data = await response.json(content_type=None)
+    if data.get("status") == "fail":
+        raise RuntimeError(data.get("message") or "check service failed")
+    ip = data.get("query") or data.get("origin") or data.get("ip") or "ok"
+    return ip, data.get("countryCode")
+
+
+async def test_proxy(
+    proxy_url: Optional[str],
+    timeout: int = 10,
+    *,
+    session: Optional[aiohttp.ClientSession] = None,
+    url: str = CHECK_URL,
+) -> Dict[str, Any]:
     """
-    Проверка прокси через http://httpbin.org/ip (правильный метод без ssl:default ошибок)
-    
+    Проверка прокси: внешний IP, страна выхода и задержка.
+
     Args:
         proxy_url: URL прокси в формате:
             - ip:port@user:pass (KeySet формат)
             - http://user:pass@ip:port (стандартный URL)
             - socks5://user:pass@ip:port (SOCKS прокси)
         timeout: Таймаут в секундах
-    
+        session: Общая сессия для HTTP-прокси (см. iter_check_proxies);
+            без неё создаётся своя. SOCKS всегда идёт через свой коннектор.
+        url: Адрес проверки, отвечающий JSON с IP
+
     Returns:
         {
             "ok": bool,
             "ip": str,  # Внешний IP
+            "geo": str,  # Код страны выхода, если сервис его вернул
             "latency_ms": int,  # Задержка в миллисекундах
             "error": str  # Текст ошибки если ok=False
         }
     """
     if not proxy_url:
-        return {
-            "ok": False,
-            "ip": None,
-            "latency_ms": 0,
-            "error": "Прокси не указан"
-        }
-    
+        return _result(False, 0, error="Прокси не указан")
+
     start_time = time.time()
-    
+
+    def elapsed() -> int:
+        return int((time.time() - start_time) * 1000)
+
     try:
-        # Парсим прокси в правильный формат для aiohttp
-        proxy_auth = None
-        is_socks = False
-        
-        # Формат: ip:port@user:pass (из KeySet)
-        if '@' in proxy_url and not proxy_url.startswith('http') and not proxy_url.startswith('socks'):
-            parts = proxy_url.split('@')
-            if len(parts) == 2:
-                host_port = parts[0]
-                user_pass = parts[1]
-                user, password = user_pass.split(':', 1)
-                proxy_url_clean = f"http://{host_port}"
-                proxy_auth = aiohttp.BasicAuth(user, password)
-            else:
-                proxy_url_clean = f"http://{proxy_url}"
-        # Формат: http://user:pass@ip:port
-        elif '@' in proxy_url and '://' in proxy_url:
-            import re
-            if proxy_url.startswith('socks'):
-                # SOCKS прокси - нужен ProxyConnector (пока возвращаем ошибку)
-                is_socks = True
-                proxy_url_clean = proxy_url
-            else:
-                match = re.match(r'(https?://)([^:]+):([^@]+)@(.+)', proxy_url)
-                if match:
-                    protocol, user, password, host_port = match.groups()
-                    proxy_url_clean = f"{protocol}{host_port}"
-                    proxy_auth = aiohttp.BasicAuth(user, password)
-                else:
-                    proxy_url_clean = proxy_url
-        else:
-            # Без авторизации
-            if proxy_url.startswith('socks'):
-                is_socks = True
-                proxy_url_clean = proxy_url
-            elif not proxy_url.startswith('http'):
-                proxy_url_clean = f"http://{proxy_url}"
-            else:
-                proxy_url_clean = proxy_url
-        
-        # SOCKS прокси требуют aiohttp_socks
+        proxy_url_clean, proxy_auth, is_socks = _parse_proxy(proxy_url)
+
+        # SOCKS прокси требуют aiohttp_socks и собственный коннектор
         if is_socks:
             try:
                 from aiohttp_socks import ProxyConnector
-                # Парсим SOCKS URL
-                import re
-                match = re.match(r'socks[45]?://(?:([^:]+):([^@]+)@)?(.+)', proxy_url)
-                if match:
-                    user, password, host_port = match.groups()
-                    conn = ProxyConnector.from_url(
-                        proxy_url,
-                        rdns=True,
-                        username=user or None,
-                        password=password or None
-                    )
-                    
-                    timeout_obj = aiohttp.ClientTimeout(total=timeout)
-                    async with aiohttp.ClientSession(connector=conn, timeout=timeout_obj) as session:
-                        async with session.get("http://httpbin.org/ip") as response:
-                            data = await response.json()
-                            latency_ms = int((time.time() - start_time) * 1000)
-                            return {
-                                "ok": True,
-                                "ip": data.get("origin", "ok"),
-                                "latency_ms": latency_ms,
-                                "error": None
-                            }
             except ImportError:
-                return {
-                    "ok": False,
-                    "ip": None,
-                    "latency_ms": 0,
-                    "error": "aiohttp_socks не установлен для SOCKS прокси"
-                }
-        
-        # HTTP/HTTPS прокси - используем httpbin.org/ip с ssl=False
-        timeout_obj = aiohttp.ClientTimeout(total=timeout)
-        async with aiohttp.ClientSession(
-            timeout=timeout_obj,
-            headers={"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"}
-        ) as session:
-            async with session.get(
-                "http://httpbin.org/ip",  # HTTP вместо HTTPS - избегаем ssl:default ошибок
-                proxy=proxy_url_clean,
-                proxy_auth=proxy_auth,
-                ssl=False  # Важно для HTTP прокси
-            ) as response:
-                response.raise_for_status()
-                data = await response.json()
-                
-                latency_ms = int((time.time() - start_time) * 1000)
-                
-                return {
-                    "ok": True,
-                    "ip": data.get("origin", "ok"),
-                    "latency_ms": latency_ms,
-                    "error": None
-                }
-    
+                return _result(False, 0, error="aiohttp_socks не установлен для SOCKS прокси")
+            connector = ProxyConnector.from_url(proxy_url, rdns=True)
+            async with _open_session(timeout, connector=connector) as socks_session:
+                ip, geo = await _fetch_exit(socks_session, url)
+            return _result(True, elapsed(), ip=ip, geo=geo)
+
+        # HTTP/HTTPS прокси - проверка по HTTP с ssl=False, без ssl:default ошибок
+        kwargs = {"proxy": proxy_url_clean, "proxy_auth": proxy_auth, "ssl": False}
+        if session is not None:
+            ip, geo = await _fetch_exit(session, url, **kwargs)
+        else:
+            async with _open_session(timeout) as own_session:
+                ip, geo = await _fetch_exit(own_session, url, **kwargs)
+        return _result(True, elapsed(), ip=ip, geo=geo)
+
     except asyncio.TimeoutError:
-        latency_ms = int((time.time() - start_time) * 1000)
-        return {
-            "ok": False,
-            "ip": None,
-            "latency_ms": latency_ms,
-            "error": f"Timeout {timeout}s"
-        }
-    
+        return _result(False, elapsed(), error=f"Timeout {timeout}s")
+
     except aiohttp.ClientProxyConnectionError as e:
-        latency_ms = int((time.time() - start_time) * 1000)
-        return {
-            "ok": False,
-            "ip": None,
-            "latency_ms": latency_ms,
-            "error": f"Proxy error: {str(e)}"
-        }
-    
+        return _result(False, elapsed(), error=f"Proxy error: {str(e)}")
+
     except Exception as e:
-        latency_ms = int((time.time() - start_time) * 1000)
-        return {
-            "ok": False,
-            "ip": None,
-            "latency_ms": latency_ms,
-            "error": str(e)
-        }
+        return _result(False, elapsed(), error=str(e))
+
+
+async def iter_check_proxies(
+    proxies: Iterable[str],
+    *,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    timeout: int = 10,
+    url: str = CHECK_URL,
+) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Проверить много прокси, отдавая (proxy, result) по мере готовности.
+
+    Одновременно в работе не больше *concurrency* проверок; все HTTP-прокси
+    идут через одну сессию с общим пулом соединений.
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    async with _open_session(timeout, limit=max(1, concurrency)) as session:
 
+        async def run(proxy: str) -> Tuple[str, Dict[str, Any]]:
+            async with semaphore:
+                return proxy, await test_proxy(proxy, timeout, session=session, url=url)
 
-async def test_multiple_proxies(proxies: list[str], timeout: int = 10) -> Dict[str, Dict[str, Any]]:
+        tasks = [asyncio.ensure_future(run(proxy)) for proxy in dict.fromkeys(proxies)]
+        try:
+            for future in asyncio.as_completed(tasks):
+                yield await future
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
+async def test_multiple_proxies(
+    proxies: list[str],
+    timeout: int = 10,
+    *,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    on_progress: Optional[Callable[[int, int, str, Dict[str, Any]], None]] = None,
+) -> Dict[str, Dict[str, Any]]:
     """
     Проверка нескольких прокси параллельно
-    
+
     Args:
         proxies: Список прокси URL
         timeout: Таймаут для каждого прокси
-    
+        concurrency: Сколько проверок идёт одновременно
+        on_progress: Вызывается как (готово, всего, proxy, result)
+
     Returns:
         {proxy_url: result_dict}
     """
-    tasks = [test_proxy(proxy, timeout) for proxy in proxies]
-    results = await asyncio.gather(*tasks)
-    
-    return {proxy: result for proxy, result in zip(proxies, results)}
+    unique = list(dict.fromkeys(proxies))
+    results: Dict[str, Dict[str, Any]] = {}
+    async for proxy, result in iter_check_proxies(unique, concurrency=concurrency, timeout=timeout):
+        results[proxy] = result
+        if on_progress:
+            on_progress(len(results), len(unique), proxy, result)
+    return {proxy: results[proxy] for proxy in unique}
 
 
+async def check_manager_proxies(
+    proxy_ids: Optional[Iterable[str]] = None,
+    *,
+    manager: Any = None,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    timeout: int = 10,
+    on_progress: Optional[Callable[[int, int, str, Dict[str, Any]], None]] = None,
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Проверить прокси из ProxyManager и сохранить итог одной записью.
+
+    IP выхода, задержка и время проверки обновляются как телеметрия, страна
+    выхода попадает в geo живой записи, если он не задан; в конце proxies.json
+    перезаписывается один раз. Исход каждой проверки уходит в телеметрию
+    здоровья менеджера.
+    """
+    if manager is None:
+        from .proxy_manager import ProxyManager
+
+        manager = ProxyManager.instance()
+    wanted = set(proxy_ids) if proxy_ids is not None else None
+    items = [p for p in manager.list(include_disabled=True) if wanted is None or p.id in wanted]
+    by_uri: Dict[str, List[Any]] = {}
+    for proxy in items:
+        by_uri.setdefault(proxy.uri(include_credentials=True), []).append(proxy)
+
+    results: Dict[str, Dict[str, Any]] = {}
+    done = 0
+    async for uri, result in iter_check_proxies(by_uri, concurrency=concurrency, timeout=timeout):
+        now = time.time()
+        for proxy in by_uri[uri]:
+            results[proxy.id] = result
+            if result["ok"]:
+                manager.update_telemetry(
+                    proxy.id, last_check=now, last_ip=result["ip"], last_latency_ms=result["latency_ms"]
+                )
+                if result.get("geo"):
+                    manager.fill_geo(proxy.id, result["geo"])
+                manager.report_success(proxy.id, result["latency_ms"])
+            else:
+                manager.update_telemetry(proxy.id, last_check=now, last_latency_ms=result["latency_ms"])
+                manager.report_failure(proxy.id, result["error"])
+            done += 1
+            if on_progress:
+                on_progress(done, len(items), proxy.id, result)
+    # Всё накопленное — одной записью
+    manager.flush()
+    return results
+
 def format_proxy_url(host: str, port: int, user: str, password: str, protocol: str = "http") -> str:
     """
     Форматирование URL прокси
@@ -0,0 +1,425 @@
+"""
+Локальный шлюз авторизации для upstream-прокси.
+
+Один поток с event loop на весь процесс. Каждому аккаунту выделяется свой
+порт на 127.0.0.1: Chrome ходит туда без логина, а шлюз дописывает
+Proxy-Authorization и отправляет трафик в upstream-прокси аккаунта.
+
+Для каждого upstream держится небольшой пул заранее открытых TCP-соединений,
+поэтому CONNECT не ждёт рукопожатия с прокси. После рукопожатия данные идут
+через протоколы asyncio (data_received -> transport.write) без StreamReader и
+drain на каждый кусок; противодавление — pause_reading/resume_reading соседа.
+"""
+from __future__ import annotations
+
+import asyncio
+import base64
+import logging
+import ssl
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, Dict, Optional, Set, Tuple
+
+LOGGER = logging.getLogger(__name__)
+
+LISTEN_HOST = "127.0.0.1"
+# Сколько соединений с каждым upstream держать открытыми заранее
+WARM_CONNECTIONS = 2
+# Старше этого прогретое соединение не используется: прокси мог его закрыть
+WARM_TTL = 20.0
+CONNECT_TIMEOUT = 10.0
+HEAD_LIMIT = 64 * 1024
+
+_HOP_HEADERS = (b"proxy-authorization:", b"proxy-connection:", b"connection:", b"keep-alive:")
+
+# Ссылки на фоновые задачи, чтобы их не собрал GC
+_background: Set[asyncio.Task] = set()
+
+
+def _spawn(coro) -> None:
+    task = asyncio.get_running_loop().create_task(coro)
+    _background.add(task)
+    task.add_done_callback(_background.discard)
+
+
+@dataclass(frozen=True)
+class Upstream:
+    """Удалённый прокси и учётные данные к нему."""
+
+    host: str
+    port: int
+    username: str = ""
+    password: str = ""
+    scheme: str = "http"
+
+    @property
+    def address(self) -> Tuple[str, str, int]:
+        return (self.scheme.lower(), self.host, int(self.port))
+
+    def auth_header(self) -> bytes:
+        if not self.username:
+            return b""
+        token = base64.b64encode(f"{self.username}:{self.password}".encode("utf-8"))
+        return b"Proxy-Authorization: Basic " + token + b"\r\n"
+
+
+class _Pipe(asyncio.Protocol):
+    """Одна сторона туннеля: до связки копит данные, после — пишет их соседу."""
+
+    def __init__(self) -> None:
+        self.transport: Optional[asyncio.Transport] = None
+        self.peer: Optional["_Pipe"] = None
+        self.buffer = bytearray()
+        self.closed = False
+        # Сторона прислала EOF: читать больше нечего, но писать ей ещё можно
+        self.eof = False
+        self._waiter: Optional[asyncio.Future] = None
+
+    # -- asyncio.Protocol
+    def connection_made(self, transport: asyncio.BaseTransport) -> None:
+        self.transport = transport  # type: ignore[assignment]
+
+    def data_received(self, data: bytes) -> None:
+        if self.peer is not None:
+            self.peer.write(data)
+            return
+        self.buffer += data
+        if len(self.buffer) > HEAD_LIMIT and self.transport is not None:
+            self.transport.pause_reading()
+        self._wake()
+
+    def eof_received(self) -> bool:
+        self.eof = True
+        self._wake()
+        if self.peer is None:
+            return True  # до связки полузакрытие передаст _link
+        if self.peer.eof:
+            # Оба направления дочитаны — закрываем туннель целиком
+            self.peer.close()
+            return False
+        self.peer.write_eof()
+        return True
+
+    def connection_lost(self, exc: Optional[Exception]) -> None:
+        self.closed = True
+        self._wake()
+        if self.peer is not None:
+            self.peer.close()
+
+    def pause_writing(self) -> None:
+        if self.peer is not None and self.peer.transport is not None:
+            self.peer.transport.pause_reading()
+
+    def resume_writing(self) -> None:
+        if self.peer is not None and self.peer.transport is not None:
+            self.peer.transport.resume_reading()
+
+    # -- helpers
+    def write(self, data: bytes) -> None:
+        if self.transport is not None and not self.closed:
+            self.transport.write(data)
+
+    def write_eof(self) -> None:
+        """Полузакрыть запись; TLS-транспорт так не умеет — закрываем целиком."""
+        if self.transport is None or self.closed:
+            return
+        if self.transport.can_write_eof():
+            self.transport.write_eof()
+        else:
+            self.close()
+
+    def close(self) -> None:
+        if self.transport is not None:
+            self.transport.close()  # дописывает буфер и закрывает
+
+    def _wake(self) -> None:
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    async def read_head(self) -> bytes:
+        """Дождаться заголовков (до пустой строки) и вынуть их из буфера."""
+        while True:
+            end = self.buffer.find(b"\r\n\r\n")
+            if end >= 0:
+                head = bytes(self.buffer[: end + 4])
+                del self.buffer[: end + 4]
+                return head
+            if self.closed or self.eof:
+                raise ConnectionError("connection closed before headers")
+            if len(self.buffer) > HEAD_LIMIT:
+                raise ConnectionError("headers too large")
+            self._waiter = asyncio.get_running_loop().create_future()
+            await self._waiter
+            self._waiter = None
+
+
+def _link(a: _Pipe, b: _Pipe) -> None:
+    """Связать стороны и отдать всё, что пришло во время рукопожатия."""
+    a.peer, b.peer = b, a
+    for side, other in ((a, b), (b, a)):
+        if side.buffer:
+            other.write(bytes(side.buffer))
+            side.buffer.clear()
+        if side.transport is not None and not side.closed:
+            side.transport.resume_reading()
+        if side.closed or (side.eof and other.eof):
+            other.close()
+            side.close()
+        elif side.eof:
+            other.write_eof()
+
+
+class _WarmPool:
+    """Пул заранее открытых TCP-соединений с одним upstream."""
+
+    def __init__(self, upstream: Upstream, size: int) -> None:
+        self.upstream = upstream
+        self.size = max(0, size)
+        self.users = 0
+        self._idle: Deque[Tuple[_Pipe, float]] = deque()
+        self._filling = 0
+        self._closed = False
+        self._ssl: Optional[ssl.SSLContext] = (
+            ssl.create_default_context() if upstream.scheme.lower() == "https" else None
+        )
+
+    async def acquire(self) -> _Pipe:
+        now = time.monotonic()
+        while self._idle:
+            proto, opened = self._idle.popleft()
+            if not proto.closed and not proto.eof and now - opened < WARM_TTL:
+                self.refill()
+                return proto
+            proto.close()
+        self.refill()
+        return await self._dial()
+
+    def refill(self) -> None:
+        if self._closed:
+            return
+        for _ in range(self.size - len(self._idle) - self._filling):
+            self._filling += 1
+            _spawn(self._fill_one())
+
+    async def _fill_one(self) -> None:
+        try:
+            proto = await self._dial()
+        except (OSError, asyncio.TimeoutError) as exc:
+            LOGGER.debug("Warm-up to %s:%s failed: %s", self.upstream.host, self.upstream.port, exc)
+            return
+        finally:
+            self._filling -= 1
+        if self._closed:
+            proto.close()
+        else:
+            self._idle.append((proto, time.monotonic()))
+
+    async def _dial(self) -> _Pipe:
+        loop = asyncio.get_running_loop()
+        _, proto = await asyncio.wait_for(
+            loop.create_connection(_Pipe, self.upstream.host, self.upstream.port, ssl=self._ssl),
+            CONNECT_TIMEOUT,
+        )
+        return proto
+
+    def close(self) -> None:
+        self._closed = True
+        while self._idle:
+            self._idle.popleft()[0].close()
+
+
+class _Route:
+    def __init__(self, key: str, upstream: Upstream, pool: _WarmPool) -> None:
+        self.key = key
+        self.upstream = upstream
+        self.pool = pool
+        self.auth = upstream.auth_header()
+        self.server: Optional[asyncio.AbstractServer] = None
+        self.port = 0
+        self.clients: Set[_Pipe] = set()
+
+
+class _Client(_Pipe):
+    def __init__(self, gateway: "ProxyGateway", route: _Route) -> None:
+        super().__init__()
+        self.gateway = gateway
+        self.route = route
+
+    def connection_made(self, transport: asyncio.BaseTransport) -> None:
+        super().connection_made(transport)
+        self.route.clients.add(self)
+        _spawn(self.gateway._serve(self))
+
+    def connection_lost(self, exc: Optional[Exception]) -> None:
+        self.route.clients.discard(self)
+        super().connection_lost(exc)
+
+
+class ProxyGateway:
+    """Мультиплексирующий локальный прокси: порт на аккаунт, один event loop."""
+
+    def __init__(self, *, host: str = LISTEN_HOST, warm_connections: int = WARM_CONNECTIONS) -> None:
+        self.host = host
+        self.warm_connections = warm_connections
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._routes: Dict[str, _Route] = {}
+        self._pools: Dict[Tuple[str, str, int], _WarmPool] = {}
+
+    # ------------------------------------------------------------------ API
+
+    def add_route(self, key: str, upstream: Upstream, *, port: int = 0) -> int:
+        """Открыть (или переиспользовать) локальный порт для *key* и вернуть его."""
+        with self._lock:
+            existing = self._routes.get(key)
+            if existing is not None and existing.upstream == upstream:
+                return existing.port
+        if existing is not None:
+            self.remove_route(key)
+        return self._call(self._add_route(key, upstream, port))
+
+    def remove_route(self, key: str) -> None:
+        with self._lock:
+            if key not in self._routes or self._loop is None:
+                return
+        self._call(self._remove_route(key))
+
+    def get_port(self, key: str) -> Optional[int]:
+        route = self._routes.get(key)
+        return route.port if route else None
+
+    def close(self) -> None:
+        """Закрыть все маршруты и остановить поток шлюза."""
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            self._loop = None
+            self._thread = None
+        if loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self._shutdown(), loop).result(CONNECT_TIMEOUT)
+        loop.call_soon_threadsafe(loop.stop)
+        if thread is not None:
+            thread.join(timeout=5)
+
+    # ------------------------------------------------------------ internals
+
+    def _call(self, coro, timeout: float = CONNECT_TIMEOUT):
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_loop()).result(timeout)
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is not None:
+                return self._loop
+            loop = asyncio.new_event_loop()
+            ready = threading.Event()
+
+            def runner() -> None:
+                asyncio.set_event_loop(loop)
+                loop.call_soon(ready.set)
+                try:
+                    loop.run_forever()
+                finally:
+                    loop.close()
+
+            self._thread = threading.Thread(target=runner, name="proxy-gateway", daemon=True)
+            self._thread.start()
+            ready.wait()
+            self._loop = loop
+            return loop
+
+    async def _add_route(self, key: str, upstream: Upstream, port: int) -> int:
+        pool = self._pools.get(upstream.address)
+        if pool is None:
+            pool = self._pools[upstream.address] = _WarmPool(upstream, self.warm_connections)
+        route = _Route(key, upstream, pool)
+        loop = asyncio.get_running_loop()
+        route.server = await loop.create_server(lambda: _Client(self, route), self.host, port)
+        route.port = route.server.sockets[0].getsockname()[1]
+        pool.users += 1
+        pool.refill()
+        with self._lock:
+            self._routes[key] = route
+        LOGGER.info("Proxy gateway route %s on %s:%s -> %s:%s", key, self.host, route.port, upstream.host, upstream.port)
+        return route.port
+
+    async def _remove_route(self, key: str) -> None:
+        with self._lock:
+            route = self._routes.pop(key, None)
+        if route is None:
+            return
+        if route.server is not None:
+            route.server.close()
+        for client in list(route.clients):
+            client.close()
+        route.pool.users -= 1
+        if route.pool.users <= 0:
+            route.pool.close()
+            self._pools.pop(route.upstream.address, None)
+        LOGGER.info("Proxy gateway route %s closed", key)
+
+    async def _shutdown(self) -> None:
+        for key in list(self._routes):
+            await self._remove_route(key)
+
+    async def _serve(self, client: _Client) -> None:
+        route = client.route
+        upstream: Optional[_Pipe] = None
+        answered = False
+        try:
+            head = await asyncio.wait_for(client.read_head(), CONNECT_TIMEOUT)
+            request_line, _, headers = head.partition(b"\r\n")
+            parts = request_line.split(b" ")
+            if len(parts) < 3:
+                raise ConnectionError("malformed request line")
+            upstream = await route.pool.acquire()
+            if parts[0].upper() == b"CONNECT":
+                target = parts[1]
+                upstream.write(
+                    b"CONNECT " + target + b" HTTP/1.1\r\nHost: " + target + b"\r\n" + route.auth + b"\r\n"
+                )
+                response = await asyncio.wait_for(upstream.read_head(), CONNECT_TIMEOUT)
+                client.write(response)
+                answered = True
+                if response.split(b" ", 2)[1:2] != [b"200"]:
+                    raise ConnectionError(response.partition(b"\r\n")[0].decode("latin1", "replace"))
+            else:
+                # Авторизация дописывается только в первый запрос, поэтому
+                # keep-alive отключаем: следующий запрос придёт новым соединением
+                kept = [
+                    line
+                    for line in headers.split(b"\r\n")
+                    if line and not line.lower().startswith(_HOP_HEADERS)
+                ]
+                upstream.write(
+                    request_line + b"\r\n"
+                    + b"".join(line + b"\r\n" for line in kept)
+                    + route.auth
+                    + b"Connection: close\r\nProxy-Connection: close\r\n\r\n"
+                )
+            _link(client, upstream)
+        except (ConnectionError, OSError, asyncio.TimeoutError) as exc:
+            LOGGER.debug("Proxy gateway %s: %s", route.key, exc)
+            if not answered:
+                client.write(b"HTTP/1.1 502 Bad Gateway\r\nContent-Length: 0\r\n\r\n")
+            client.close()
+            if upstream is not None:
+                upstream.close()
+
+
+_gateway: Optional[ProxyGateway] = None
+_gateway_lock = threading.Lock()
+
+
+def get_gateway() -> ProxyGateway:
+    """Общий для процесса шлюз."""
+    global _gateway
+    with _gateway_lock:
+        if _gateway is None:
+            _gateway = ProxyGateway()
+        return _gateway
+
+
+__all__ = ["ProxyGateway", "Upstream", "get_gateway"]
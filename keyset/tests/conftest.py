@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+"""
+Shared setup for the keyset tests.
+"""
+import sys
+import types
+
+try:
+    import playwright.async_api  # noqa: F401
+except ImportError:
+    # Пакеты services и workers импортируют playwright, но браузер тестам
+    # не нужен: хватает заглушек на время импорта имён
+    class _Stub(types.ModuleType):
+        def __getattr__(self, name):
+            if name.startswith("__"):
+                raise AttributeError(name)
+            return type(name, (Exception,), {})
+
+    for _name in ("playwright", "playwright.async_api", "playwright.sync_api"):
+        sys.modules.setdefault(_name, _Stub(_name))
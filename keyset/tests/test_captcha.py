@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the captcha client against a local stand-in for the RuCaptcha API.
+"""
+import asyncio
+import socket
+import threading
+import time
+
+import pytest
+from aiohttp import web
+
+from keyset.services import captcha
+
+
+class _StandIn:
+    """in.php/res.php: картинка "ok:<текст>" решается, "unsolvable" — нет, "never" — висит."""
+
+    def __init__(self):
+        self.tasks = {}
+        self.polls = []
+
+    async def submit(self, request):
+        form = await request.post()
+        task_id = str(len(self.tasks) + 1)
+        self.tasks[task_id] = form["body"]
+        return web.json_response({"status": 1, "request": task_id})
+
+    async def result(self, request):
+        ids = request.query["ids"].split(",")
+        self.polls.append(ids)
+        answers = []
+        for task_id in ids:
+            body = self.tasks[task_id]
+            if body.startswith("ok:"):
+                answers.append(body[3:])
+            elif body == "unsolvable":
+                answers.append("ERROR_CAPTCHA_UNSOLVABLE")
+            else:
+                answers.append("CAPCHA_NOT_READY")
+        return web.Response(text="|".join(answers))
+
+
+@pytest.fixture
+def stand_in():
+    handler = _StandIn()
+    app = web.Application()
+    app.router.add_post("/in.php", handler.submit)
+    app.router.add_get("/res.php", handler.result)
+    loop = asyncio.new_event_loop()
+    runner = web.AppRunner(app)
+    loop.run_until_complete(runner.setup())
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    loop.run_until_complete(site.start())
+    port = runner.addresses[0][1]
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{port}", handler
+    asyncio.run_coroutine_threadsafe(runner.cleanup(), loop).result(5)
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(5)
+    loop.close()
+
+
+@pytest.fixture(autouse=True)
+def fast_polling(monkeypatch):
+    monkeypatch.setattr(captcha, "FIRST_POLL_DELAY", 0.05)
+    monkeypatch.setattr(captcha, "MIN_POLL_INTERVAL", 0.02)
+    monkeypatch.setattr(captcha, "POLL_MAX_INTERVAL", 0.05)
+    monkeypatch.setattr(captcha, "WAIT_GRACE", 1.0)
+
+
+def _client(base_url, reports, timeout=0.5):
+    client = captcha.CaptchaService(
+        "key",
+        base_url=base_url,
+        reporter=lambda *outcome: reports.append(outcome),
+        timeout=timeout,
+    )
+    client.solve_time = 0.05
+    return client
+
+
+async def _solve_many(client, images, **kwargs):
+    async with client:
+        return await client.solve_many(images, **kwargs)
+
+
+def test_batched_polling_and_outcomes_reach_reporter(stand_in):
+    base_url, handler = stand_in
+    reports = []
+    client = _client(base_url, reports)
+
+    solutions = asyncio.run(_solve_many(client, ["ok:abc", "ok:xyz", "unsolvable", "never"], account_id=7))
+
+    assert solutions == ["abc", "xyz", None, None]
+    assert max(len(ids) for ids in handler.polls) == 4
+    assert sorted(reports, key=repr) == sorted([
+        (7, "abc", None),
+        (7, "xyz", None),
+        (7, None, "ERROR_CAPTCHA_UNSOLVABLE"),
+        (7, None, "timeout"),
+    ], key=repr)
+
+
+def test_transport_errors_never_reach_reporter():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    reports = []
+    client = _client(f"http://127.0.0.1:{port}", reports)
+
+    assert asyncio.run(_solve_many(client, ["ok:abc"], account_id=7)) == [None]
+    assert reports == []
+
+
+def test_loops_in_different_threads_keep_their_own_state(stand_in):
+    base_url, _ = stand_in
+    reports = []
+    client = _client(base_url, reports)
+    results = {}
+
+    def worker(name):
+        results[name] = asyncio.run(_solve_many(client, [f"ok:{name}"] * 3))
+
+    threads = [threading.Thread(target=worker, args=(name,)) for name in ("a", "b")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+
+    assert results == {"a": ["a"] * 3, "b": ["b"] * 3}
+
+
+def test_dead_poller_fails_waiting_solves(stand_in, monkeypatch):
+    base_url, _ = stand_in
+    reports = []
+    client = _client(base_url, reports, timeout=30)
+
+    async def broken(ids):
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(client, "_fetch_results", broken)
+    started = time.monotonic()
+    assert asyncio.run(_solve_many(client, ["ok:abc", "ok:xyz"], account_id=7)) == [None, None]
+    assert time.monotonic() - started < 5
+    assert reports == [(7, None, "ERROR_POLLER")] * 2
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the lazy group tree model.
+"""
+import pytest
+from PySide6.QtCore import QModelIndex, qInstallMessageHandler
+from PySide6.QtTest import QAbstractItemModelTester
+from PySide6.QtWidgets import QApplication
+
+from app.widgets.group_tree_model import GroupTreeModel
+
+
+@pytest.fixture
+def qapp():
+    """Create QApplication instance for tests"""
+    app = QApplication.instance()
+    if app is None:
+        app = QApplication([])
+    return app
+
+
+@pytest.fixture
+def model_failures():
+    """Collect QAbstractItemModelTester failures instead of aborting the process"""
+    failures = []
+
+    def handler(mode, context, message):
+        if message.startswith("FAIL!"):
+            failures.append(message)
+
+    previous = qInstallMessageHandler(handler)
+    yield failures
+    qInstallMessageHandler(previous)
+
+
+def _group_index(model, name):
+    for row in range(model.rowCount(QModelIndex())):
+        index = model.index(row, 0, QModelIndex())
+        if str(model.data(index)).startswith(name):
+            return index
+    raise AssertionError(f"group {name!r} not found")
+
+
+def test_update_of_expanded_group_survives_fetch_from_data_changed(qapp, model_failures):
+    model = GroupTreeModel()
+    tester = QAbstractItemModelTester(model, QAbstractItemModelTester.FailureReportingMode.Warning)
+    model.set_groups({"окна": ["окна пвх", "окна цена", "окна купить"]})
+    model.fetchMore(_group_index(model, "окна"))
+
+    # Представление догружает строки прямо из слота на dataChanged
+    model.dataChanged.connect(lambda *_: model.fetchMore(_group_index(model, "окна")))
+    model.set_groups({"окна": ["окна пвх", "окна цена", "окна купить", "окна дерево", "окна москва"]})
+
+    parent = _group_index(model, "окна")
+    assert model_failures == []
+    assert model.rowCount(parent) == 5
+    assert model.data(model.index(4, 0, parent)) == "окна москва"
+
+    model.set_groups({"окна": ["окна москва", "окна пвх"]})
+    assert model_failures == []
+    assert model.rowCount(_group_index(model, "окна")) == 2
+    del tester
+
+
+def test_new_groups_keep_incoming_order(qapp, model_failures):
+    model = GroupTreeModel()
+    tester = QAbstractItemModelTester(model, QAbstractItemModelTester.FailureReportingMode.Warning)
+    model.set_groups({"a": ["a1"], "d": ["d1"]})
+    inserted = []
+    model.rowsInserted.connect(lambda parent, first, last: inserted.append((first, last)))
+
+    model.set_groups({"a": ["a1"], "b": ["b1"], "c": ["c1"], "d": ["d1"], "e": ["e1"]})
+
+    assert model_failures == []
+    assert model.group_names() == ["a", "b", "c", "d", "e"]
+    # Строка 0 — корзина; вставки идут непрерывными диапазонами
+    assert inserted == [(2, 3), (5, 5)]
+    names = [model.group_name(model.index(row, 0, QModelIndex())) for row in range(1, model.rowCount(QModelIndex()))]
+    assert names == ["a", "b", "c", "d", "e"]
+    del tester
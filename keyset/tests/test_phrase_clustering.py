@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for cluster_phrases against the plain greedy Jaccard pass.
+"""
+import random
+
+import pytest
+
+from keyset.services.phrase_tools import cluster_phrases, tokenize
+
+
+def _jaccard(a, b):
+    if not a and not b:
+        return 1.0
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def _greedy_clusters(phrases, similarity):
+    """The original quadratic pass: join the first cluster with a close enough member."""
+    clusters = []
+    for phrase in phrases:
+        tokens = set(tokenize(phrase))
+        for keys, members in clusters:
+            if max(_jaccard(tokens, existing) for existing in members) >= similarity:
+                keys.append(phrase)
+                members.append(tokens)
+                break
+        else:
+            clusters.append(([phrase], [tokens]))
+    return [keys for keys, _ in clusters]
+
+
+def _random_phrases(seed, count=400):
+    rng = random.Random(seed)
+    # Zipf-подобный словарь: частые слова встречаются в большинстве фраз
+    vocabulary = [f"w{i}" for i in range(60)]
+    weights = [1 / (rank + 1) for rank in range(len(vocabulary))]
+    phrases = []
+    for _ in range(count):
+        size = rng.randint(0, 6)
+        phrases.append(" ".join(rng.choices(vocabulary, weights, k=size)))
+    return phrases
+
+
+@pytest.mark.parametrize("similarity", [0.0, 0.2, 1 / 3, 0.5, 0.6, 2 / 3, 0.75, 0.9, 1.0])
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_cluster_phrases_matches_greedy_pass(similarity, seed):
+    phrases = _random_phrases(seed)
+    clusters = cluster_phrases(phrases, similarity=similarity)
+    assert [cluster.keys for cluster in clusters] == _greedy_clusters(phrases, similarity)
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the parsing tab phrase table model and its filter proxy.
+"""
+import pytest
+from PySide6.QtCore import Qt, qInstallMessageHandler
+from PySide6.QtTest import QAbstractItemModelTester
+from PySide6.QtWidgets import QApplication
+
+from app.widgets.phrase_table_model import (
+    EMPTY_FREQ,
+    PhraseFilter,
+    PhraseFilterProxyModel,
+    PhraseTableModel,
+)
+
+
+@pytest.fixture
+def qapp():
+    """Create QApplication instance for tests"""
+    app = QApplication.instance()
+    if app is None:
+        app = QApplication([])
+    return app
+
+
+@pytest.fixture
+def model_failures():
+    """Collect QAbstractItemModelTester failures instead of aborting the process"""
+    failures = []
+
+    def handler(mode, context, message):
+        if message.startswith("FAIL!"):
+            failures.append(message)
+
+    previous = qInstallMessageHandler(handler)
+    yield failures
+    qInstallMessageHandler(previous)
+
+
+@pytest.fixture
+def models(qapp, model_failures):
+    model = PhraseTableModel()
+    proxy = PhraseFilterProxyModel()
+    proxy.setSourceModel(model)
+    testers = [
+        QAbstractItemModelTester(item, QAbstractItemModelTester.FailureReportingMode.Warning)
+        for item in (model, proxy)
+    ]
+    model.set_regions([(225, "Россия"), (213, "Москва")])
+    yield model, proxy
+    assert model_failures == []
+    del testers
+
+
+def test_append_indexes_duplicates_and_skips_blanks(models):
+    model, _ = models
+    appended = []
+    model.phrases_appended.connect(appended.append)
+
+    assert model.append_phrases([" окна пвх ", "", "   ", "двери", "окна пвх"], freq=10) == 3
+    assert model.phrases() == ["окна пвх", "двери", "окна пвх"]
+    assert appended == [["окна пвх", "двери", "окна пвх"]]
+    # Повтор фразы — отдельная строка, но результат приходит в обе
+    assert model.rows_for("окна пвх") == [0, 2]
+    assert model.value(1) == 10 and model.value(1, 213) == EMPTY_FREQ
+
+    model.mark_pending(["окна пвх", "двери"])
+    assert model.apply_results({"окна пвх": {225: 500, 213: 70}}, {"окна пвх": {225: "OK", 213: "OK"}}) == 3
+    assert [model.value(row) for row in range(3)] == [500, EMPTY_FREQ, 500]
+    status = model.status_column
+    assert [model.data(model.index(row, status)) for row in range(3)] == ["✓", "⏱", "✓"]
+
+
+def test_check_flags(models):
+    model, proxy = models
+    model.append_phrases(["a", "b", "c"], checked=False)
+    assert model.checked_count() == 0
+
+    index = proxy.index(1, PhraseTableModel.CHECK_COLUMN)
+    assert proxy.setData(index, Qt.Checked, Qt.CheckStateRole)
+    assert model.checked_rows() == [1]
+    assert model.data(model.index(1, 0), Qt.CheckStateRole) == Qt.Checked
+
+    model.invert_checked()
+    assert model.checked_rows() == [0, 2]
+    model.check_rows([0], checked=False)
+    assert model.checked_rows() == [2]
+    model.set_all_checked(True)
+    assert model.checked_count() == 3
+
+
+def test_filter_and_remove_through_proxy_mapping(models):
+    model, proxy = models
+    model.append_phrases(["окна пвх", "двери", "Окна дерево купить", "окна"])
+    model.apply_results({"окна": {225: 900}, "окна пвх": {225: 40}}, {})
+
+    proxy.set_phrase_filter(PhraseFilter(search_text="ОКНА", words_max=2))
+    assert proxy.rowCount() == 2
+    assert [proxy.data(proxy.index(row, PhraseTableModel.PHRASE_COLUMN)) for row in range(2)] == ["окна пвх", "окна"]
+
+    proxy.set_phrase_filter(PhraseFilter(freq_min=100))
+    # Строки без частоты диапазоном частот не отсекаются
+    assert proxy.source_rows(range(proxy.rowCount())) == [1, 2, 3]
+
+    removed = []
+    model.rows_removed.connect(removed.append)
+    assert model.remove_rows(proxy.source_rows([0, 2])) == 2
+    assert removed == [[1, 3]]
+    assert model.phrases() == ["окна пвх", "Окна дерево купить"]
+    assert model.rows_for("Окна дерево купить") == [1]
+    assert model.rows_for("окна") == []
+
+    proxy.set_phrase_filter(PhraseFilter())
+    assert proxy.phrase_filter is None
+    assert proxy.rowCount() == 2
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the parsing session snapshot + journal.
+"""
+import json
+
+from keyset.core.session_journal import SessionJournal
+
+
+def test_replay_ignores_torn_tail_and_compacts(tmp_path):
+    snapshot = tmp_path / "parsing_session.json"
+    journal = SessionJournal(snapshot)
+    journal.add_phrases(["a", "b", "c"])
+    journal.remove_rows([1])
+    journal.record_results([{"phrase": "a", "region_id": 225, "ws": 5, "status": "OK"}])
+    assert journal.record_results([{"phrase": "a", "region_id": 225, "ws": 5, "status": "OK"}]) == 0
+
+    with journal.journal_path.open("a", encoding="utf-8") as fh:
+        fh.write('{"op":"add","phrases":["lost"')
+
+    state = SessionJournal(snapshot).load()
+    assert state["phrases"] == ["a", "c"]
+    assert state["partial_results"][0]["ws"] == 5
+
+    restored = SessionJournal(snapshot)
+    restored.load()
+    restored.compact()
+    assert json.loads(snapshot.read_text(encoding="utf-8"))["phrases"] == ["a", "c"]
+    assert SessionJournal(snapshot).load()["phrases"] == ["a", "c"]
+
+
+def test_journal_from_previous_generation_is_not_replayed(tmp_path):
+    snapshot = tmp_path / "parsing_session.json"
+    journal = SessionJournal(snapshot)
+    journal.add_phrases(["a"])
+    journal.compact()
+
+    # Падение между заменой снимка и обнулением журнала
+    journal.journal_path.write_text(
+        json.dumps({"op": "begin", "generation": 0}) + "\n" + json.dumps({"op": "clear"}) + "\n",
+        encoding="utf-8",
+    )
+    assert SessionJournal(snapshot).load()["phrases"] == ["a"]
+
+
+def test_append_after_torn_tail_is_not_glued_to_it(tmp_path):
+    snapshot = tmp_path / "parsing_session.json"
+    SessionJournal(snapshot).add_phrases(["a"])
+    with SessionJournal(snapshot).journal_path.open("a", encoding="utf-8") as fh:
+        fh.write('{"op":"add","phrases":["lost"')
+
+    reopened = SessionJournal(snapshot)
+    assert reopened.load()["phrases"] == ["a"]
+    reopened.add_phrases(["b"])
+    reopened.add_phrases(["c"])
+    reopened.record_results([{"phrase": "b", "region_id": 225, "ws": 7, "status": "OK"}])
+
+    state = SessionJournal(snapshot).load()
+    assert state["phrases"] == ["a", "b", "c"]
+    assert state["partial_results"][0]["ws"] == 7
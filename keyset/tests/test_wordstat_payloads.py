@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the stored Wordstat payloads and their reuse by the deep parser.
+"""
+import time
+
+import pytest
+
+from keyset.services import wordstat_payloads
+from keyset.workers import deep_parser
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(wordstat_payloads, "DB_PATH", tmp_path / "payloads.db")
+    monkeypatch.setattr(wordstat_payloads, "_table_ready", False)
+    return wordstat_payloads
+
+
+def test_deep_parser_snapshot_is_reused_without_shadowing(store):
+    now = time.time()
+    store.store_payloads([{
+        "query": "окна",
+        "region": 225,
+        "total": 900,
+        "popular": [{"phrase": "окна пвх", "count": 500}],
+        "related": [{"phrase": "двери", "count": 300}],
+        "fetched_at": now - 60,
+    }])
+    # Парсинг вглубь сохраняет только левую колонку, зато целиком
+    store.store_payloads([{
+        "query": "окна",
+        "region": 225,
+        "popular": [
+            {"phrase": "окна", "count": 900},
+            {"phrase": "окна пвх", "count": 510},
+            {"phrase": "окна цена", "count": 5},
+        ],
+        "fetched_at": now,
+    }])
+
+    snapshot = store.latest_payloads(["окна"], 225)["окна"]
+    assert snapshot["total"] == 900
+    assert snapshot["related"] == [{"phrase": "двери", "count": 300}]
+    assert [entry["phrase"] for entry in snapshot["popular"]] == ["окна", "окна пвх", "окна цена"]
+
+    assert deep_parser._stored_rows("окна", 225, 10, None) == [("окна пвх", 510)]
+    # Более низкий порог при повторном запуске видит строки, отсеянные первым
+    assert deep_parser._stored_rows("окна", 225, 1, None) == [("окна пвх", 510), ("окна цена", 5)]
+
+
+def test_stored_depth_returns_misses_for_the_next_parser(store):
+    store.store_payloads([
+        {"query": "окна", "region": 225, "related": [{"phrase": "двери", "count": 300}]},
+        {"query": "кровля", "region": 225, "popular": [{"phrase": "кровля цена", "count": 40}]},
+        {
+            "query": "сайдинг",
+            "region": 225,
+            "related": [{"phrase": "фасад", "count": 70}],
+            "fetched_at": time.time() - 2 * store.DEPTH_MAX_AGE,
+        },
+    ])
+
+    rows, missing = store.stored_depth(
+        ["окна", "кровля", "сайдинг", "забор"], column="right", pages=1, regions=[225]
+    )
+    assert [row["phrase"] for row in rows] == ["двери"]
+    assert missing == ["кровля", "сайдинг", "забор"]
+    assert store.collect_depth(["окна", "забор"], column="right", pages=1, regions=[225], profile=None) is None
+    assert store.collect_depth(["окна"], column="right", pages=1, regions=[225], profile=None) == rows
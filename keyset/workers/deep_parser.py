@@ -6,13 +6,21 @@
 from __future__ import annotations
 
 import asyncio
+import hashlib
 import json
+import sqlite3
+import threading
 import time
 from pathlib import Path
 from typing import List, Tuple, Optional, Dict, Any
 
 from playwright.async_api import async_playwright, TimeoutError as PlaywrightTimeout
 
+try:
+    from ..services.wordstat_payloads import latest_payloads, store_payloads
+except ImportError:
+    from services.wordstat_payloads import latest_payloads, store_payloads
+
 
 # Константы
 LAUNCH_ARGS = ["--no-sandbox", "--disable-dev-shm-usage"]
@@ -25,6 +33,11 @@ SEARCH_SELECTORS = (
     "input"
 )
 API_SEARCH_PATH = "/wordstat/api/search"
+# Минимальный интервал между запросами одного аккаунта (сек)
+ACCOUNT_MIN_INTERVAL = 1.0
+PAGES_PER_ACCOUNT = 1
+# Сколько раз повторять запрос после ошибки страницы/навигации
+QUERY_MAX_ATTEMPTS = 3
 
 
 def _clean_num(text: str) -> int:
@@ -65,17 +78,26 @@ def _collect_entries(table_data: Any) -> List[Tuple[str, int, str]]:
 
 def _extract_rows_from_json(payload: dict, query: str, min_shows: int) -> List[Tuple[str, int]]:
     """Извлечь фразы из JSON-ответа API с фильтрацией"""
+    return _filter_rows(_raw_rows_from_json(payload), query, min_shows)
+
+
+def _raw_rows_from_json(payload: dict) -> List[Tuple[str, int]]:
+    """Все строки левой колонки из ответа API, без фильтров."""
     table_data = _find_table_data(payload or {})
     entries = _collect_entries(table_data) if table_data else []
+    return [(phrase, shows) for phrase, shows, _also in entries]
 
+
+def _filter_rows(entries: List[Tuple[str, int]], query: str, min_shows: int) -> List[Tuple[str, int]]:
+    """Отбросить фразы ниже порога, сам запрос и повторы."""
     seen: set[str] = set()
     rows: List[Tuple[str, int]] = []
-    base = query.lower().strip()
+    base = _phrase_key(query)
 
-    for phrase, shows, _also in entries:
+    for phrase, shows in entries:
         if shows < min_shows:
             continue
-        key = phrase.lower().strip()
+        key = _phrase_key(phrase)
         if not key or key == base or key in seen:
             continue
         seen.add(key)
@@ -109,6 +131,65 @@ async def _find_search_input(page):
     return None
 
 
+async def _query_page(page, query: str, min_shows: int, log) -> Optional[List[Tuple[str, int]]]:
+    """Запрос на уже открытой странице Wordstat. None — сессия потеряна."""
+    entries = await _query_page_raw(page, query, log)
+    if entries is None:
+        return None
+    rows = _filter_rows(entries, query, min_shows)
+    log(f"✓ '{query}' → найдено фраз: {len(rows)}")
+    return rows
+
+
+async def _query_page_raw(page, query: str, log) -> Optional[List[Tuple[str, int]]]:
+    """Вся левая колонка ответа без фильтров. None — сессия потеряна."""
+    if "passport.yandex" in (page.url or ""):
+        log(f"[warn] Wordstat перенаправил на авторизацию для запроса '{query}'")
+        return None
+
+    inp = await _find_search_input(page)
+    if not inp:
+        log(f"[warn] Поле поиска не найдено для запроса '{query}'")
+        return []
+
+    try:
+        await inp.click(timeout=2000)
+    except PlaywrightTimeout:
+        pass
+
+    try:
+        await inp.fill("")
+    except Exception:
+        pass
+
+    await inp.fill(query)
+
+    try:
+        async with page.expect_response(lambda r: API_SEARCH_PATH in r.url and r.status == 200, timeout=20000) as resp_info:
+            await page.keyboard.press("Enter")
+        response = await resp_info.value
+    except PlaywrightTimeout:
+        if "passport.yandex" in (page.url or ""):
+            log(f"[warn] Перенаправление на авторизацию после ввода '{query}'")
+            return None
+        log(f"[warn] Таймаут ответа Wordstat для запроса '{query}'")
+        return []
+
+    try:
+        payload = await response.json()
+    except Exception:
+        try:
+            payload = json.loads((await response.body()).decode("utf-8"))
+        except Exception:
+            payload = None
+
+    if not payload:
+        log(f"[warn] Пустой ответ для запроса '{query}'")
+        return []
+
+    return _raw_rows_from_json(payload)
+
+
 async def collect_one(context, query: str, min_shows: int, lr: int | None, log_callback=None) -> Optional[List[Tuple[str, int]]]:
     """
     Собрать фразы из левой колонки Wordstat для одного запроса
@@ -131,56 +212,151 @@ async def collect_one(context, query: str, min_shows: int, lr: int | None, log_c
 
     page = await _open_wordstat(context, lr)
     try:
-        if "passport.yandex" in (page.url or ""):
-            log(f"[warn] Wordstat перенаправил на авторизацию для запроса '{query}'")
-            return None
+        return await _query_page(page, query, min_shows, log)
+    finally:
+        await page.close()
 
-        inp = await _find_search_input(page)
-        if not inp:
-            log(f"[warn] Поле поиска не найдено для запроса '{query}'")
-            return []
 
-        try:
-            await inp.click(timeout=2000)
-        except PlaywrightTimeout:
-            pass
+def _stored_rows(query: str, region: int, min_shows: int, max_age: Optional[float]) -> Optional[List[Tuple[str, int]]]:
+    """Левая колонка из сохранённого ответа Wordstat (frequency-парсинг уже её получил)."""
+    snapshot = latest_payloads([query], region, max_age).get(_phrase_key(query))
+    if snapshot is None or not snapshot["popular"]:
+        return None
+    return _filter_rows([(entry["phrase"], entry["count"]) for entry in snapshot["popular"]], query, min_shows)
 
-        try:
-            await inp.fill("")
-        except Exception:
-            pass
 
-        await inp.fill(query)
+def _phrase_key(phrase: str) -> str:
+    return " ".join(phrase.lower().split())
 
-        try:
-            async with page.expect_response(lambda r: API_SEARCH_PATH in r.url and r.status == 200, timeout=20000) as resp_info:
-                await page.keyboard.press("Enter")
-            response = await resp_info.value
-        except PlaywrightTimeout:
-            if "passport.yandex" in (page.url or ""):
-                log(f"[warn] Перенаправление на авторизацию после ввода '{query}'")
-                return None
-            log(f"[warn] Таймаут ответа Wordstat для запроса '{query}'")
-            return []
 
-        try:
-            payload = await response.json()
-        except Exception:
-            try:
-                payload = json.loads((await response.body()).decode("utf-8"))
-            except Exception:
-                payload = None
+class FrontierCheckpoint:
+    """
+    Фронтир и результаты обхода в SQLite, чтобы после падения продолжить с места остановки.
 
-        if not payload:
-            log(f"[warn] Пустой ответ для запроса '{query}'")
-            return []
+    Запуск определяется run_id (хэш масок и параметров): повторный старт с теми же
+    параметрами подхватывает недообработанные запросы, после успешного завершения
+    записи запуска удаляются.
 
-        rows = _extract_rows_from_json(payload, query, min_shows)
-        log(f"✓ '{query}' → найдено фраз: {len(rows)}")
+    Методы вызываются из пула потоков (asyncio.to_thread), поэтому соединение
+    общее для потоков и защищено блокировкой.
+    """
 
-        return rows
-    finally:
-        await page.close()
+    def __init__(self, path: Path, run_id: str):
+        self.path = Path(path)
+        self.run_id = run_id
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS deep_frontier (
+                run_id TEXT NOT NULL,
+                phrase_key TEXT NOT NULL,
+                phrase TEXT NOT NULL,
+                base TEXT NOT NULL,
+                level INTEGER NOT NULL,
+                done INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (run_id, phrase_key)
+            );
+            CREATE TABLE IF NOT EXISTS deep_results (
+                run_id TEXT NOT NULL,
+                base TEXT NOT NULL,
+                level INTEGER NOT NULL,
+                parent TEXT NOT NULL,
+                phrase TEXT NOT NULL,
+                shows INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_deep_results_run ON deep_results(run_id);
+            """
+        )
+        self.conn.commit()
+
+    @staticmethod
+    def make_run_id(seeds: List[str], **params: Any) -> str:
+        blob = json.dumps({"seeds": sorted(_phrase_key(s) for s in seeds), **params}, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha1(blob.encode("utf-8")).hexdigest()[:16]
+
+    def load(self) -> Tuple[set, List[Tuple[str, str, int]], List[Dict[str, Any]]]:
+        """(все известные ключи, незавершённые запросы, уже собранные результаты)"""
+        visited: set[str] = set()
+        pending: List[Tuple[str, str, int]] = []
+        for key, phrase, base, level, done in self.conn.execute(
+            "SELECT phrase_key, phrase, base, level, done FROM deep_frontier WHERE run_id = ? ORDER BY level, rowid",
+            (self.run_id,),
+        ):
+            visited.add(key)
+            if not done:
+                pending.append((phrase, base, level))
+        results = [
+            {"base": base, "level": level, "parent": parent, "phrase": phrase, "shows": shows}
+            for base, level, parent, phrase, shows in self.conn.execute(
+                "SELECT base, level, parent, phrase, shows FROM deep_results WHERE run_id = ? ORDER BY rowid",
+                (self.run_id,),
+            )
+        ]
+        return visited, pending, results
+
+    def add_pending(self, items: List[Tuple[str, str, int]]) -> None:
+        with self._lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO deep_frontier (run_id, phrase_key, phrase, base, level) VALUES (?, ?, ?, ?, ?)",
+                [(self.run_id, _phrase_key(phrase), phrase, base, level) for phrase, base, level in items],
+            )
+
+    def complete(self, query: str, rows: List[Dict[str, Any]], children: List[Tuple[str, str, int]]) -> None:
+        """Одной транзакцией: запрос выполнен, его результаты и новые запросы фронтира."""
+        with self._lock, self.conn:
+            self.conn.execute(
+                "UPDATE deep_frontier SET done = 1 WHERE run_id = ? AND phrase_key = ?",
+                (self.run_id, _phrase_key(query)),
+            )
+            self.conn.executemany(
+                "INSERT INTO deep_results (run_id, base, level, parent, phrase, shows) VALUES (?, ?, ?, ?, ?, ?)",
+                [(self.run_id, r["base"], r["level"], r["parent"], r["phrase"], r["shows"]) for r in rows],
+            )
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO deep_frontier (run_id, phrase_key, phrase, base, level) VALUES (?, ?, ?, ?, ?)",
+                [(self.run_id, _phrase_key(phrase), phrase, base, level) for phrase, base, level in children],
+            )
+
+    def clear(self) -> None:
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM deep_frontier WHERE run_id = ?", (self.run_id,))
+            self.conn.execute("DELETE FROM deep_results WHERE run_id = ?", (self.run_id,))
+
+    def close(self) -> None:
+        with self._lock:
+            self.conn.close()
+
+
+def _default_checkpoint_path() -> Path:
+    try:
+        from ..core.db import DATA_DIR
+    except ImportError:
+        from core.db import DATA_DIR
+    return Path(DATA_DIR) / "deep_frontier.db"
+
+
+class _AccountSlot:
+    """Аккаунт: контекст, страницы-воркеры и ограничение частоты запросов."""
+
+    def __init__(self, name: str, ctx, min_interval: float):
+        self.name = name
+        self.ctx = ctx
+        self.pages: List[Any] = []
+        self.inactive = False
+        self.min_interval = min_interval
+        self.queries = 0
+        self._lock = asyncio.Lock()
+        self._next_at = 0.0
+
+    async def throttle(self) -> None:
+        async with self._lock:
+            wait = self._next_at - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self._next_at = time.monotonic() + self.min_interval
 
 
 async def deep_run_async(
@@ -193,11 +369,19 @@ async def deep_run_async(
     topk: int = 50,
     lr: int | None = None,
     log_callback=None,
-    progress_callback=None
+    progress_callback=None,
+    pages_per_account: int = PAGES_PER_ACCOUNT,
+    min_interval: float = ACCOUNT_MIN_INTERVAL,
+    checkpoint_path: Optional[Path] = None,
+    reuse_max_age: Optional[float] = None,
 ) -> List[Dict[str, Any]]:
     """
     Асинхронный парсинг вглубь для левой колонки Wordstat
 
+    Обход в ширину с общей очередью: все аккаунты работают одновременно
+    (pages_per_account постоянных вкладок на аккаунт), каждая фраза
+    запрашивается один раз на весь обход, фронтир сохраняется в SQLite.
+
     Args:
         seeds: Начальные фразы (маски)
         accounts: Список аккаунтов [{name, proxy}, ...]
@@ -209,6 +393,11 @@ async def deep_run_async(
         lr: ID региона Яндекса
         log_callback: Функция для логов log_callback(message: str)
         progress_callback: Функция для прогресса progress_callback(current: int, total: int)
+        pages_per_account: Сколько вкладок одного аккаунта работают параллельно
+        min_interval: Минимальный интервал между запросами одного аккаунта (сек)
+        checkpoint_path: Файл SQLite для чекпоинта фронтира (по умолчанию data/deep_frontier.db)
+        reuse_max_age: Возраст сохранённых ответов Wordstat, которые берём вместо запроса
+            (None — PAYLOAD_TTL, 0 — всегда запрашивать заново)
 
     Returns:
         Список результатов: [
@@ -222,11 +411,45 @@ async def deep_run_async(
         else:
             print(msg)
 
-    results: List[Dict[str, Any]] = []
     t0 = time.time()
+    region = lr or 225
+    reused = 0
+
+    run_id = FrontierCheckpoint.make_run_id(
+        seeds, depth=depth, min_shows=min_shows, expand_min=expand_min, topk=topk, lr=lr
+    )
+    checkpoint = FrontierCheckpoint(checkpoint_path or _default_checkpoint_path(), run_id)
+    visited, pending, results = checkpoint.load()
+    if pending or results:
+        log(f"♻️ Продолжение прерванного обхода: в очереди {len(pending)}, собрано {len(results)} фраз")
+    else:
+        fresh = []
+        for seed in seeds:
+            key = _phrase_key(seed)
+            if key and key not in visited:
+                visited.add(key)
+                fresh.append((seed.strip(), seed.strip(), 1))
+        checkpoint.add_pending(fresh)
+        pending = fresh
+
+    if not pending:
+        checkpoint.clear()
+        checkpoint.close()
+        return results
+
+    queue: "asyncio.Queue[Tuple[str, str, int]]" = asyncio.Queue()
+    for item in pending:
+        queue.put_nowait(item)
+    done_count = 0
+    attempts: Dict[str, int] = {}
+    failed: List[str] = []
+
+    def report_progress():
+        if progress_callback:
+            progress_callback(done_count, done_count + queue.qsize())
 
     async with async_playwright() as p:
-        contexts: List[Dict[str, Any]] = []
+        slots: List[_AccountSlot] = []
 
         log(f"🚀 Открытие браузеров: {len(accounts)} аккаунтов")
 
@@ -252,106 +475,137 @@ async def deep_run_async(
             try:
                 ctx = await p.chromium.launch_persistent_context(**launch_options)
 
-                # Проверяем авторизацию
+                # Проверяем авторизацию; страница остаётся первой рабочей вкладкой
                 page = await _open_wordstat(ctx, lr)
-                needs_login = "passport.yandex" in (page.url or "")
-                await page.close()
-
-                if needs_login:
+                if "passport.yandex" in (page.url or ""):
                     log(f"❌ [{acc['name']}] требуется авторизация, пропускаем")
                     await ctx.close()
                     continue
 
-                contexts.append({"name": acc["name"], "ctx": ctx, "inactive": False})
-                log(f"✓ [{acc['name']}] браузер готов")
+                slot = _AccountSlot(acc["name"], ctx, min_interval)
+                slot.pages.append(page)
+                for _ in range(max(1, pages_per_account) - 1):
+                    slot.pages.append(await _open_wordstat(ctx, lr))
+                slots.append(slot)
+                log(f"✓ [{acc['name']}] браузер готов ({len(slot.pages)} вкладок)")
             except Exception as e:
                 log(f"❌ [{acc['name']}] ошибка запуска: {e}")
                 continue
 
-        if not contexts:
+        if not slots:
             log("❌ Нет авторизованных аккаунтов для парсинга")
+            checkpoint.close()
             return results
 
         log(f"\n📊 Начало парсинга: {len(seeds)} масок, глубина={depth}, порог={min_shows}")
 
-        try:
-            idx = 0
-            total_queries = len(seeds)
-            current_query = 0
-
-            for base in seeds:
-                current_query += 1
-                if progress_callback:
-                    progress_callback(current_query, total_queries)
-
-                # Фильтруем активные контексты
-                contexts = [slot for slot in contexts if not slot.get("inactive")]
-                if not contexts:
-                    log("❌ Нет доступных аккаунтов для парсинга")
-                    break
-
-                # Выбираем контекст по кругу
-                slot = contexts[idx % len(contexts)]
-                idx += 1
-                ctx = slot["ctx"]
-                name = slot["name"]
-
-                log(f"\n🔍 [{name}] Обработка маски: '{base}' (глубина {depth})")
-
-                level = 1
-                frontier = [base]
-
-                while level <= depth and frontier and not slot.get("inactive"):
-                    log(f"  📂 Уровень {level}: фраз для проверки {len(frontier)}")
-                    next_fr = []
-
-                    for q in frontier:
-                        items = await collect_one(ctx, q, min_shows, lr, log_callback)
-
-                        if items is None:
-                            log(f"❌ [{name}] Сессия потеряна при запросе '{q}', аккаунт отключен")
-                            slot["inactive"] = True
-                            try:
-                                await slot["ctx"].close()
-                            except Exception:
-                                pass
-                            slot["ctx_closed"] = True
-                            break
-
-                        # Сохраняем результаты
-                        for ph, sh in items:
-                            results.append({
-                                "base": base,
-                                "level": level,
-                                "parent": q,
-                                "phrase": ph,
-                                "shows": sh
-                            })
-
-                        # Выбираем сильные фразы для следующего уровня
-                        strong = [ph for ph, sh in items if sh >= expand_min][:topk]
-                        next_fr.extend(strong)
-
-                        if strong:
-                            log(f"    ↳ '{q}' → {len(items)} фраз ({len(strong)} для расширения)")
-
-                    if slot.get("inactive"):
+        async def worker(slot: _AccountSlot, page) -> None:
+            nonlocal done_count, reused
+            while not slot.inactive:
+                q, base, level = await queue.get()
+                try:
+                    if slot.inactive:
+                        queue.put_nowait((q, base, level))
+                        break
+                    items = None
+                    if reuse_max_age != 0:
+                        items = await asyncio.to_thread(_stored_rows, q, region, min_shows, reuse_max_age)
+                    if items is not None:
+                        reused += 1
+                    else:
+                        await slot.throttle()
+                        entries = await _query_page_raw(page, q, log)
+                        slot.queries += 1
+                        items = None
+                        if entries is not None:
+                            items = _filter_rows(entries, q, min_shows)
+                            log(f"✓ '{q}' → найдено фраз: {len(items)}")
+                        if entries:
+                            # Сохраняем страницу целиком: другой порог min_shows
+                            # при повторном использовании получит все строки
+                            await asyncio.to_thread(store_payloads, [{
+                                "query": q,
+                                "region": region,
+                                "popular": [{"phrase": ph, "count": sh} for ph, sh in entries],
+                            }])
+
+                    if items is None:
+                        log(f"❌ [{slot.name}] Сессия потеряна при запросе '{q}', аккаунт отключен")
+                        slot.inactive = True
+                        queue.put_nowait((q, base, level))
                         break
 
-                    frontier = next_fr
-                    level += 1
-
+                    rows = [
+                        {"base": base, "level": level, "parent": q, "phrase": ph, "shows": sh}
+                        for ph, sh in items
+                    ]
+                    children: List[Tuple[str, str, int]] = []
+                    if level < depth:
+                        # Сильные фразы на следующий уровень, если их ещё никто не запрашивал
+                        for ph in [ph for ph, sh in items if sh >= expand_min][:topk]:
+                            key = _phrase_key(ph)
+                            if key and key not in visited:
+                                visited.add(key)
+                                children.append((ph, base, level + 1))
+
+                    await asyncio.to_thread(checkpoint.complete, q, rows, children)
+                    results.extend(rows)
+                    for child in children:
+                        queue.put_nowait(child)
+                    done_count += 1
+                    report_progress()
+
+                    if children:
+                        log(f"    ↳ [{slot.name}] '{q}' → {len(items)} фраз ({len(children)} для расширения)")
+                except Exception as exc:
+                    # Сбой страницы/навигации: запрос (и всё его поддерево) не теряем
+                    key = _phrase_key(q)
+                    attempts[key] = attempts.get(key, 0) + 1
+                    if attempts[key] < QUERY_MAX_ATTEMPTS:
+                        log(f"[warn] [{slot.name}] ошибка запроса '{q}' (попытка {attempts[key]}), вернули в очередь: {exc}")
+                        queue.put_nowait((q, base, level))
+                    else:
+                        # Остаётся незавершённым в чекпоинте — подхватится при следующем запуске
+                        log(f"[warn] [{slot.name}] запрос '{q}' не выполнен после {attempts[key]} попыток: {exc}")
+                        failed.append(q)
+                finally:
+                    queue.task_done()
+
+        workers = [
+            asyncio.create_task(worker(slot, page))
+            for slot in slots
+            for page in slot.pages
+        ]
+        joiner = asyncio.create_task(queue.join())
+        all_workers = asyncio.gather(*workers, return_exceptions=True)
+        finished = False
+        try:
+            # Воркеры выходят сами, только когда все аккаунты потеряли сессию
+            await asyncio.wait({joiner, all_workers}, return_when=asyncio.FIRST_COMPLETED)
+            finished = joiner.done() and not joiner.cancelled()
+            if not finished:
+                log(f"❌ Нет доступных аккаунтов для парсинга, в очереди осталось {queue.qsize()} запросов")
         finally:
+            joiner.cancel()
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(joiner, all_workers, return_exceptions=True)
+
             log("\n🔒 Закрытие браузеров...")
-            for slot in contexts:
-                if slot.get("ctx_closed"):
-                    continue
+            for slot in slots:
                 try:
-                    await slot["ctx"].close()
+                    await slot.ctx.close()
                 except Exception:
                     pass
 
+    if finished and not failed:
+        checkpoint.clear()
+    elif failed:
+        log(f"⚠️ Не выполнено запросов: {len(failed)} — они останутся в чекпоинте для повторного запуска")
+    checkpoint.close()
+
     duration = round(time.time() - t0, 1)
-    log(f"\n✅ Парсинг завершен: {len(results)} фраз за {duration} сек")
+    per_account = ", ".join(f"{slot.name}: {slot.queries}" for slot in slots)
+    log(f"\n✅ Парсинг завершен: {len(results)} фраз за {duration} сек ({done_count} запросов, из сохранённых ответов {reused}; {per_account})")
 
     return results
@@ -12,8 +12,9 @@ from typing import Optional
 
 from playwright.async_api import async_playwright, Page
 
-from ..core.db import SessionLocal
-from ..core.models import Account, FrequencyResult
+from ..core.db import SessionLocal, get_db_connection
+from ..core.models import Account
+from ..core.result_sink import get_result_sink
 from ..services.sessions import _build_proxy_config
 
 
@@ -50,27 +51,14 @@ async def parse_frequency_with_session(
         proxy = account.proxy
         account_name = account.name
     
-    # Обеспечиваем записи в БД для всех масок
-    with SessionLocal() as session:
-        for mask in masks:
-            mask_norm = mask.strip()
-            if not mask_norm:
-                continue
-            
-            existing = session.query(FrequencyResult).filter(
-                FrequencyResult.mask == mask_norm,
-                FrequencyResult.region == region
-            ).first()
-            
-            if not existing:
-                session.add(FrequencyResult(
-                    mask=mask_norm,
-                    region=region,
-                    status='queued',
-                    freq_total=0,
-                    freq_exact=0
-                ))
-        session.commit()
+    # Обеспечиваем записи в БД для всех масок (одной транзакцией)
+    now = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S.%f")
+    with get_db_connection() as conn:
+        conn.executemany(
+            "INSERT OR IGNORE INTO freq_results (mask, region, status, freq_total, freq_exact, attempts, created_at, updated_at) "
+            "VALUES (?, ?, 'queued', 0, 0, 0, ?, ?)",
+            [(mask.strip(), region, now, now) for mask in masks if mask.strip()],
+        )
     
     stats = {
         'success': 0,
@@ -149,6 +137,9 @@ async def parse_frequency_with_session(
                 stats['errors'].append(f"{mask_norm}: {error_msg}")
         
         await context.close()
+
+    # Дописываем хвост буфера результатов до возврата
+    await get_result_sink().aflush()
     
     # Обновляем last_used_at аккаунта
     with SessionLocal() as session:
@@ -215,36 +206,10 @@ async def _parse_single_mask(page: Page, mask: str, region: int) -> Optional[int
 
 
 def _update_status(mask: str, region: int, status: str, error: Optional[str] = None) -> None:
-    """Обновляет статус записи в БД"""
-    with SessionLocal() as session:
-        result = session.query(FrequencyResult).filter(
-            FrequencyResult.mask == mask,
-            FrequencyResult.region == region
-        ).first()
-        
-        if result:
-            result.status = status
-            result.updated_at = datetime.utcnow()
-            result.attempts += 1
-            
-            if error:
-                result.error = error
-            
-            session.commit()
+    """Обновляет статус записи в БД (через буфер, пишется пачкой)"""
+    get_result_sink().status(mask, region, status, error=error)
 
 
 def _update_result(mask: str, region: int, freq: int) -> None:
-    """Записывает результат в БД"""
-    with SessionLocal() as session:
-        result = session.query(FrequencyResult).filter(
-            FrequencyResult.mask == mask,
-            FrequencyResult.region == region
-        ).first()
-        
-        if result:
-            result.status = 'ok'
-            result.freq_total = freq
-            result.freq_exact = 0  # Пока не парсим точную
-            result.error = None
-            result.updated_at = datetime.utcnow()
-            session.commit()
+    """Записывает результат в БД (через буфер, пишется пачкой)"""
+    get_result_sink().result(mask, region, freq, freq_exact=0)  # Пока не парсим точную
@@ -225,6 +225,22 @@ class TurboWordstatParser:
         except Exception as exc:
             print(f"[AUTH] Ошибка чтения accounts.json: {exc}")
 
+    @property
+    def _proxy_id(self) -> Optional[str]:
+        """id прокси из ProxyManager, под которым идёт сессия (None — телеметрию не пишем)."""
+        return self._proxy_item.id if self._proxy_item else None
+
+    def _report_navigation(self, response, started: float) -> None:
+        if response is not None and response.status == 403:
+            self.proxy_manager.report_ban(self._proxy_id, "HTTP 403")
+        else:
+            self.proxy_manager.report_success(self._proxy_id, (time.perf_counter() - started) * 1000)
+
+    def _on_request_failed(self, request) -> None:
+        # Обрыв запроса к API — сбой транспорта, то есть прокси
+        if "wordstat/api" in request.url:
+            self.proxy_manager.report_failure(self._proxy_id, request.failure or "request failed")
+
     async def init_browser(self) -> None:
         """Запуск persistent контекста Chrome с привязанным прокси"""
         from ..services.proxy_manager import proxy_preflight
@@ -286,7 +302,11 @@ class TurboWordstatParser:
             host = proxy_obj.server.split("://")[-1].split(":")[0]
             launch_kwargs["args"].append(f"--host-resolver-rules=MAP * ~NOTFOUND , EXCLUDE {host}")
 
-        context = await self.playwright.chromium.launch_persistent_context(**launch_kwargs)
+        try:
+            context = await self.playwright.chromium.launch_persistent_context(**launch_kwargs)
+        except Exception as exc:
+            self.proxy_manager.report_failure(self._proxy_id, str(exc))
+            raise
         await context.add_init_script(script=WORDSTAT_FETCH_NORMALIZER_SCRIPT)
         for existing_page in context.pages:
             await existing_page.add_init_script(script=WORDSTAT_FETCH_NORMALIZER_SCRIPT)
@@ -306,11 +326,17 @@ class TurboWordstatParser:
             await page.evaluate(WORDSTAT_FETCH_NORMALIZER_SCRIPT)
         except Exception:
             pass
-        await page.goto(
-            "https://wordstat.yandex.ru/#!/?region=225",
-            wait_until="domcontentloaded",
-            timeout=30000,
-        )
+        started = time.perf_counter()
+        try:
+            response = await page.goto(
+                "https://wordstat.yandex.ru/#!/?region=225",
+                wait_until="domcontentloaded",
+                timeout=30000,
+            )
+        except Exception as exc:
+            self.proxy_manager.report_failure(self._proxy_id, str(exc))
+            raise
+        self._report_navigation(response, started)
         self.pages = [page]
 
     async def setup_tabs(self) -> None:
@@ -332,15 +358,19 @@ class TurboWordstatParser:
             _ensure_wired(page)
             self.page_mapping[i] = page
             if "wordstat.yandex.ru" not in page.url:
+                started = time.perf_counter()
                 try:
-                    await page.goto(
+                    response = await page.goto(
                         "https://wordstat.yandex.ru/#!/?region=225",
                         wait_until="domcontentloaded",
                         timeout=30000,
                     )
-                    await asyncio.sleep(2)
                 except Exception as exc:
+                    self.proxy_manager.report_failure(self._proxy_id, str(exc))
                     print(f"[TURBO] Tab {i}: ошибка загрузки Wordstat: {exc}")
+                else:
+                    self._report_navigation(response, started)
+                    await asyncio.sleep(2)
         print(f"[TURBO] Все {len(self.pages)} вкладок готовы")
 
     async def wait_wordstat_ready(self, page: Page) -> None:
@@ -349,6 +379,8 @@ class TurboWordstatParser:
     async def handle_response(self, response, tab_id: int) -> None:
         if "wordstat/api" not in response.url:
             return
+        if response.status == 403:
+            self.proxy_manager.report_ban(self._proxy_id, "HTTP 403")
 
         data = await _parse_wordstat_json(response)
         if not data:
@@ -389,7 +421,9 @@ class TurboWordstatParser:
         _ensure_wired(page)
         results = []
         page.on("response", lambda response: asyncio.create_task(self.handle_response(response, tab_id)))
+        page.on("requestfailed", self._on_request_failed)
         for phrase in phrases:
+            started = time.time()
             try:
                 await page.fill("input.textinput__control", phrase)
                 await page.keyboard.press("Enter")
@@ -404,6 +438,7 @@ class TurboWordstatParser:
                     await asyncio.sleep(wait_delay)
                 if captured:
                     self.aimd.on_success()
+                    self.proxy_manager.report_success(self._proxy_id, (time.time() - started) * 1000)
                 else:
                     print(f"[TURBO] Tab {tab_id}: не получили ответ для «{phrase}»")
                     self.aimd.on_error()
@@ -206,7 +206,10 @@ def set_status(account_id: int, status: str, *, cooldown_minutes: int | None = N
 
 
 def mark_captcha(account_id: int, minutes: int = 30) -> Account:
-    return set_status(account_id, 'captcha', cooldown_minutes=minutes, captcha_increment=True)
+    account = set_status(account_id, 'captcha', cooldown_minutes=minutes, captcha_increment=True)
+    # Капча снижает вес прокси аккаунта при выдаче
+    ProxyManager.instance().report_captcha(account.proxy_id)
+    return account
 
 
 def mark_cooldown(account_id: int, minutes: int = 10) -> Account:
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""Потоковая выгрузка результатов частотности в CSV/XLSX."""
+from __future__ import annotations
+
+import csv
+import io
+import tempfile
+import zlib
+from datetime import datetime
+from typing import Iterable, Iterator, Sequence
+
+try:
+    from openpyxl import Workbook
+    XLSX_AVAILABLE = True
+except ImportError:
+    XLSX_AVAILABLE = False
+
+FILE_CHUNK_SIZE = 64 * 1024
+
+
+def _cell(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return "" if value is None else value
+
+
+def iter_csv(
+    headers: Sequence[str],
+    batches: Iterable[Sequence[Sequence]],
+    *,
+    delimiter: str = ";",
+    encoding: str = "utf-8",
+) -> Iterator[bytes]:
+    """Кодировать пачки строк в CSV, отдавая по одному куску байт на пачку."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=delimiter)
+    writer.writerow(headers)
+    for batch in batches:
+        writer.writerows([_cell(value) for value in row] for row in batch)
+        yield buffer.getvalue().encode(encoding)
+        buffer.seek(0)
+        buffer.truncate()
+    tail = buffer.getvalue()
+    if tail:
+        yield tail.encode(encoding)
+
+
+def iter_xlsx(
+    headers: Sequence[str],
+    batches: Iterable[Sequence[Sequence]],
+    *,
+    sheet_title: str = "Data",
+) -> Iterator[bytes]:
+    """Собрать XLSX в write-only режиме openpyxl через временный файл и отдать его кусками."""
+    if not XLSX_AVAILABLE:
+        raise RuntimeError("openpyxl не установлен: выгрузка в XLSX недоступна")
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title=sheet_title)
+    sheet.append(list(headers))
+    for batch in batches:
+        for row in batch:
+            sheet.append([_cell(value) for value in row])
+    with tempfile.TemporaryFile() as handle:
+        workbook.save(handle)
+        handle.seek(0)
+        while True:
+            chunk = handle.read(FILE_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+
+
+def iter_gzip(chunks: Iterable[bytes], *, level: int = 6) -> Iterator[bytes]:
+    """Сжать поток кусков в gzip на лету."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+__all__ = ["XLSX_AVAILABLE", "iter_csv", "iter_xlsx", "iter_gzip"]
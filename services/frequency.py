@@ -1,52 +1,131 @@
 from __future__ import annotations
 
 import asyncio
+import base64
+import json
 from datetime import datetime
-from typing import Iterable
+from itertools import islice
+from typing import Iterable, Iterator
 
-from sqlalchemy import select, func
+from sqlalchemy import and_, column, func, literal, or_, select, text, tuple_
+from sqlalchemy.engine import Row
 
 try:
-    from ..core.db import SessionLocal, get_db_connection
+    from ..core.db import SessionLocal, get_db_connection, get_read_connection
     from ..core.models import FrequencyResult
 except ImportError:
-    from core.db import SessionLocal, get_db_connection
+    from core.db import SessionLocal, get_db_connection, get_read_connection
     from core.models import FrequencyResult
 
 QUEUE_STATUSES = ("queued", "running", "ok", "error")
 
+# Поля сортировки API -> колонки freq_results. Все колонки NOT NULL,
+# поэтому сравнение кортежей (поле, id) корректно для кейсет-пагинации.
+SORT_FIELDS = {
+    "updatedAt": FrequencyResult.updated_at,
+    "createdAt": FrequencyResult.created_at,
+    "id": FrequencyResult.id,
+    "phrase": FrequencyResult.mask,
+    "ws": FrequencyResult.freq_total,
+    "freq": FrequencyResult.freq_total,
+    "wsQuotes": FrequencyResult.freq_quotes,
+    "freqQuotes": FrequencyResult.freq_quotes,
+    "wsExact": FrequencyResult.freq_exact,
+    "freqExact": FrequencyResult.freq_exact,
+    "status": FrequencyResult.status,
+}
+
+SEARCH_MODES = ("substring", "prefix", "tokens")
+
+# Триграммный индекс не умеет искать подстроки короче трёх символов
+FTS_MIN_TOKEN = 3
+
+RESULT_COLUMNS = (
+    FrequencyResult.id,
+    FrequencyResult.mask,
+    FrequencyResult.region,
+    FrequencyResult.status,
+    FrequencyResult.freq_total,
+    FrequencyResult.freq_quotes,
+    FrequencyResult.freq_exact,
+    FrequencyResult.group,
+    FrequencyResult.attempts,
+    FrequencyResult.error,
+    FrequencyResult.updated_at,
+)
+
+
+ENQUEUE_CHUNK_SIZE = 5000
+
+_ENQUEUE_SQL = """
+    INSERT INTO freq_results (
+        mask, region, status, freq_total, freq_quotes, freq_exact,
+        attempts, error, created_at, updated_at
+    )
+    VALUES (?, ?, 'queued', 0, 0, 0, 0, NULL, ?, ?)
+    ON CONFLICT(mask, region) DO UPDATE SET
+        status = 'queued',
+        freq_total = 0,
+        freq_quotes = 0,
+        freq_exact = 0,
+        error = NULL,
+        attempts = 0,
+        updated_at = excluded.updated_at
+    WHERE freq_results.status != 'ok'
+      AND freq_results.updated_at != excluded.updated_at
+"""
+
+
+def _db_timestamp(value: datetime | None = None) -> str:
+    """Формат DateTime, в котором SQLAlchemy хранит даты в SQLite."""
+    return (value or datetime.utcnow()).strftime("%Y-%m-%d %H:%M:%S.%f")
+
+
+def enqueue_masks_bulk(
+    masks: Iterable[str],
+    region: int,
+    *,
+    chunk_size: int = ENQUEUE_CHUNK_SIZE,
+) -> dict[str, int]:
+    """Поставить маски в очередь пачечным upsert'ом.
+
+    ``masks`` читается лениво (подходит генератор строк файла) и уходит в БД
+    пачками по ``chunk_size`` через executemany. Новые маски вставляются,
+    существующие не-ok сбрасываются в queued, ok-строки и повторы пропускаются.
+    Вся загрузка пишется с одной меткой updated_at - по ней повтор маски в
+    следующем чанке отличается от строки, которую надо сбросить.
+
+    Чанк читается и разбирается до захвата писателя, а каждая пачка - своя
+    короткая транзакция: медленный источник (загрузка файла клиентом) не
+    держит общий писатель процесса и не блокирует остальные записи.
+    """
+    stats = {"inserted": 0, "reset": 0, "skipped": 0}
+    normalized = (mask for mask in ((raw or "").strip() for raw in masks) if mask)
+    now = _db_timestamp()
+    while True:
+        raw_chunk = list(islice(normalized, chunk_size))
+        if not raw_chunk:
+            break
+        chunk = list(dict.fromkeys(raw_chunk))
+        # Повторы внутри чанка - такие же пропуски, как и между чанками
+        stats["skipped"] += len(raw_chunk) - len(chunk)
+        with get_db_connection() as conn:
+            max_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM freq_results").fetchone()[0]
+            cursor = conn.executemany(_ENQUEUE_SQL, ((mask, region, now, now) for mask in chunk))
+            changed = max(cursor.rowcount, 0)
+            # Новые строки получают id выше прежнего максимума (AUTOINCREMENT)
+            inserted = conn.execute(
+                "SELECT COUNT(*) FROM freq_results WHERE id > ?", (max_id,)
+            ).fetchone()[0]
+        stats["inserted"] += inserted
+        stats["reset"] += changed - inserted
+        stats["skipped"] += len(chunk) - changed
+    return stats
+
 
 def enqueue_masks(masks: Iterable[str], region: int) -> int:
     """Add masks into freq_results, resetting non-ok rows to queued."""
-    inserted = 0
-    normalized = []
-    for raw in masks:
-        mask = (raw or "").strip()
-        if mask:
-            normalized.append(mask)
-    if not normalized:
-        return 0
-    with SessionLocal() as session:
-        for mask in normalized:
-            stmt = select(FrequencyResult).where(
-                FrequencyResult.mask == mask,
-                FrequencyResult.region == region,
-            )
-            existing = session.scalars(stmt).first()
-            if existing:
-                if existing.status != 'ok':
-                    existing.status = 'queued'
-                    existing.freq_total = 0
-                    existing.freq_quotes = 0
-                    existing.freq_exact = 0
-                    existing.error = None
-                    existing.attempts = 0
-                    existing.updated_at = datetime.utcnow()
-            else:
-                session.add(FrequencyResult(mask=mask, region=region))
-                inserted += 1
-        session.commit()
-    return inserted
+    return enqueue_masks_bulk(masks, region)["inserted"]
 
 
 def list_results(status: str | None = None, limit: int = 500) -> list[dict]:
@@ -74,6 +153,206 @@ def list_results(status: str | None = None, limit: int = 500) -> list[dict]:
         ]
 
 
+_fts_ready = False
+
+
+def _fts_available() -> bool:
+    """Есть ли FTS5-индекс freq_results_fts (создаётся в ensure_schema)."""
+    global _fts_ready
+    if not _fts_ready:
+        with SessionLocal() as session:
+            _fts_ready = session.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'freq_results_fts'")
+            ).first() is not None
+    return _fts_ready
+
+
+def _fts_quote(token: str) -> str:
+    return '"' + token.replace('"', '""') + '"'
+
+
+def _search_clause(search: str | None, mode: str = "substring"):
+    """Условие поиска по маске и группе.
+
+    substring - вся строка как подстрока маски или группы;
+    prefix    - маска начинается со строки;
+    tokens    - каждое слово встречается в маске или группе (AND).
+
+    Кандидаты отбираются по триграммному FTS5-индексу, короткие (< 3 символов)
+    фрагменты добиваются точной проверкой через casefold()/instr().
+    """
+    needle = " ".join((search or "").split()).casefold()
+    if not needle:
+        return None
+    if mode not in SEARCH_MODES:
+        mode = "substring"
+
+    mask = func.casefold(FrequencyResult.mask)
+    group = func.casefold(func.coalesce(FrequencyResult.group, ""))
+    if mode == "tokens":
+        fragments = list(dict.fromkeys(needle.split()))
+    else:
+        fragments = [needle]
+
+    conditions = []
+    fts_terms = []
+    for fragment in fragments:
+        if mode == "prefix":
+            conditions.append(func.instr(mask, fragment) == 1)
+            column_filter = "mask : "
+        else:
+            conditions.append(or_(func.instr(mask, fragment) > 0, func.instr(group, fragment) > 0))
+            column_filter = ""
+        if len(fragment) >= FTS_MIN_TOKEN:
+            fts_terms.append(column_filter + _fts_quote(fragment))
+
+    if fts_terms and _fts_available():
+        candidates = text(
+            "SELECT rowid FROM freq_results_fts WHERE freq_results_fts MATCH :fts_query"
+        ).bindparams(fts_query=" AND ".join(fts_terms)).columns(column("rowid"))
+        conditions.insert(0, FrequencyResult.id.in_(candidates))
+    return and_(*conditions)
+
+
+def encode_cursor(sort_field: str, sort_value, row_id: int) -> str:
+    """Непрозрачный курсор: поле сортировки, его значение и id последней строки."""
+    if isinstance(sort_value, datetime):
+        sort_value = {"dt": sort_value.isoformat()}
+    raw = json.dumps([sort_field, sort_value, row_id], ensure_ascii=False, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, sort_field: str) -> tuple:
+    """(значение сортировки, id) из курсора; ValueError - битый или от другой сортировки."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        field, value, row_id = json.loads(raw.decode("utf-8"))
+        if isinstance(value, dict):
+            value = datetime.fromisoformat(value["dt"])
+        row_id = int(row_id)
+    except (TypeError, ValueError, KeyError, UnicodeDecodeError) as exc:
+        raise ValueError("invalid cursor") from exc
+    if field != sort_field:
+        raise ValueError("cursor belongs to another sort order")
+    return value, row_id
+
+
+def query_results(
+    *,
+    search: str | None = None,
+    status: str | None = None,
+    group: str | None = None,
+    search_mode: str = "substring",
+    sort_field: str = "updatedAt",
+    sort_order: str = "desc",
+    cursor: str | None = None,
+    offset: int = 0,
+    limit: int = 500,
+) -> tuple[list[Row], str | None]:
+    """Одна выборка freq_results с фильтрами и кейсет-пагинацией.
+
+    Курсор хранит пару (поле сортировки, id) последней строки предыдущей
+    страницы - см. ``encode_cursor``. Сравнение идёт по самой паре, а не по
+    строке в таблице, поэтому удаление этой строки между страницами не рвёт
+    пагинацию; страница стоит O(limit) при любой глубине. Возвращает лёгкие
+    Row-кортежи и курсор следующей страницы. Режимы поиска - см.
+    ``_search_clause``. Битый курсор - ValueError.
+    """
+    if sort_field not in SORT_FIELDS:
+        sort_field = "updatedAt"
+    sort_col = SORT_FIELDS[sort_field]
+    descending = (sort_order or "desc").lower() != "asc"
+
+    stmt = select(*RESULT_COLUMNS, sort_col.label("sort_value"))
+    if status and status != "all":
+        stmt = stmt.where(FrequencyResult.status == status)
+    if group:
+        stmt = stmt.where(FrequencyResult.group == group)
+    search_clause = _search_clause(search, search_mode)
+    if search_clause is not None:
+        stmt = stmt.where(search_clause)
+
+    if cursor is not None:
+        anchor_value, anchor_id = decode_cursor(cursor, sort_field)
+        position = tuple_(sort_col, FrequencyResult.id)
+        bound = tuple_(literal(anchor_value, sort_col.type), literal(anchor_id, FrequencyResult.id.type))
+        stmt = stmt.where(position < bound if descending else position > bound)
+    elif offset:
+        stmt = stmt.offset(offset)
+
+    if descending:
+        stmt = stmt.order_by(sort_col.desc(), FrequencyResult.id.desc())
+    else:
+        stmt = stmt.order_by(sort_col.asc(), FrequencyResult.id.asc())
+    stmt = stmt.limit(limit + 1)
+
+    with SessionLocal() as session:
+        rows = session.execute(stmt).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = None
+    if rows and has_more:
+        next_cursor = encode_cursor(sort_field, rows[-1].sort_value, rows[-1].id)
+    return rows, next_cursor
+
+
+# Колонки выгрузки: ключ API -> (заголовок, колонка freq_results)
+EXPORT_COLUMNS = {
+    "id": ("id", FrequencyResult.id),
+    "phrase": ("phrase", FrequencyResult.mask),
+    "ws": ("WS", FrequencyResult.freq_total),
+    "wsQuotes": ('"WS"', FrequencyResult.freq_quotes),
+    "wsExact": ("!WS", FrequencyResult.freq_exact),
+    "group": ("group", FrequencyResult.group),
+    "region": ("region", FrequencyResult.region),
+    "status": ("status", FrequencyResult.status),
+    "updatedAt": ("updatedAt", FrequencyResult.updated_at),
+}
+
+EXPORT_BATCH_SIZE = 2000
+
+
+def resolve_export_columns(columns: Iterable[str] | None = None) -> list[str]:
+    """Известные ключи колонок в исходном порядке; пустой выбор - все колонки."""
+    keys = [key for key in (columns or ()) if key in EXPORT_COLUMNS]
+    return list(dict.fromkeys(keys)) or list(EXPORT_COLUMNS)
+
+
+def iter_export_batches(
+    *,
+    columns: list[str] | None = None,
+    search: str | None = None,
+    search_mode: str = "substring",
+    status: str | None = None,
+    group: str | None = None,
+    region: int | None = None,
+    limit: int | None = None,
+    batch_size: int = EXPORT_BATCH_SIZE,
+) -> Iterator[list[Row]]:
+    """Читать freq_results пачками через fetchmany - память не зависит от объёма выгрузки."""
+    stmt = select(*(EXPORT_COLUMNS[key][1] for key in resolve_export_columns(columns)))
+    if status and status != "all":
+        stmt = stmt.where(FrequencyResult.status == status)
+    if group:
+        stmt = stmt.where(FrequencyResult.group == group)
+    if region is not None:
+        stmt = stmt.where(FrequencyResult.region == region)
+    search_clause = _search_clause(search, search_mode)
+    if search_clause is not None:
+        stmt = stmt.where(search_clause)
+    stmt = stmt.order_by(FrequencyResult.id)
+    if limit:
+        stmt = stmt.limit(limit)
+
+    with SessionLocal() as session:
+        result = session.execute(stmt)
+        while True:
+            batch = result.fetchmany(batch_size)
+            if not batch:
+                break
+            yield batch
+
+
 def counts_by_status() -> dict[str, int]:
     with SessionLocal() as session:
         stmt = select(FrequencyResult.status, func.count(FrequencyResult.id)).group_by(FrequencyResult.status)
@@ -252,7 +531,7 @@ async def parse_batch_wordstat(
 
 async def get_saved_frequencies(region: int = 225) -> list[dict]:
     """Get all saved frequency results from database."""
-    with get_db_connection() as conn:
+    with get_read_connection() as conn:
         cursor = conn.execute(
             "SELECT phrase, freq, region FROM frequencies WHERE region = ? ORDER BY freq DESC",
             (region,)
@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+"""
+Кэш частотностей Wordstat с TTL.
+
+Ключ — (нормализованная фраза, режим ws/qws/bws, регион). Сначала смотрим в
+LRU в памяти процесса, затем в таблицу ``wordstat_cache``; для режима без
+записи в кэше подходит и свежая ``ok``-строка ``freq_results``. В парсер
+уходят только промахи.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Iterable
+
+try:
+    from ..core.db import get_db_connection, get_read_connection
+except ImportError:
+    from core.db import get_db_connection, get_read_connection
+
+logger = logging.getLogger(__name__)
+
+# Свежесть значения в секундах (по умолчанию неделя)
+CACHE_TTL = float(os.getenv("KEYSET_FREQ_CACHE_TTL", str(7 * 24 * 3600)))
+CACHE_MEMORY_SIZE = 50_000
+CACHE_MODES = ("ws", "qws", "bws")
+_LOOKUP_CHUNK = 500
+
+# Режим -> колонка freq_results, из которой можно взять значение
+_RESULT_COLUMNS = {"ws": "freq_total", "qws": "freq_quotes", "bws": "freq_exact"}
+
+
+def normalize_query(phrase: str) -> str:
+    """Ключ кэша: регистр и лишние пробелы не влияют на частотность."""
+    return " ".join(phrase.casefold().split())
+
+
+class FrequencyCache:
+    """LRU в памяти поверх SQLite-хранилища."""
+
+    def __init__(self, ttl: float = CACHE_TTL, max_entries: int = CACHE_MEMORY_SIZE):
+        self.ttl = ttl
+        self.max_entries = max(1, max_entries)
+        self._memory: "OrderedDict[tuple[str, str, int], tuple[int, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+        self.stored = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = self.memory_hits + self.db_hits
+            total = hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "db_hits": self.db_hits,
+                "misses": self.misses,
+                "stored": self.stored,
+                "hit_rate": round(hits / total, 4) if total else 0.0,
+                "memory_entries": len(self._memory),
+                "ttl": self.ttl,
+            }
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self.memory_hits = self.db_hits = self.misses = self.stored = 0
+
+    def clear_memory(self) -> None:
+        with self._lock:
+            self._memory.clear()
+
+    # ------------------------------------------------------------------ read
+
+    def lookup(
+        self,
+        phrases: Iterable[str],
+        mode: str,
+        region: int,
+        max_age: float | None = None,
+    ) -> dict[str, int]:
+        """Свежие значения для фраз: {нормализованная фраза: частота}."""
+        ttl = self.ttl if max_age is None else max_age
+        cutoff = time.time() - ttl
+        keys = list(dict.fromkeys(normalize_query(p) for p in phrases if p and p.strip()))
+        found: dict[str, int] = {}
+        pending: list[str] = []
+
+        with self._lock:
+            for key in keys:
+                entry = self._memory.get((key, mode, region))
+                if entry is not None and entry[1] >= cutoff:
+                    self._memory.move_to_end((key, mode, region))
+                    found[key] = entry[0]
+                else:
+                    pending.append(key)
+            self.memory_hits += len(found)
+
+        from_db: dict[str, tuple[int, float]] = {}
+        if pending and ttl > 0:
+            try:
+                from_db = self._lookup_db(pending, mode, region, cutoff)
+            except sqlite3.Error as exc:
+                logger.warning("Кэш частотностей недоступен: %s", exc)
+
+        with self._lock:
+            for key, (value, fetched_at) in from_db.items():
+                found[key] = value
+                self._remember(key, mode, region, value, fetched_at)
+            self.db_hits += len(from_db)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def _lookup_db(self, keys: list[str], mode: str, region: int, cutoff: float) -> dict[str, tuple[int, float]]:
+        result: dict[str, tuple[int, float]] = {}
+        column = _RESULT_COLUMNS.get(mode)
+        cutoff_ts = datetime.utcfromtimestamp(cutoff).strftime("%Y-%m-%d %H:%M:%S.%f")
+        with get_read_connection() as conn:
+            for start in range(0, len(keys), _LOOKUP_CHUNK):
+                chunk = keys[start:start + _LOOKUP_CHUNK]
+                marks = ",".join("?" * len(chunk))
+                rows = conn.execute(
+                    f"SELECT query_key, value, fetched_at FROM wordstat_cache "
+                    f"WHERE mode = ? AND region = ? AND fetched_at >= ? AND query_key IN ({marks})",
+                    (mode, region, cutoff, *chunk),
+                ).fetchall()
+                for key, value, fetched_at in rows:
+                    result[key] = (int(value), float(fetched_at))
+
+                missing = [key for key in chunk if key not in result]
+                if not missing or column is None:
+                    continue
+                # Значения, собранные основной очередью; 0 в qws/bws означает «не собирали»
+                marks = ",".join("?" * len(missing))
+                rows = conn.execute(
+                    f"SELECT mask, {column}, updated_at FROM freq_results "
+                    f"WHERE region = ? AND status = 'ok' AND updated_at >= ? AND mask IN ({marks})",
+                    (region, cutoff_ts, *missing),
+                ).fetchall()
+                for mask, value, updated_at in rows:
+                    if value is None or (mode != "ws" and not value):
+                        continue
+                    result[mask] = (int(value), _parse_timestamp(updated_at))
+        return result
+
+    # ----------------------------------------------------------------- write
+
+    def store(self, values: dict[str, int], mode: str, region: int) -> None:
+        """Сохранить свежие значения (ключи — исходные или нормализованные фразы)."""
+        if not values:
+            return
+        now = time.time()
+        rows = [(normalize_query(phrase), mode, region, int(value), now) for phrase, value in values.items()]
+        with self._lock:
+            for key, _, _, value, _ in rows:
+                self._remember(key, mode, region, value, now)
+            self.stored += len(rows)
+        try:
+            with get_db_connection() as conn:
+                conn.executemany(
+                    "INSERT INTO wordstat_cache (query_key, mode, region, value, fetched_at) VALUES (?, ?, ?, ?, ?) "
+                    "ON CONFLICT(query_key, mode, region) DO UPDATE SET value = excluded.value, fetched_at = excluded.fetched_at",
+                    rows,
+                )
+        except sqlite3.Error as exc:
+            logger.warning("Не удалось сохранить кэш частотностей: %s", exc)
+
+    def invalidate(self, phrases: Iterable[str], region: int | None = None) -> None:
+        keys = {normalize_query(p) for p in phrases if p}
+        with self._lock:
+            for cache_key in [k for k in self._memory if k[0] in keys and (region is None or k[2] == region)]:
+                del self._memory[cache_key]
+        if not keys:
+            return
+        try:
+            with get_db_connection() as conn:
+                sql = "DELETE FROM wordstat_cache WHERE query_key = ?"
+                if region is None:
+                    conn.executemany(sql, [(key,) for key in keys])
+                else:
+                    conn.executemany(sql + " AND region = ?", [(key, region) for key in keys])
+        except sqlite3.Error as exc:
+            logger.warning("Не удалось сбросить кэш частотностей: %s", exc)
+
+    def _remember(self, key: str, mode: str, region: int, value: int, fetched_at: float) -> None:
+        self._memory[(key, mode, region)] = (value, fetched_at)
+        self._memory.move_to_end((key, mode, region))
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+
+def _parse_timestamp(value) -> float:
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        stamp = datetime.fromisoformat(str(value))
+    except ValueError:
+        return time.time()
+    return (stamp - datetime(1970, 1, 1)).total_seconds()
+
+
+frequency_cache = FrequencyCache()
+
+
+__all__ = ["FrequencyCache", "frequency_cache", "normalize_query", "CACHE_TTL", "CACHE_MODES"]
@@ -17,8 +17,9 @@ from concurrent.futures import ThreadPoolExecutor, as_completed
 from dataclasses import dataclass, field
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple, Any
+from typing import Any, Deque, Dict, Iterable, List, Optional, Set, Tuple
 import threading
+from collections import deque
 from queue import Queue
 
 from playwright.async_api import BrowserContext
@@ -349,6 +350,127 @@ class ParsingTask:
         }
 
 
+SHARD_BATCH_SIZE = 100  # Сколько фраз профиль забирает из общей очереди за раз
+SHARD_MAX_ATTEMPTS = 3  # Сколько профилей может попробовать одну фразу
+SHARD_MAX_FAILURES = 3  # Пачек подряд без результата (или падений сессии), после которых профиль снимается
+
+
+class PhraseWorkQueue:
+    """
+    Общая очередь фраз для режима шардирования.
+
+    Профили забирают фразы пачками: кто закончил раньше — берёт следующую пачку.
+    Несобранные фразы (падение профиля, NO_DATA) возвращаются в хвост очереди
+    и достаются другим профилям, пока не исчерпан лимит попыток. Профиль не
+    получает обратно фразы, которые сам не смог собрать, пока работу держат
+    другие профили: сломанный профиль не крутится на одной и той же пачке.
+    """
+
+    def __init__(
+        self,
+        phrases: List[str],
+        batch_size: int = SHARD_BATCH_SIZE,
+        max_attempts: int = SHARD_MAX_ATTEMPTS,
+    ):
+        unique = [phrase.strip() for phrase in dict.fromkeys(phrases) if phrase and phrase.strip()]
+        self.total = len(unique)
+        self.batch_size = max(1, batch_size)
+        self.max_attempts = max(1, max_attempts)
+        self.failed: List[str] = []
+        self._pending = deque(unique)
+        self._attempts: Dict[str, int] = {}
+        # фраза -> профили, у которых она уже не собралась
+        self._tried: Dict[str, Set[str]] = {}
+        self._in_flight = 0
+        self._done = 0
+        self._closed = False
+        self._cond = threading.Condition()
+
+    def take(self, worker: Optional[str] = None) -> List[str]:
+        """
+        Забрать следующую пачку. Пока другие профили держат фразы в работе,
+        ждём — они могут вернуть их в очередь. Пустой список — работы больше нет.
+        """
+        with self._cond:
+            while not self._closed:
+                if self._pending:
+                    # Свои же возвращённые фразы — только когда больше некому
+                    batch = self._pick(worker, allow_own=not self._in_flight)
+                    if batch:
+                        self._in_flight += len(batch)
+                        return batch
+                elif not self._in_flight:
+                    return []
+                self._cond.wait(timeout=1.0)
+            return []
+
+    def _pick(self, worker: Optional[str], allow_own: bool) -> List[str]:
+        size = min(self.batch_size, len(self._pending))
+        if worker is None or allow_own:
+            return [self._pending.popleft() for _ in range(size)]
+        batch: List[str] = []
+        rest: Deque[str] = deque()
+        for phrase in self._pending:
+            if len(batch) < size and worker not in self._tried.get(phrase, ()):
+                batch.append(phrase)
+            else:
+                rest.append(phrase)
+        self._pending = rest
+        return batch
+
+    def release(self, batch: List[str], done: Iterable[str], worker: Optional[str] = None) -> List[str]:
+        """Отчитаться по пачке: собранные фразы закрыть, остальные вернуть в хвост."""
+        done_set = set(done)
+        requeued: List[str] = []
+        with self._cond:
+            self._in_flight -= len(batch)
+            for phrase in batch:
+                if phrase in done_set:
+                    self._done += 1
+                    self._tried.pop(phrase, None)
+                    continue
+                attempts = self._attempts.get(phrase, 0) + 1
+                self._attempts[phrase] = attempts
+                if attempts >= self.max_attempts:
+                    self.failed.append(phrase)
+                    self._tried.pop(phrase, None)
+                else:
+                    self._pending.append(phrase)
+                    requeued.append(phrase)
+                    if worker is not None:
+                        self._tried.setdefault(phrase, set()).add(worker)
+            self._cond.notify_all()
+        return requeued
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def remaining(self) -> List[str]:
+        """Фразы, которые так и не были собраны (остались в очереди или исчерпали попытки)."""
+        with self._cond:
+            return list(self._pending) + list(self.failed)
+
+    @property
+    def progress(self) -> int:
+        with self._cond:
+            return int(self._done * 100 / self.total) if self.total else 100
+
+
+def _load_turbo_parser():
+    """Импортировать turbo_parser_10tabs из корня проекта."""
+    import sys
+    turbo_path = PROJECT_ROOT
+    if str(turbo_path) not in sys.path:
+        sys.path.insert(0, str(turbo_path))
+    try:
+        from turbo_parser_improved import turbo_parser_10tabs
+    except ImportError:
+        from turbo_parser_10tabs import turbo_parser_10tabs  # type: ignore
+    return turbo_parser_10tabs
+
+
 class MultiParserManager:
     """Менеджер для управления множественными парсерами"""
     
@@ -364,6 +486,7 @@ class MultiParserManager:
         self.log_queue = Queue()
         self._stop_event = threading.Event()
         self._lock = threading.Lock()
+        self.work_queues: List[PhraseWorkQueue] = []
         
         # Директории для сохранения результатов
         self.results_dir = RESULTS_DIR
@@ -396,19 +519,33 @@ class MultiParserManager:
         logger.info(f"Created task {task_id} for {profile_email} with {len(phrases)} phrases")
         return task
         
-    def submit_tasks(self, profiles: List[Dict], phrases: List[str]) -> List[str]:
+    def submit_tasks(
+        self,
+        profiles: List[Dict],
+        phrases: List[str],
+        *,
+        mode: str = "shard",
+        batch_size: int = SHARD_BATCH_SIZE,
+    ) -> List[str]:
         """
         Отправить задачи на выполнение
         
         Args:
             profiles: Список профилей с данными
             phrases: Список фраз для парсинга
+            mode: "shard" (по умолчанию) — фразы делятся между профилями через
+                  общую очередь; "duplicate" — прежнее поведение, каждый
+                  профиль парсит весь список
+            batch_size: Размер пачки, которую профиль забирает из очереди
             
         Returns:
             Список task_id созданных задач
         """
         task_ids = []
         futures = {}
+        work_queue = PhraseWorkQueue(phrases, batch_size=batch_size) if mode == "shard" else None
+        if work_queue is not None:
+            self.work_queues.append(work_queue)
         
         for profile in profiles:
             # Создаем задачу
@@ -416,12 +553,15 @@ class MultiParserManager:
                 profile_email=profile['email'],
                 profile_path=profile['profile_path'],
                 proxy_uri=profile.get('proxy'),
-                phrases=phrases
+                phrases=[] if work_queue is not None else phrases
             )
             task_ids.append(task.task_id)
             
             # Отправляем на выполнение
-            future = self.executor.submit(self._run_parser_task, task)
+            if work_queue is not None:
+                future = self.executor.submit(self._run_shard_worker, task, work_queue)
+            else:
+                future = self.executor.submit(self._run_parser_task, task)
             futures[future] = task.task_id
             
         # Запускаем обработку результатов в отдельном потоке
@@ -453,12 +593,7 @@ class MultiParserManager:
             
             try:
                 # Импортируем парсер
-                import sys
-                turbo_path = PROJECT_ROOT
-                if str(turbo_path) not in sys.path:
-                    sys.path.insert(0, str(turbo_path))
-                    
-                from turbo_parser_10tabs import turbo_parser_10tabs
+                turbo_parser_10tabs = _load_turbo_parser()
                 
                 # Запускаем парсинг
                 results = loop.run_until_complete(
@@ -506,6 +641,126 @@ class MultiParserManager:
             
             raise
             
+    def _run_shard_worker(self, task: ParsingTask, work_queue: PhraseWorkQueue) -> Dict[str, Any]:
+        """
+        Одна сессия браузера на профиль: пачки из общей очереди подаются в неё,
+        пока очередь не опустеет. Несобранная пачка возвращается в очередь;
+        профиль снимается только после SHARD_MAX_FAILURES неудач подряд.
+        """
+        held: List[str] = []  # пачка, выданная сессии и ещё не закрытая
+        failures = 0
+        drained = False
+
+        def next_batch() -> List[str]:
+            nonlocal held, drained
+            if self._stop_event.is_set() or failures >= SHARD_MAX_FAILURES:
+                return []
+            batch = work_queue.take(task.task_id)
+            if not batch:
+                drained = True
+            held = batch
+            with self._lock:
+                task.phrases.extend(batch)
+            return batch
+
+        def on_batch(batch: List[str], results: Dict[str, Any]) -> None:
+            nonlocal held, failures
+            statuses = getattr(results, "meta", {}).get("statuses", {})
+            collected = {
+                phrase: value
+                for phrase, value in results.items()
+                if statuses.get(phrase, "OK") == "OK"
+            }
+            requeued = work_queue.release(batch, collected, worker=task.task_id)
+            held = []
+            # Пачка без единой фразы — вероятно бан/капча/разлогин
+            failures = 0 if collected else failures + 1
+
+            with self._lock:
+                task.results.update(collected)
+                task.progress = work_queue.progress
+            if requeued:
+                self._log(
+                    f"{task.profile_email}: {len(requeued)} phrases returned to the queue",
+                    level="WARNING",
+                    task_id=task.task_id,
+                )
+
+        try:
+            with self._lock:
+                task.status = "running"
+                task.started_at = datetime.now()
+
+            self._log(f"Starting shard worker for {task.profile_email}", level="INFO", task_id=task.task_id)
+
+            if not task.profile_path.exists():
+                raise FileNotFoundError(f"Profile not found: {task.profile_path}")
+
+            turbo_parser_10tabs = _load_turbo_parser()
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+            try:
+                while not drained and failures < SHARD_MAX_FAILURES and not self._stop_event.is_set():
+                    try:
+                        loop.run_until_complete(
+                            turbo_parser_10tabs(
+                                account_name=task.profile_email,
+                                profile_path=task.profile_path,
+                                phrases=[],
+                                headless=False,
+                                proxy_uri=task.proxy_uri,
+                                next_batch=next_batch,
+                                on_batch=on_batch,
+                            )
+                        )
+                    except Exception as e:
+                        self._log(
+                            f"{task.profile_email}: browser session failed: {e}",
+                            level="WARNING",
+                            task_id=task.task_id,
+                        )
+                        failures += 1
+                    else:
+                        if not drained and failures < SHARD_MAX_FAILURES:
+                            # Сессия не поднялась (авторизация, вкладки) — попробуем ещё раз
+                            failures += 1
+                    if held:
+                        work_queue.release(held, (), worker=task.task_id)
+                        held = []
+            finally:
+                loop.close()
+
+            if not drained and failures >= SHARD_MAX_FAILURES:
+                self._save_results(task)
+                raise RuntimeError(f"profile failed {failures} batches in a row")
+
+            with self._lock:
+                task.status = "completed"
+                task.completed_at = datetime.now()
+
+            self._log(
+                f"Shard worker completed for {task.profile_email}: {len(task.results)} results",
+                level="SUCCESS",
+                task_id=task.task_id
+            )
+            self._save_results(task)
+            return task.results
+
+        except Exception as e:
+            if held:
+                work_queue.release(held, (), worker=task.task_id)
+            with self._lock:
+                task.status = "failed"
+                task.error_message = str(e)
+                task.completed_at = datetime.now()
+
+            self._log(
+                f"Shard worker failed for {task.profile_email}: {str(e)}",
+                level="ERROR",
+                task_id=task.task_id
+            )
+            raise
+
     def _process_futures(self, futures: Dict):
         """Обработка завершенных задач"""
         for future in as_completed(futures):
@@ -614,6 +869,8 @@ class MultiParserManager:
         # Также логируем через logger
         if level == "ERROR":
             logger.error(message)
+        elif level == "WARNING":
+            logger.warning(message)
         elif level == "SUCCESS":
             logger.info(f"✅ {message}")
         else:
@@ -655,6 +912,8 @@ class MultiParserManager:
     def stop(self):
         """Остановить менеджер"""
         self._stop_event.set()
+        for work_queue in self.work_queues:
+            work_queue.close()
         self.executor.shutdown(wait=False)
         logger.info("MultiParserManager stopped")
         
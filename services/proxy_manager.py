@@ -1,14 +1,17 @@
 from __future__ import annotations
 
+import atexit
 import base64
 import json
+import logging
+import random
 import threading
 import time
 import urllib.request
 import uuid
 from dataclasses import asdict, dataclass, field
 from pathlib import Path
-from typing import Dict, Iterable, List, Optional
+from typing import Dict, Iterable, List, Optional, Tuple
 import os
 
 try:
@@ -20,6 +23,22 @@ _runtime_root = Path(os.environ.get("KEYSET_RUNTIME_ROOT", Path(__file__).resolv
 CONFIG_PATH = _runtime_root / "config" / "proxies.json"
 CONFIG_PATH.parent.mkdir(parents=True, exist_ok=True)
 
+LOGGER = logging.getLogger(__name__)
+
+# Изменения конфига пишутся отложенно, пачкой; телеметрия — ещё реже
+SAVE_DELAY = 0.5
+TELEMETRY_SAVE_DELAY = 30.0
+TELEMETRY_FIELDS = ("last_check", "last_ip", "last_latency_ms")
+
+# Телеметрия здоровья живёт только в памяти и в proxies.json не пишется
+HEALTH_ALPHA = 0.3  # вес нового наблюдения в EWMA
+LATENCY_REF_MS = 1500.0  # задержка, при которой множитель скорости равен 0.5
+CIRCUIT_FAILURES = 3  # неудач подряд до размыкания
+CIRCUIT_COOLDOWN = 60.0  # первая пауза, при повторных размыканиях удваивается
+CIRCUIT_MAX_COOLDOWN = 900.0
+PREFLIGHT_TTL = 300.0
+PREFLIGHT_FAIL_TTL = 30.0
+
 
 def _normalize_server(proxy_type: str, server: str) -> str:
     value = server.strip()
@@ -45,6 +64,7 @@ class Proxy:
     notes: str = ""
     last_check: Optional[float] = None
     last_ip: Optional[str] = None
+    last_latency_ms: Optional[int] = None
     _in_use: int = field(default=0, repr=False)
 
     @property
@@ -91,6 +111,34 @@ class Proxy:
         return " ".join(parts)
 
 
+@dataclass
+class ProxyHealth:
+    latency_ms: Optional[float] = None
+    error_rate: float = 0.0
+    block_rate: float = 0.0
+    successes: int = 0
+    failures: int = 0
+    captchas: int = 0
+    bans: int = 0
+    consecutive_failures: int = 0
+    open_until: float = 0.0
+    cooldown: float = 0.0
+    trial: bool = False
+    last_error: Optional[str] = None
+    updated_at: Optional[float] = None
+
+    def score(self) -> float:
+        """0..1: скорость × доля успехов × доля запросов без капчи/бана."""
+        latency = self.latency_ms if self.latency_ms is not None else LATENCY_REF_MS
+        speed = LATENCY_REF_MS / (LATENCY_REF_MS + latency)
+        return max(0.01, speed * (1.0 - self.error_rate) * (1.0 - 0.9 * self.block_rate))
+
+    def state(self, now: float) -> str:
+        if not self.open_until:
+            return "closed"
+        return "open" if now < self.open_until else "half-open"
+
+
 class ProxyManager:
     _instance: Optional["ProxyManager"] = None
     _singleton_lock = threading.Lock()
@@ -98,8 +146,14 @@ class ProxyManager:
     def __init__(self, path: Path = CONFIG_PATH):
         self.path = path
         self._items: Dict[str, Proxy] = {}
+        self._health: Dict[str, ProxyHealth] = {}
         self._lock = threading.RLock()
+        self._write_lock = threading.Lock()
+        self._dirty = False
+        self._save_timer: Optional[threading.Timer] = None
+        self._save_due: Optional[float] = None
         self._load()
+        atexit.register(self.flush)
 
     @classmethod
     def instance(cls) -> "ProxyManager":
@@ -206,21 +260,68 @@ class ProxyManager:
         if created:
             self._save_unlocked()
 
-    def _save_unlocked(self) -> None:
-        payload = {
-            "$schema": "https://json-schema.org/draft/2020-12/schema",
-            "proxies": [],
-        }
+    def _payload_unlocked(self) -> Dict[str, object]:
+        records = []
         for proxy in self._items.values():
-            record = asdict(proxy).copy()
+            record = asdict(proxy)
             record.pop("_in_use", None)
-            payload["proxies"].append(record)
+            records.append(record)
+        return {
+            "$schema": "https://json-schema.org/draft/2020-12/schema",
+            "proxies": records,
+        }
+
+    def _write(self, payload: Dict[str, object]) -> None:
+        """Атомарная запись: временный файл, fsync, os.replace."""
         self.path.parent.mkdir(parents=True, exist_ok=True)
-        self.path.write_text(json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8")
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        with tmp.open("w", encoding="utf-8") as fh:
+            fh.write(json.dumps(payload, ensure_ascii=False, indent=2))
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp, self.path)
+
+    def _save_unlocked(self) -> None:
+        self._dirty = False
+        self._write(self._payload_unlocked())
+
+    def _mark_dirty(self, delay: float = SAVE_DELAY) -> None:
+        """Запланировать запись не позже чем через *delay* секунд."""
+        self._dirty = True
+        due = time.monotonic() + delay
+        if self._save_timer is not None and self._save_due is not None and self._save_due <= due:
+            return
+        if self._save_timer is not None:
+            self._save_timer.cancel()
+        self._save_due = due
+        self._save_timer = threading.Timer(delay, self.flush)
+        self._save_timer.daemon = True
+        self._save_timer.start()
+
+    def flush(self) -> None:
+        """Записать накопленные изменения сейчас (таймер вызывает то же самое)."""
+        with self._write_lock:
+            with self._lock:
+                if self._save_timer is not None:
+                    self._save_timer.cancel()
+                self._save_timer = None
+                self._save_due = None
+                if not self._dirty:
+                    return
+                self._dirty = False
+                payload = self._payload_unlocked()
+            # Сериализация и диск — уже без блокировки выдачи прокси
+            try:
+                self._write(payload)
+            except OSError as exc:
+                LOGGER.error("Failed to save %s: %s", self.path, exc)
+                with self._lock:
+                    self._dirty = True
 
     def _save(self) -> None:
         with self._lock:
-            self._save_unlocked()
+            self._dirty = True
+        self.flush()
 
     # ------------------------------------------------------------------ #
     # CRUD
@@ -251,44 +352,107 @@ class ProxyManager:
             if existing:
                 proxy._in_use = existing._in_use
             self._items[proxy.id] = proxy
-            self._save_unlocked()
+            self._mark_dirty()
         return proxy
 
     def delete(self, proxy_id: str) -> None:
         with self._lock:
             self._items.pop(proxy_id, None)
-            self._save_unlocked()
+            self._health.pop(proxy_id, None)
+            self._mark_dirty()
 
     def save_many(self, proxies: Iterable[Proxy]) -> None:
-        for proxy in proxies:
-            self.upsert(proxy)
+        """Upsert пачкой с одной перезаписью файла."""
+        with self._lock:
+            for proxy in proxies:
+                existing = self._items.get(proxy.id)
+                if existing:
+                    proxy._in_use = existing._in_use
+                self._items[proxy.id] = proxy
+            self._mark_dirty()
+
+    def update_telemetry(self, proxy_id: str, **fields: object) -> None:
+        """Обновить last_check/last_ip/last_latency_ms без срочной записи на диск."""
+        unknown = set(fields) - set(TELEMETRY_FIELDS)
+        if unknown:
+            raise ValueError(f"Not telemetry fields: {sorted(unknown)}")
+        with self._lock:
+            proxy = self._items.get(proxy_id)
+            if proxy is None:
+                return
+            for name, value in fields.items():
+                setattr(proxy, name, value)
+            self._mark_dirty(TELEMETRY_SAVE_DELAY)
+
+    def fill_geo(self, proxy_id: str, geo: str) -> bool:
+        """Проставить найденную проверкой страну, если geo ещё не задан.
+
+        Меняет только поле geo живой записи: правки, сделанные во время
+        проверки, не затираются, удалённый прокси не воскресает.
+        """
+        with self._lock:
+            proxy = self._items.get(proxy_id)
+            if proxy is None or proxy.geo or not geo:
+                return False
+            proxy.geo = geo
+            self._mark_dirty()
+            return True
 
     # ------------------------------------------------------------------ #
     # Allocation helpers
     # ------------------------------------------------------------------ #
     def acquire(self, proxy_id: Optional[str] = None, *, geo: Optional[str] = None) -> Optional[Proxy]:
+        """Выдать прокси.
+
+        Явно указанный *proxy_id* выдаётся, если он включён и не исчерпал
+        max_concurrent. Иначе кандидат выбирается случайно с весом
+        «здоровье × свободная ёмкость»; прокси с разомкнутым предохранителем
+        пропускаются, а после паузы получают одну пробную выдачу.
+        """
         with self._lock:
-            candidates: List[Proxy] = []
             if proxy_id and proxy_id in self._items:
                 proxy = self._items[proxy_id]
-                if proxy.enabled:
-                    candidates = [proxy]
-            else:
-                candidates = [p for p in self._items.values() if p.enabled]
-                if geo:
-                    geo_lower = geo.lower()
-                    geo_filtered = [p for p in candidates if (p.geo or "").lower() == geo_lower]
-                    if geo_filtered:
-                        candidates = geo_filtered
-            candidates.sort(key=lambda item: item._in_use)
-
+                if not proxy.enabled or self._at_limit(proxy):
+                    return None
+                return self._take(proxy)
+
+            candidates = [p for p in self._items.values() if p.enabled]
+            if geo:
+                geo_lower = geo.lower()
+                geo_filtered = [p for p in candidates if (p.geo or "").lower() == geo_lower]
+                if geo_filtered:
+                    candidates = geo_filtered
+
+            now = time.time()
+            pool: List[Proxy] = []
+            weights: List[float] = []
             for proxy in candidates:
-                limit = proxy.max_concurrent or 0
-                if limit and proxy._in_use >= limit:
+                if self._at_limit(proxy):
                     continue
-                proxy._in_use += 1
-                return Proxy(**{**asdict(proxy), "_in_use": proxy._in_use})
-        return None
+                health = self._health.get(proxy.id)
+                if health is not None:
+                    state = health.state(now)
+                    if state == "open" or (state == "half-open" and health.trial):
+                        continue
+                limit = proxy.max_concurrent or 0
+                free = 1.0 - proxy._in_use / limit if limit else 1.0 / (1 + proxy._in_use)
+                pool.append(proxy)
+                weights.append((health.score() if health else ProxyHealth().score()) * max(free, 0.01))
+            if not pool:
+                return None
+            return self._take(random.choices(pool, weights)[0])
+
+    @staticmethod
+    def _at_limit(proxy: Proxy) -> bool:
+        limit = proxy.max_concurrent or 0
+        return bool(limit) and proxy._in_use >= limit
+
+    def _take(self, proxy: Proxy) -> Proxy:
+        health = self._health.get(proxy.id)
+        if health is not None and health.state(time.time()) == "half-open":
+            health.trial = True
+        proxy._in_use += 1
+        return Proxy(**{**asdict(proxy), "_in_use": proxy._in_use})
 
     def release(self, proxy: Optional[Proxy]) -> None:
         if proxy is None:
@@ -297,6 +461,104 @@ class ProxyManager:
             stored = self._items.get(proxy.id)
             if stored:
                 stored._in_use = max(0, stored._in_use - 1)
+            health = self._health.get(proxy.id)
+            if health is not None:
+                health.trial = False
+
+    # ------------------------------------------------------------------ #
+    # Health telemetry
+    # ------------------------------------------------------------------ #
+    def report_success(self, proxy_id: Optional[str], latency_ms: Optional[float] = None) -> None:
+        self._record(proxy_id, ok=True, latency_ms=latency_ms)
+
+    def report_failure(self, proxy_id: Optional[str], error: Optional[str] = None) -> None:
+        self._record(proxy_id, ok=False, error=error)
+
+    def report_captcha(self, proxy_id: Optional[str]) -> None:
+        """Парсер упёрся в капчу: прокси жив, но помечен площадкой.
+
+        Меняет только block_rate и счётчик капч: ни успехом, ни неудачей
+        капча не считается и предохранитель не трогает.
+        """
+        if not proxy_id:
+            return
+        with self._lock:
+            if proxy_id not in self._items:
+                return
+            health = self._health.setdefault(proxy_id, ProxyHealth())
+            health.updated_at = time.time()
+            health.block_rate = (1 - HEALTH_ALPHA) * health.block_rate + HEALTH_ALPHA
+            health.captchas += 1
+
+    def report_ban(self, proxy_id: Optional[str], error: Optional[str] = None) -> None:
+        """Бан/403 от площадки: предохранитель размыкается сразу."""
+        self._record(proxy_id, ok=False, error=error or "banned", blocked=True)
+
+    def health(self, proxy_id: str) -> Optional[Dict[str, object]]:
+        with self._lock:
+            health = self._health.get(proxy_id)
+            if health is None:
+                return None
+            payload: Dict[str, object] = asdict(health)
+            payload["score"] = health.score()
+            payload["state"] = health.state(time.time())
+            return payload
+
+    def _record(
+        self,
+        proxy_id: Optional[str],
+        *,
+        ok: bool,
+        latency_ms: Optional[float] = None,
+        error: Optional[str] = None,
+        blocked: bool = False,
+    ) -> None:
+        if not proxy_id:
+            return
+        tripped: Optional[Proxy] = None
+        with self._lock:
+            proxy = self._items.get(proxy_id)
+            if proxy is None:
+                return
+            health = self._health.setdefault(proxy_id, ProxyHealth())
+            now = time.time()
+            alpha = HEALTH_ALPHA
+            health.updated_at = now
+            health.trial = False
+            if latency_ms is not None:
+                health.latency_ms = (
+                    float(latency_ms)
+                    if health.latency_ms is None
+                    else (1 - alpha) * health.latency_ms + alpha * latency_ms
+                )
+            health.error_rate = (1 - alpha) * health.error_rate + alpha * (0.0 if ok else 1.0)
+            health.block_rate = (1 - alpha) * health.block_rate + alpha * (1.0 if blocked else 0.0)
+            if blocked:
+                health.bans += 1
+            if ok:
+                health.successes += 1
+                health.consecutive_failures = 0
+                health.open_until = 0.0
+                health.cooldown = 0.0
+                return
+            health.failures += 1
+            health.last_error = error
+            state = health.state(now)
+            if state == "open":
+                # Запоздалые ответы запросов, выданных до размыкания
+                return
+            health.consecutive_failures += 1
+            if state == "half-open":
+                # Пробная выдача не удалась — пауза удваивается
+                health.cooldown = min(CIRCUIT_MAX_COOLDOWN, health.cooldown * 2 or CIRCUIT_COOLDOWN)
+            elif blocked or health.consecutive_failures >= CIRCUIT_FAILURES:
+                health.cooldown = CIRCUIT_COOLDOWN
+            else:
+                return
+            health.open_until = now + health.cooldown
+            tripped = proxy
+        if tripped is not None:
+            invalidate_preflight(tripped)
 
     # ------------------------------------------------------------------ #
     # Utilities
@@ -314,7 +576,7 @@ class ProxyManager:
             )
         return options
 
-def test_proxy(self, proxy: Proxy, timeout: float = 10.0) -> Dict[str, object]:
+    def test_proxy(self, proxy: Proxy, timeout: float = 10.0) -> Dict[str, object]:
         handler = urllib.request.ProxyHandler(
             {
                 "http": proxy.uri(include_credentials=True),
@@ -332,17 +594,46 @@ def test_proxy(self, proxy: Proxy, timeout: float = 10.0) -> Dict[str, object]:
                 ip = response.read().decode("utf-8").strip()
         except Exception as exc:
             elapsed = int((time.perf_counter() - start) * 1000)
+            self.report_failure(proxy.id, str(exc))
+            self.update_telemetry(proxy.id, last_check=time.time(), last_latency_ms=elapsed)
             return {"ok": False, "error": str(exc), "latency_ms": elapsed}
         else:
             elapsed = int((time.perf_counter() - start) * 1000)
+            self.report_success(proxy.id, elapsed)
             proxy.last_ip = ip
             proxy.last_check = time.time()
-            self.upsert(proxy)
+            proxy.last_latency_ms = elapsed
+            self.update_telemetry(proxy.id, last_ip=ip, last_check=proxy.last_check, last_latency_ms=elapsed)
             return {"ok": True, "ip": ip, "latency_ms": elapsed}
 
 
-def proxy_preflight(proxy: Optional[Proxy], *, timeout: float = 10.0) -> Dict[str, Optional[str]]:
-    """Лёгкая проверка доступности прокси (без запуска браузера)."""
+_preflight_cache: Dict[Tuple[str, str, str], Tuple[float, Dict[str, Optional[str]]]] = {}
+_preflight_locks: Dict[Tuple[str, str, str], threading.Lock] = {}
+_preflight_guard = threading.Lock()
+
+
+def _preflight_key(proxy: Proxy) -> Tuple[str, str, str]:
+    return (proxy.server, proxy.username or "", proxy.password or "")
+
+
+def invalidate_preflight(proxy: Proxy) -> None:
+    with _preflight_guard:
+        _preflight_cache.pop(_preflight_key(proxy), None)
+
+
+def proxy_preflight(
+    proxy: Optional[Proxy],
+    *,
+    timeout: float = 10.0,
+    max_age: Optional[float] = None,
+) -> Dict[str, Optional[str]]:
+    """Лёгкая проверка доступности прокси (без запуска браузера).
+
+    Результат кешируется: успешный на PREFLIGHT_TTL, неудачный на
+    PREFLIGHT_FAIL_TTL (*max_age* задаёт свой предел, 0 — проверить заново).
+    Параллельные проверки одного прокси ждут одну. Исход уходит в телеметрию
+    ProxyManager, а размыкание предохранителя сбрасывает кеш.
+    """
     if proxy is None:
         return {"ok": True, "ip": None, "error": None}
 
@@ -358,21 +649,44 @@ def proxy_preflight(proxy: Optional[Proxy], *, timeout: float = 10.0) -> Dict[st
         # urllib не умеет SOCKS, отдадим проверку браузеру
         return {"ok": True, "ip": None, "error": None}
 
-    handler = urllib.request.ProxyHandler({"http": server, "https": server})
-    opener = urllib.request.build_opener(handler)
-    if proxy.username:
-        creds = f"{proxy.username}:{proxy.password or ''}".encode("utf-8")
-        opener.addheaders = [("Proxy-Authorization", f"Basic {base64.b64encode(creds).decode('ascii')}")]
+    key = _preflight_key(proxy)
+    with _preflight_guard:
+        lock = _preflight_locks.setdefault(key, threading.Lock())
+    with lock:
+        cached = _preflight_cache.get(key)
+        if cached is not None:
+            checked_at, result = cached
+            ttl = max_age if max_age is not None else (PREFLIGHT_TTL if result["ok"] else PREFLIGHT_FAIL_TTL)
+            if time.time() - checked_at < ttl:
+                return dict(result)
+
+        handler = urllib.request.ProxyHandler({"http": server, "https": server})
+        opener = urllib.request.build_opener(handler)
+        if proxy.username:
+            creds = f"{proxy.username}:{proxy.password or ''}".encode("utf-8")
+            opener.addheaders = [("Proxy-Authorization", f"Basic {base64.b64encode(creds).decode('ascii')}")]
 
-    try:
-        with opener.open("https://api.ipify.org", timeout=timeout) as response:
-            ip = response.read().decode("utf-8").strip()
-            return {"ok": True, "ip": ip, "error": None}
-    except Exception as exc:
-        return {"ok": False, "ip": None, "error": str(exc)}
+        start = time.perf_counter()
+        try:
+            with opener.open("https://api.ipify.org", timeout=timeout) as response:
+                ip = response.read().decode("utf-8").strip()
+            result = {"ok": True, "ip": ip, "error": None}
+        except Exception as exc:
+            result = {"ok": False, "ip": None, "error": str(exc)}
+        elapsed = (time.perf_counter() - start) * 1000
+        with _preflight_guard:
+            _preflight_cache[key] = (time.time(), result)
+
+    manager = ProxyManager._instance
+    if manager is not None:
+        if result["ok"]:
+            manager.report_success(proxy.id, elapsed)
+        else:
+            manager.report_failure(proxy.id, result["error"])
+    return dict(result)
 
 
-__all__ = ["Proxy", "ProxyManager", "proxy_preflight"]
+__all__ = ["Proxy", "ProxyHealth", "ProxyManager", "proxy_preflight", "invalidate_preflight"]
 
 
 
@@ -59,6 +59,21 @@ def collect_depth(
     regions: list[int],
     profile: str | None,
 ) -> list[dict]:
+    # Сохранённые ответы закрывают часть фраз, остальные уходят в парсер
+    rows: list[dict] = []
+    stored = _call(
+        "services.wordstat_payloads",
+        "stored_depth",
+        phrases,
+        column=column,
+        pages=pages,
+        regions=regions,
+    )
+    if stored is not None:
+        rows, phrases = stored
+        if not phrases:
+            return rows
+
     for module, func in [
         ("services.frequency", "collect_depth"),
         ("workers.full_pipeline_worker", "collect_depth"),
@@ -73,10 +88,10 @@ def collect_depth(
             profile=profile,
         )
         if payload is not None:
-            return payload
+            return rows + payload
 
     # fallback — echo the phrases with dummy counts
-    return [
+    return rows + [
         {
             "phrase": phrase,
             "count": random.randint(0, 200),
@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+"""
+Хранилище ответов /wordstat/api, пойманных при парсинге частотности.
+
+Каждый ответ уже содержит левую колонку (table.items — «что ищут со словом»)
+и правую (table.related — «похожие запросы»). Сохраняем их компактно
+(zlib-сжатый JSON пар [фраза, показы]) с ключом (запрос, регион, fetched_at),
+чтобы расширение и парсинг вглубь брали данные отсюда, а не парсили заново.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import sqlite3
+import time
+import zlib
+from typing import Any, Iterable
+
+try:
+    from ..core.db import get_db_connection, get_read_connection
+except ImportError:
+    from core.db import get_db_connection, get_read_connection
+
+logger = logging.getLogger(__name__)
+
+# Сколько секунд снимок считается пригодным для повторного использования (по умолчанию 30 дней)
+PAYLOAD_TTL = float(os.getenv("KEYSET_PAYLOAD_TTL", str(30 * 24 * 3600)))
+# Строк Wordstat на одной странице колонки
+DEPTH_PAGE_SIZE = 50
+# Возраст снимка, после которого парсинг вглубь запрашивает колонку заново (по умолчанию сутки)
+DEPTH_MAX_AGE = float(os.getenv("KEYSET_DEPTH_MAX_AGE", str(24 * 3600)))
+_LOOKUP_CHUNK = 500
+
+_DDL = """
+CREATE TABLE IF NOT EXISTS wordstat_payloads (
+    id INTEGER PRIMARY KEY,
+    query_key TEXT NOT NULL,
+    query TEXT NOT NULL,
+    region INTEGER NOT NULL,
+    fetched_at REAL NOT NULL,
+    total INTEGER,
+    popular BLOB,
+    related BLOB
+);
+CREATE INDEX IF NOT EXISTS idx_wordstat_payloads_key
+    ON wordstat_payloads(query_key, region, fetched_at);
+"""
+
+_table_ready = False
+
+
+def _ensure_table() -> None:
+    global _table_ready
+    if _table_ready:
+        return
+    with get_db_connection() as conn:
+        for statement in filter(str.strip, _DDL.split(";")):
+            conn.execute(statement)
+    _table_ready = True
+
+
+def query_key(query: str) -> str:
+    return " ".join(query.casefold().split())
+
+
+def _pack(entries: Iterable[dict] | None) -> bytes | None:
+    pairs = [[e.get("phrase", ""), int(e.get("count") or 0)] for e in entries or () if e.get("phrase")]
+    if not pairs:
+        return None
+    return zlib.compress(json.dumps(pairs, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+
+
+def _unpack(blob: bytes | None) -> list[dict]:
+    if not blob:
+        return []
+    try:
+        pairs = json.loads(zlib.decompress(blob).decode("utf-8"))
+    except (zlib.error, ValueError):
+        return []
+    return [{"phrase": phrase, "count": count} for phrase, count in pairs]
+
+
+def payload_record(query: str, region: int, data: dict[str, Any], total: int | None = None) -> dict:
+    """Снимок нормализованного ответа (после _normalize_wordstat_payload) для store_payloads."""
+    table = data.get("table") or {}
+    return {
+        "query": query,
+        "region": region,
+        "total": total,
+        "popular": table.get("items") or [],
+        "related": table.get("related") or [],
+        "fetched_at": time.time(),
+    }
+
+
+def store_payloads(records: Iterable[dict]) -> int:
+    """Сохранить пачку снимков одной транзакцией. Возвращает число записанных строк."""
+    rows = [
+        (
+            query_key(rec["query"]),
+            rec["query"],
+            int(rec.get("region") or 225),
+            float(rec.get("fetched_at") or time.time()),
+            rec.get("total"),
+            _pack(rec.get("popular")),
+            _pack(rec.get("related")),
+        )
+        for rec in records
+        if rec.get("query") and (rec.get("popular") or rec.get("related") or rec.get("total") is not None)
+    ]
+    if not rows:
+        return 0
+    try:
+        _ensure_table()
+        with get_db_connection() as conn:
+            conn.executemany(
+                "INSERT INTO wordstat_payloads (query_key, query, region, fetched_at, total, popular, related) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+    except sqlite3.Error as exc:
+        logger.warning("Не удалось сохранить ответы Wordstat: %s", exc)
+        return 0
+    return len(rows)
+
+
+def latest_payloads(queries: Iterable[str], region: int, max_age: float | None = None) -> dict[str, dict]:
+    """Свежие снимки моложе max_age: {query_key: {query, total, popular, related, fetched_at}}.
+
+    Поля собираются по отдельности из самого нового снимка, где они есть:
+    частичный снимок (например, только левая колонка из парсинга вглубь) не
+    затирает правую колонку и total из более раннего полного ответа.
+    fetched_at — время самого нового из использованных снимков.
+    """
+    keys = list(dict.fromkeys(query_key(q) for q in queries if q and q.strip()))
+    if not keys:
+        return {}
+    cutoff = time.time() - (PAYLOAD_TTL if max_age is None else max_age)
+    found: dict[str, dict] = {}
+    try:
+        _ensure_table()
+        with get_read_connection() as conn:
+            for start in range(0, len(keys), _LOOKUP_CHUNK):
+                chunk = keys[start:start + _LOOKUP_CHUNK]
+                marks = ",".join("?" * len(chunk))
+                rows = conn.execute(
+                    f"SELECT query_key, query, total, popular, related, fetched_at FROM wordstat_payloads "
+                    f"WHERE region = ? AND fetched_at >= ? AND query_key IN ({marks}) "
+                    f"ORDER BY query_key, fetched_at DESC",
+                    (region, cutoff, *chunk),
+                ).fetchall()
+                for key, query, total, popular, related, fetched_at in rows:
+                    snapshot = found.get(key)
+                    if snapshot is None:
+                        snapshot = found[key] = {
+                            "query": query,
+                            "total": None,
+                            "popular": None,
+                            "related": None,
+                            "fetched_at": fetched_at,
+                        }
+                    if snapshot["total"] is None and total is not None:
+                        snapshot["total"] = total
+                    if snapshot["popular"] is None and popular:
+                        snapshot["popular"] = _unpack(popular)
+                    if snapshot["related"] is None and related:
+                        snapshot["related"] = _unpack(related)
+    except sqlite3.Error as exc:
+        logger.warning("Хранилище ответов Wordstat недоступно: %s", exc)
+    for snapshot in found.values():
+        snapshot["popular"] = snapshot["popular"] or []
+        snapshot["related"] = snapshot["related"] or []
+    return found
+
+
+def prune_payloads(older_than: float | None = None) -> int:
+    """Удалить снимки старше older_than секунд (по умолчанию PAYLOAD_TTL)."""
+    cutoff = time.time() - (PAYLOAD_TTL if older_than is None else older_than)
+    _ensure_table()
+    with get_db_connection() as conn:
+        return conn.execute("DELETE FROM wordstat_payloads WHERE fetched_at < ?", (cutoff,)).rowcount
+
+
+def stored_depth(
+    phrases: list[str],
+    *,
+    column: str,
+    pages: int,
+    regions: list[int],
+    max_age: float | None = None,
+) -> tuple[list[dict], list[str]]:
+    """
+    Парсинг вглубь из сохранённых ответов: (строки найденных фраз, фразы без снимка).
+
+    column: "left"/"popular" — левая колонка, "right"/"related" — правая.
+    Фраза считается найденной, если у неё есть непустая колонка моложе max_age
+    (по умолчанию DEPTH_MAX_AGE); остальные надо парсить заново.
+    """
+    region = regions[0] if regions else 225
+    field = "related" if column in ("right", "related") else "popular"
+    limit = max(1, pages) * DEPTH_PAGE_SIZE
+    snapshots = latest_payloads(phrases, region, DEPTH_MAX_AGE if max_age is None else max_age)
+
+    rows: list[dict] = []
+    missing: list[str] = []
+    for phrase in phrases:
+        snapshot = snapshots.get(query_key(phrase))
+        if snapshot is None or not snapshot[field]:
+            missing.append(phrase)
+            continue
+        for entry in snapshot[field][:limit]:
+            rows.append({"phrase": entry["phrase"], "count": entry["count"], "column": column, "status": "OK"})
+    return rows, missing
+
+
+def collect_depth(
+    phrases: list[str],
+    *,
+    column: str,
+    pages: int,
+    regions: list[int],
+    profile: str | None,
+    max_age: float | None = None,
+) -> list[dict] | None:
+    """
+    Парсинг вглубь только из сохранённых ответов.
+
+    Возвращает None, если хоть одной фразы нет в хранилище — тогда вызывающий
+    парсит заново (wordstat_bridge сам делит фразы через stored_depth).
+    """
+    rows, missing = stored_depth(phrases, column=column, pages=pages, regions=regions, max_age=max_age)
+    if missing:
+        return None
+    return rows
+
+
+__all__ = [
+    "PAYLOAD_TTL",
+    "DEPTH_MAX_AGE",
+    "payload_record",
+    "store_payloads",
+    "latest_payloads",
+    "prune_payloads",
+    "collect_depth",
+    "stored_depth",
+    "query_key",
+]
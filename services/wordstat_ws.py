@@ -11,8 +11,8 @@ import asyncio
 from dataclasses import dataclass
 from typing import Iterable
 
-from workers.turbo_parser_integration import TurboWordstatParser
 from services import accounts as account_service
+from services.frequency_cache import CACHE_MODES, frequency_cache, normalize_query
 
 
 @dataclass(slots=True)
@@ -60,6 +60,8 @@ def _resolve_account(name: str | None):
 
 async def _run_turbo(queries: list[str], account, region: int) -> list[dict]:
     """Асинхронный запуск TurboWordstatParser."""
+    from workers.turbo_parser_integration import TurboWordstatParser
+
     parser = TurboWordstatParser(account=account, headless=False)
     try:
         results = await parser.parse_batch(queries, region=region)
@@ -76,39 +78,59 @@ def collect_frequency(
     modes: dict[str, bool],
     regions: list[int],
     profile: str | None,
+    max_age: float | None = None,
+    use_cache: bool = True,
 ) -> list[dict]:
     """
     Вернуть реальные частотности (WS/"WS"/!WS) для списка фраз.
 
+    Свежие значения отдаются из кэша без запуска браузера, в
+    TurboWordstatParser уходят только промахи.
+
     Args:
         phrases: исходные ключевые фразы из UI.
         modes: какие режимы частотности нужны.
         regions: список регионов Яндекса (используем первый).
         profile: выбранный аккаунт (имя из базы).
+        max_age: TTL кэша в секундах (None — CACHE_TTL).
+        use_cache: False — перепарсить всё и обновить кэш.
     """
     requests = _prepare_requests(phrases, modes)
     if not requests:
         return []
 
-    # TurboWordstatParser ожидает уникальные запросы — убираем дубли.
-    seen: set[str] = set()
-    unique_queries: list[str] = []
-    for entry in requests:
-        if entry.query not in seen:
-            seen.add(entry.query)
-            unique_queries.append(entry.query)
-
-    account = _resolve_account(profile)
     region = regions[0] if regions else 225
 
-    try:
-        results = asyncio.run(_run_turbo(unique_queries, account, region))
-    except RuntimeError:
-        raise
-    except Exception as exc:  # pragma: no cover - реальный запуск вне тестов
-        raise RuntimeError(f"TurboWordstatParser error: {exc}") from exc
+    cached: dict[str, dict[str, int]] = {mode: {} for mode in CACHE_MODES}
+    if use_cache:
+        for mode in CACHE_MODES:
+            if modes.get(mode, False):
+                cached[mode] = frequency_cache.lookup(phrases, mode, region, max_age)
 
-    freq_by_query = {row.get("query"): int(row.get("frequency", 0) or 0) for row in results}
+    # TurboWordstatParser ожидает уникальные запросы — убираем дубли.
+    pending: dict[str, list[_Query]] = {}
+    for entry in requests:
+        if normalize_query(entry.phrase) in cached[entry.mode]:
+            continue
+        pending.setdefault(entry.query, []).append(entry)
+
+    freq_by_query: dict[str, int] = {}
+    if pending:
+        account = _resolve_account(profile)
+        try:
+            results = asyncio.run(_run_turbo(list(pending), account, region))
+        except RuntimeError:
+            raise
+        except Exception as exc:  # pragma: no cover - реальный запуск вне тестов
+            raise RuntimeError(f"TurboWordstatParser error: {exc}") from exc
+
+        freq_by_query = {row.get("query"): int(row.get("frequency", 0) or 0) for row in results}
+        fresh: dict[str, dict[str, int]] = {mode: {} for mode in CACHE_MODES}
+        for query, value in freq_by_query.items():
+            for entry in pending.get(query, ()):
+                fresh[entry.mode][entry.phrase] = value
+        for mode, values in fresh.items():
+            frequency_cache.store(values, mode, region)
 
     rows: list[dict] = []
     for phrase in phrases:
@@ -116,13 +138,16 @@ def collect_frequency(
         if not phrase:
             continue
         row = {"phrase": phrase}
+        key = normalize_query(phrase)
         missing_modes: list[str] = []
 
         def _set(column: str, query: str | None) -> None:
             if not modes.get(column, False) or not query:
                 row[column] = ""
                 return
-            value = freq_by_query.get(query)
+            value = cached[column].get(key)
+            if value is None:
+                value = freq_by_query.get(query)
             if value is None:
                 missing_modes.append(column)
                 row[column] = 0
@@ -143,5 +168,10 @@ def collect_frequency(
     return rows
 
 
-__all__ = ["collect_frequency"]
+def cache_stats() -> dict:
+    """Счётчики попаданий/промахов кэша частотностей."""
+    return frequency_cache.stats()
+
+
+__all__ = ["collect_frequency", "cache_stats"]
 
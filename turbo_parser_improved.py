@@ -14,7 +14,7 @@ import pathlib
 import time
 import sys
 from datetime import datetime
-from typing import Dict, Iterable, List, Optional, Any
+from typing import Callable, Dict, Iterable, List, Optional, Any
 from urllib.parse import quote
 import logging
 
@@ -54,6 +54,9 @@ except ImportError:  # pragma: no cover - fallback for scripts
         load_cookies_from_profile_to_context,
     )
 
+from utils.concurrency import AdaptiveLimiter
+from utils.jsonl_sink import open_sink
+
 # Настройка логирования
 logging.basicConfig(
     level=logging.INFO,
@@ -79,10 +82,29 @@ API_POLL_INTERVAL = 0.2  # Интервал проверки ответа API (
 RELOAD_DELAY_SECONDS = 0.5  # Пауза после перезагрузки перед новой попыткой
 
 
+DEBUG_LOG_LEVEL = os.environ.get("KEYSET_DEBUG_LOG_LEVEL", "all")  # off / outcomes / all
+DEBUG_LOG_SAMPLE_RATE = float(os.environ.get("KEYSET_DEBUG_LOG_SAMPLE", "1.0"))  # доля фраз с промежуточными событиями
+DEBUG_LOG_MAX_BYTES = 20 * 1024 * 1024  # Ротация parsing_debug.jsonl
+DEBUG_LOG_OUTCOMES = ("success", "no_data", "error", "timeout")
+
+_debug_sink = open_sink(
+    LOG_DIR / 'parsing_debug.jsonl',
+    level=DEBUG_LOG_LEVEL,
+    sample_rate=DEBUG_LOG_SAMPLE_RATE,
+    outcome_statuses=DEBUG_LOG_OUTCOMES,
+    max_bytes=DEBUG_LOG_MAX_BYTES,
+)
+
+
 def log_parsing_debug(entry: Dict[str, Any]) -> None:
     """
     Сохраняет детальные логи парсинга в JSONL файл для отладки.
 
+    Запись не блокирует event loop: событие уходит в буфер, фоновый поток
+    пишет пачками и ротирует файл. Итоговые события (success, no_data, ...)
+    пишутся всегда, кроме уровня off; промежуточные — с выборкой
+    DEBUG_LOG_SAMPLE_RATE.
+
     Каждая запись содержит:
       - timestamp: ISO формат времени
       - account: имя аккаунта
@@ -94,13 +116,7 @@ def log_parsing_debug(entry: Dict[str, Any]) -> None:
       - elapsed: время выполнения этапа в секундах (если применимо)
       - error: текст ошибки (если есть)
     """
-    debug_log_file = LOG_DIR / 'parsing_debug.jsonl'
-
-    try:
-        with open(debug_log_file, 'a', encoding='utf-8') as f:
-            f.write(json.dumps(entry, ensure_ascii=False) + '\n')
-    except Exception as e:
-        logging.error(f"Ошибка записи debug лога: {e}")
+    _debug_sink.emit(entry)
 
 
 class WordstatResult(dict):
@@ -315,12 +331,19 @@ class TurboParser:
         phrases: List[str],
         headless: bool = False,
         proxy_uri: Optional[str] = None,
+        next_batch: Optional[Callable[[], List[str]]] = None,
+        on_batch: Optional[Callable[[List[str], "WordstatResult"], None]] = None,
     ):
         self.account_name = account_name
         self.profile_path = profile_path.expanduser().resolve()
         self.phrases = phrases
         self.headless = headless
         self.proxy_uri = proxy_uri
+        # Подача пачками в одну сессию браузера: next_batch (блокирующий, зовётся
+        # из пула потоков) отдаёт следующую пачку, пустой список — конец;
+        # on_batch получает итог каждой пачки до запроса следующей
+        self.next_batch = next_batch
+        self.on_batch = on_batch
         self.waiters: Dict[str, asyncio.Future[int]] = {}
         self.region_id: int = 225
         self.results: Dict[str, Any] = {}
@@ -636,157 +659,173 @@ class TurboParser:
             stats = {"processed": 0, "timeouts": 0, "errors": 0}
             stats_lock = asyncio.Lock()
             
-            async def parse_tab(
-                page: Page,
-                tab_phrases: List[str],
-                tab_index: int,
-            ):
+            # Общая очередь (фраза, попытка): свободная вкладка берёт следующую фразу,
+            # неудачная попытка уходит в хвост и достаётся любой другой вкладке
+            work_queue: asyncio.Queue = asyncio.Queue()
+
+            def enqueue(raw_phrases: Iterable[str]) -> List[str]:
+                batch = [phrase for phrase in dict.fromkeys(raw.strip() for raw in raw_phrases) if phrase]
+                for phrase in batch:
+                    work_queue.put_nowait((phrase, 1))
+                return batch
+
+            current_batch = enqueue(self.phrases)
+            limiter = AdaptiveLimiter(len(working_pages))
+            phrase_started_at: Dict[str, float] = {}
+
+            async def finish_phrase(phrase: str, tab_index: int, value: int, success: bool) -> None:
+                elapsed_phrase = time.time() - phrase_started_at.pop(phrase, time.time())
+                phrase_log = {
+                    'timestamp': datetime.now().isoformat(),
+                    'account': self.account_name,
+                    'tab': tab_index + 1,
+                    'phrase': phrase,
+                    'ws': value,
+                    'elapsed': round(elapsed_phrase, 3),
+                }
+                self.results[phrase] = value
+                async with stats_lock:
+                    stats["processed"] += 1
+                    if not success:
+                        stats["timeouts"] += 1
+                if success:
+                    self.result_status[phrase] = "OK"
+                    self.logger.info(
+                        f"  [TAB {tab_index + 1}] ✅ '{phrase}' = {value} за {elapsed_phrase:.2f}s"
+                    )
+                    phrase_log.update({'status': 'success', 'message': f'Фраза собрана: {value}'})
+                else:
+                    self.result_status[phrase] = "NO_DATA"
+                    self.logger.warning(
+                        f"  [TAB {tab_index + 1}] ⚠️ '{phrase}' не получена, ставим {value} (за {elapsed_phrase:.2f}s)"
+                    )
+                    phrase_log.update({
+                        'status': 'no_data',
+                        'message': f'После {PHRASE_MAX_ATTEMPTS} попыток результат не получен',
+                    })
+                log_parsing_debug(phrase_log)
+
+            async def try_phrase(page: Page, phrase: str, tab_index: int) -> Optional[int]:
+                """Одна попытка получить частотность; None — ответа нет."""
                 loop = asyncio.get_running_loop()
+                self.waiters.pop(phrase, None)
+                self.results.pop(phrase, None)
+                self.result_status.pop(phrase, None)
 
-                for index, phrase in enumerate(tab_phrases, start=1):
-                    phrase = phrase.strip()
-                    if not phrase:
-                        continue
-                    if phrase in self.results:
-                        continue
-
-                    phrase_log = {
-                        'timestamp': datetime.now().isoformat(),
-                        'account': self.account_name,
-                        'tab': tab_index + 1,
-                        'phrase': phrase,
-                        'status': 'started',
-                        'message': f'[TAB {tab_index + 1}] Начало парсинга: "{phrase}"',
-                    }
-                    log_parsing_debug(phrase_log)
-
-                    phrase_started = time.time()
-                    success = False
-                    value = 0
-
-                    for attempt in range(1, PHRASE_MAX_ATTEMPTS + 1):
-                        if attempt > 1:
+                url = (
+                    "https://wordstat.yandex.ru/"
+                    f"?words={quote(phrase)}&region={self.region_id}&lr={self.region_id}"
+                )
+                try:
+                    await page.goto(url, wait_until="domcontentloaded", timeout=WORDSTAT_LOAD_TIMEOUT_MS)
+                except Exception as nav_exc:
+                    self.logger.warning(
+                        f"  [TAB {tab_index + 1}] Навигация не удалась для '{phrase}': {nav_exc}"
+                    )
+                    return None
+
+                future: asyncio.Future[int] = loop.create_future()
+                self.waiters[phrase] = future
+
+                try:
+                    input_field = await page.wait_for_selector(
+                        "input[name='text'], input[placeholder], .b-form-input__input",
+                        timeout=1500,
+                    )
+                    try:
+                        await input_field.fill(phrase)
+                        await input_field.press("Enter")
+                    except Exception:
+                        pass
+                except Exception:
+                    # Если поле не найдено — Wordstat уже обработал words в URL
+                    pass
+
+                try:
+                    return await asyncio.wait_for(future, timeout=API_MAX_WAIT_SECONDS)
+                except asyncio.TimeoutError:
+                    self.logger.warning(
+                        f"  [TAB {tab_index + 1}] ⏱ '{phrase}' нет ответа за {API_MAX_WAIT_SECONDS:.1f}s"
+                    )
+                except Exception as wait_exc:
+                    self.logger.error(
+                        f"  [TAB {tab_index + 1}] ❌ Ошибка ожидания для '{phrase}': {wait_exc}"
+                    )
+                    async with stats_lock:
+                        stats["errors"] += 1
+                finally:
+                    stored_future = self.waiters.get(phrase)
+                    if stored_future is future:
+                        self.waiters.pop(phrase, None)
+                    if not future.done():
+                        future.cancel()
+                return None
+
+            async def parse_tab(page: Page, tab_index: int):
+                needs_reload = False
+                while True:
+                    await limiter.acquire()
+                    phrase, attempt = await work_queue.get()
+                    started = time.time()
+                    value: Optional[int] = None
+                    try:
+                        if attempt == 1:
+                            phrase_started_at[phrase] = started
+                            log_parsing_debug({
+                                'timestamp': datetime.now().isoformat(),
+                                'account': self.account_name,
+                                'tab': tab_index + 1,
+                                'phrase': phrase,
+                                'status': 'started',
+                                'message': f'[TAB {tab_index + 1}] Начало парсинга: "{phrase}"',
+                            })
+                        else:
                             self.logger.warning(
                                 f"  [TAB {tab_index + 1}] ↻ попытка {attempt}/{PHRASE_MAX_ATTEMPTS} для '{phrase}'"
                             )
+                        if needs_reload:
                             try:
                                 await page.reload(wait_until="domcontentloaded", timeout=WORDSTAT_LOAD_TIMEOUT_MS)
                             except Exception as reload_exc:
-                                self.logger.debug(
-                                    f"  [TAB {tab_index + 1}] Ошибка reload: {reload_exc}"
-                                )
+                                self.logger.debug(f"  [TAB {tab_index + 1}] Ошибка reload: {reload_exc}")
                             await asyncio.sleep(RELOAD_DELAY_SECONDS)
 
-                        self.waiters.pop(phrase, None)
-                        self.results.pop(phrase, None)
-                        self.result_status.pop(phrase, None)
-
-                        url = (
-                            "https://wordstat.yandex.ru/"
-                            f"?words={quote(phrase)}&region={self.region_id}&lr={self.region_id}"
-                        )
-                        try:
-                            await page.goto(url, wait_until="domcontentloaded", timeout=WORDSTAT_LOAD_TIMEOUT_MS)
-                        except Exception as nav_exc:
-                            self.logger.warning(
-                                f"  [TAB {tab_index + 1}] Навигация не удалась для '{phrase}': {nav_exc}"
-                            )
-                            if attempt >= PHRASE_MAX_ATTEMPTS:
-                                break
-                            await asyncio.sleep(RELOAD_DELAY_SECONDS)
-                            continue
-
-                        future: asyncio.Future[int] = loop.create_future()
-                        self.waiters[phrase] = future
-
-                        try:
-                            input_field = await page.wait_for_selector(
-                                "input[name='text'], input[placeholder], .b-form-input__input",
-                                timeout=1500,
-                            )
-                            try:
-                                await input_field.fill(phrase)
-                                await input_field.press("Enter")
-                            except Exception:
-                                pass
-                        except Exception:
-                            # Если поле не найдено — Wordstat уже обработал words в URL
-                            pass
-
                         try:
-                            value = await asyncio.wait_for(future, timeout=API_MAX_WAIT_SECONDS)
-                            success = True
-                            break
-                        except asyncio.TimeoutError:
-                            self.logger.warning(
-                                f"  [TAB {tab_index + 1}] ⏱ '{phrase}' нет ответа за {API_MAX_WAIT_SECONDS:.1f}s (попытка {attempt})"
-                            )
-                        except Exception as wait_exc:
-                            self.logger.error(
-                                f"  [TAB {tab_index + 1}] ❌ Ошибка ожидания для '{phrase}' (попытка {attempt}): {wait_exc}"
-                            )
+                            value = await try_phrase(page, phrase, tab_index)
+                        except Exception as exc:
+                            self.logger.error(f"  [TAB {tab_index + 1}] ❌ Ошибка для '{phrase}': {exc}")
                             async with stats_lock:
                                 stats["errors"] += 1
-                        finally:
-                            stored_future = self.waiters.get(phrase)
-                            if stored_future is future:
-                                self.waiters.pop(phrase, None)
-                            if not future.done():
-                                future.cancel()
-
-                        if attempt < PHRASE_MAX_ATTEMPTS:
-                            await asyncio.sleep(RELOAD_DELAY_SECONDS)
+                        needs_reload = value is None
+                        if value is not None:
+                            await finish_phrase(phrase, tab_index, int(value), True)
+                        elif attempt < PHRASE_MAX_ATTEMPTS:
+                            work_queue.put_nowait((phrase, attempt + 1))
+                        else:
+                            await finish_phrase(phrase, tab_index, int(self.results.get(phrase) or 0), False)
+                    finally:
+                        await limiter.release(time.time() - started, ok=value is not None)
+                        work_queue.task_done()
 
-                    elapsed_phrase = time.time() - phrase_started
-                    existing_value = self.results.get(phrase)
-                    final_value = int(existing_value if existing_value is not None else value or 0)
-
-                    if success:
-                        self.results[phrase] = final_value
-                        self.result_status[phrase] = "OK"
-                        async with stats_lock:
-                            stats["processed"] += 1
-                        self.logger.info(
-                            f"  [TAB {tab_index + 1}] ✅ '{phrase}' = {final_value} за {elapsed_phrase:.2f}s"
-                        )
-                        phrase_log.update({
-                            'timestamp': datetime.now().isoformat(),
-                            'status': 'success',
-                            'message': f'Фраза собрана: {final_value}',
-                            'ws': final_value,
-                            'elapsed': round(elapsed_phrase, 3),
-                        })
-                        log_parsing_debug(phrase_log)
-                    else:
-                        self.results[phrase] = final_value
-                        self.result_status[phrase] = "NO_DATA"
-                        async with stats_lock:
-                            stats["processed"] += 1
-                            stats["timeouts"] += 1
-                        self.logger.warning(
-                            f"  [TAB {tab_index + 1}] ⚠️ '{phrase}' не получена, ставим {final_value} (за {elapsed_phrase:.2f}s)"
-                        )
-                        phrase_log.update({
-                            'timestamp': datetime.now().isoformat(),
-                            'status': 'no_data',
-                            'message': f'После {PHRASE_MAX_ATTEMPTS} попыток результат не получен',
-                            'ws': final_value,
-                            'elapsed': round(elapsed_phrase, 3),
-                        })
-                        log_parsing_debug(phrase_log)
-            # Распределяем фразы по вкладкам
-            tab_phrases_list = []
-            for i in range(len(working_pages)):
-                start_idx = i * len(self.phrases) // len(working_pages)
-                end_idx = (i + 1) * len(self.phrases) // len(working_pages)
-                tab_phrases_list.append(self.phrases[start_idx:end_idx])
-            
-            # Запускаем парсинг на всех вкладках параллельно
+            # Вкладки работают, пока очередь (включая повторы) не опустеет
             parse_tasks = [
-                parse_tab(page, phrases, i)
-                for i, (page, phrases) in enumerate(zip(working_pages, tab_phrases_list))
+                asyncio.create_task(parse_tab(page, i))
+                for i, page in enumerate(working_pages)
             ]
-            await asyncio.gather(*parse_tasks)
+            while True:
+                await work_queue.join()
+                if self.next_batch is None:
+                    break
+                if current_batch and self.on_batch is not None:
+                    self.on_batch(current_batch, self._batch_result(current_batch))
+                next_phrases = await asyncio.to_thread(self.next_batch)
+                if not next_phrases:
+                    break
+                self.phrases.extend(next_phrases)
+                current_batch = enqueue(next_phrases)
+            for parse_task in parse_tasks:
+                parse_task.cancel()
+            await asyncio.gather(*parse_tasks, return_exceptions=True)
             self.waiters.clear()
 
             await save_cookies_to_db(self.account_name, context, self.logger)
@@ -817,12 +856,19 @@ class TurboParser:
             self.logger.info(f"Скорость: {speed:.1f} фраз/сек")
             self.logger.info("=" * 70)
             
-            result = WordstatResult(self.results)
-            result.meta = {
-                "statuses": dict(self.result_status),
-                "no_data": [phrase for phrase, status in self.result_status.items() if status == "NO_DATA"],
-            }
-            return result
+            return self._batch_result(self.results)
+
+    def _batch_result(self, phrases: Iterable[str]) -> WordstatResult:
+        """Результаты и статусы по набору фраз."""
+        result = WordstatResult(
+            (phrase, self.results[phrase]) for phrase in phrases if phrase in self.results
+        )
+        statuses = {phrase: self.result_status[phrase] for phrase in result if phrase in self.result_status}
+        result.meta = {
+            "statuses": statuses,
+            "no_data": [phrase for phrase, status in statuses.items() if status == "NO_DATA"],
+        }
+        return result
 
 
 async def turbo_parser_10tabs(
@@ -833,6 +879,8 @@ async def turbo_parser_10tabs(
     headless: bool = False,
     proxy_uri: Optional[str] = None,
     region_id: int = 225,
+    next_batch: Optional[Callable[[], List[str]]] = None,
+    on_batch: Optional[Callable[[List[str], WordstatResult], None]] = None,
 ) -> WordstatResult:
     """
     Главная функция парсера для обратной совместимости
@@ -843,6 +891,8 @@ async def turbo_parser_10tabs(
         phrases: коллекция фраз
         headless: флаг headless-режима
         proxy_uri: URI прокси
+        next_batch: источник следующих пачек для той же сессии браузера
+        on_batch: куда отдавать итог каждой пачки
         
     Returns:
         словарь «фраза → частотность»
@@ -852,7 +902,9 @@ async def turbo_parser_10tabs(
         profile_path=profile_path,
         phrases=list(phrases),
         headless=headless,
-        proxy_uri=proxy_uri
+        proxy_uri=proxy_uri,
+        next_batch=next_batch,
+        on_batch=on_batch,
     )
     parser.region_id = region_id
     return await parser.run()
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""
+Adaptive concurrency limit for Wordstat tab workers.
+
+Every tab takes a slot before sending a phrase and returns it with the observed
+latency. While latency stays close to the best value seen, the limit grows up
+to ``max_limit``; once the smoothed latency drifts well above it (Wordstat is
+throttling) or requests fail, the limit shrinks and extra tabs idle.
+"""
+
+from __future__ import annotations
+
+import asyncio
+from typing import Optional
+
+
+class AdaptiveLimiter:
+    """Gradient-style limiter: additive increase, decrease on latency growth or errors."""
+
+    def __init__(
+        self,
+        max_limit: int,
+        *,
+        min_limit: int = 1,
+        smoothing: float = 0.2,
+        tolerance: float = 2.0,
+    ):
+        self.max_limit = max(1, max_limit)
+        self.min_limit = max(1, min(min_limit, self.max_limit))
+        self.limit = self.max_limit
+        self.smoothing = smoothing
+        self.tolerance = tolerance
+        self.latency_ewma: Optional[float] = None
+        self.best_latency: Optional[float] = None
+        self._active = 0
+        self._cond = asyncio.Condition()
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    async def acquire(self) -> None:
+        async with self._cond:
+            await self._cond.wait_for(lambda: self._active < self.limit)
+            self._active += 1
+
+    async def release(self, latency: Optional[float] = None, ok: bool = True) -> None:
+        async with self._cond:
+            self._active = max(0, self._active - 1)
+            self._observe(latency, ok)
+            self._cond.notify_all()
+
+    def _observe(self, latency: Optional[float], ok: bool) -> None:
+        if not ok:
+            self.limit = max(self.min_limit, self.limit // 2)
+            return
+        if latency is None or latency <= 0:
+            return
+        if self.latency_ewma is None:
+            self.latency_ewma = latency
+        else:
+            self.latency_ewma += self.smoothing * (latency - self.latency_ewma)
+        # The best value slowly drifts up so a single lucky response does not pin it forever
+        if self.best_latency is None:
+            self.best_latency = latency
+        else:
+            self.best_latency = min(latency, self.best_latency * 1.05)
+
+        if self.latency_ewma > self.best_latency * self.tolerance:
+            self.limit = max(self.min_limit, self.limit - 1)
+        elif self.latency_ewma < self.best_latency * (1 + (self.tolerance - 1) / 2):
+            self.limit = min(self.max_limit, self.limit + 1)
+
+
+__all__ = ["AdaptiveLimiter"]
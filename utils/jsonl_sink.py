@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+Buffered JSONL event sink.
+
+``emit`` only puts the event into a queue, so it is safe to call from the
+asyncio event loop. A background thread serialises events and appends them to
+the file in batches: a batch is written when ``max_batch`` events are waiting or
+``flush_interval`` seconds have passed. The file rotates by size like
+``RotatingFileHandler`` (``name.jsonl.1`` ... ``name.jsonl.N``).
+"""
+
+from __future__ import annotations
+
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+LEVEL_OFF = "off"
+LEVEL_OUTCOMES = "outcomes"
+LEVEL_ALL = "all"
+LEVELS = (LEVEL_OFF, LEVEL_OUTCOMES, LEVEL_ALL)
+
+_STOP = object()
+
+
+class JsonlEventSink:
+    """Non-blocking writer for structured debug events."""
+
+    def __init__(
+        self,
+        path: Path,
+        *,
+        level: str = LEVEL_ALL,
+        sample_rate: float = 1.0,
+        outcome_statuses: Iterable[str] = (),
+        max_batch: int = 500,
+        flush_interval: float = 1.0,
+        max_bytes: int = 20 * 1024 * 1024,
+        backup_count: int = 3,
+    ):
+        self.path = Path(path)
+        self.level = level if level in LEVELS else LEVEL_ALL
+        self.sample_rate = min(1.0, max(0.0, sample_rate))
+        self.outcome_statuses = frozenset(outcome_statuses)
+        self.max_batch = max(1, max_batch)
+        self.flush_interval = max(0.05, flush_interval)
+        self.max_bytes = max_bytes
+        self.backup_count = max(0, backup_count)
+        self.dropped = 0
+        self._queue: "queue.SimpleQueue[Any]" = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._closed = False
+
+    # ------------------------------------------------------------------ API
+
+    def wants(self, entry: Dict[str, Any]) -> bool:
+        """Apply the verbosity level and sampling to an event."""
+        if self.level == LEVEL_OFF:
+            return False
+        if entry.get("status") in self.outcome_statuses:
+            return True
+        if self.level == LEVEL_OUTCOMES:
+            return False
+        if self.sample_rate >= 1.0:
+            return True
+        # Sample by phrase so all intermediate events of one phrase are kept or dropped together
+        key = str(entry.get("phrase") or entry.get("status") or "")
+        bucket = zlib.crc32(key.encode("utf-8")) % 10_000
+        return bucket < self.sample_rate * 10_000
+
+    def emit(self, entry: Dict[str, Any]) -> None:
+        if self._closed or not self.wants(entry):
+            return
+        self._ensure_thread()
+        self._queue.put(dict(entry))
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Flush the remaining buffer and stop the writer thread."""
+        if self._closed:
+            return
+        self._closed = True
+        if self._thread is not None:
+            self._queue.put(_STOP)
+            self._thread.join(timeout)
+
+    # ------------------------------------------------------------ internals
+
+    def _ensure_thread(self) -> None:
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name=f"jsonl-sink:{self.path.name}", daemon=True
+                )
+                self._thread.start()
+
+    def _run(self) -> None:
+        buffer: List[str] = []
+        deadline = time.monotonic() + self.flush_interval
+        stopping = False
+        while not stopping:
+            timeout = max(0.0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+            if item is _STOP:
+                stopping = True
+            elif item is not None:
+                try:
+                    buffer.append(json.dumps(item, ensure_ascii=False, default=str))
+                except Exception:
+                    self.dropped += 1
+            if buffer and (stopping or len(buffer) >= self.max_batch or time.monotonic() >= deadline):
+                self._write(buffer)
+                buffer = []
+            if time.monotonic() >= deadline:
+                deadline = time.monotonic() + self.flush_interval
+
+    def _write(self, lines: List[str]) -> None:
+        payload = "\n".join(lines) + "\n"
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            if self.max_bytes and self.path.exists() and self.path.stat().st_size + len(payload) > self.max_bytes:
+                self._rotate()
+            with self.path.open("a", encoding="utf-8") as handle:
+                handle.write(payload)
+        except Exception as exc:
+            self.dropped += len(lines)
+            logging.error(f"Ошибка записи debug лога {self.path}: {exc}")
+
+    def _rotate(self) -> None:
+        if self.backup_count <= 0:
+            self.path.unlink(missing_ok=True)
+            return
+        for index in range(self.backup_count - 1, 0, -1):
+            source = self.path.with_name(f"{self.path.name}.{index}")
+            if source.exists():
+                os.replace(source, self.path.with_name(f"{self.path.name}.{index + 1}"))
+        os.replace(self.path, self.path.with_name(f"{self.path.name}.1"))
+
+
+def open_sink(path: Path, **kwargs: Any) -> JsonlEventSink:
+    """Create a sink that is flushed on interpreter exit."""
+    sink = JsonlEventSink(path, **kwargs)
+    atexit.register(sink.close)
+    return sink
+
+
+__all__ = ["JsonlEventSink", "open_sink", "LEVELS", "LEVEL_OFF", "LEVEL_OUTCOMES", "LEVEL_ALL"]
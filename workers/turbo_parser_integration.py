@@ -16,10 +16,13 @@ from urllib.parse import quote
 
 from playwright.async_api import async_playwright, Page, Browser, BrowserContext
 
+from utils.concurrency import AdaptiveLimiter
 from utils.proxy import proxy_to_playwright
 from utils.text_fix import WORDSTAT_FETCH_NORMALIZER_SCRIPT, fix_mojibake
-from core.db import SessionLocal
+from core.db import DB_PATH, SessionLocal
+from core.result_sink import get_result_sink
 from core.models import Account
+from services.wordstat_payloads import payload_record, store_payloads
 from services.proxy_manager import ProxyManager, proxy_preflight, Proxy
 from workers.visual_browser_manager import VisualBrowserManager, BrowserStatus
 from workers.auto_auth_handler import AutoAuthHandler
@@ -122,6 +125,19 @@ def _normalize_wordstat_payload(data: Dict[str, Any]) -> None:
         table["related"] = _norm(table_data.get("associations") or table_data.get("similar"))
 
 
+def _extract_total_value(data: Dict[str, Any]) -> Optional[int]:
+    """Общая частота из нормализованного ответа Wordstat (totalValue или первая строка)."""
+    freq: Optional[Any] = data.get("totalValue")
+    if freq is None:
+        items = (data.get("table") or {}).get("items") or []
+        if items:
+            freq = items[0].get("count") or items[0].get("value")
+    try:
+        return int(str(freq).replace(" ", "")) if freq is not None else None
+    except Exception:
+        return None
+
+
 def _extract_phrase_from_request(response) -> Optional[str]:
     """Достаёт исходный searchValue из тела POST."""
     try:
@@ -183,12 +199,14 @@ class TurboWordstatParser:
         self.aimd = AIMDController()
         self.num_tabs = 10
         self.num_browsers = 1
+        self.max_attempts = 3
         self.visual_manager = None
-        self.db_path = Path("C:/AI/yandex/keyset/data/keyset.db")
+        self.db_path = DB_PATH
         self.auth_handler = AutoAuthHandler()
         self.proxy_manager = ProxyManager.instance()
         self._proxy_item: Optional[Proxy] = None
         self._preflight_info: Optional[dict] = None
+        self._session_proxy: Optional[Proxy] = None
 
         if self.account:
             self._load_auth_data()
@@ -196,6 +214,10 @@ class TurboWordstatParser:
         self.total_processed = 0
         self.total_errors = 0
         self.start_time: Optional[float] = None
+        self.region = 225
+        # Ответы /wordstat/api (левая/правая колонка) копятся и пишутся пачками
+        self._payload_buffer: List[Dict[str, Any]] = []
+        self.payload_flush_size = 100
 
     def _load_auth_data(self) -> None:
         """Загружаем данные авторизации из accounts.json"""
@@ -216,6 +238,22 @@ class TurboWordstatParser:
         except Exception as exc:
             print(f"[AUTH] Ошибка чтения accounts.json: {exc}")
 
+    @property
+    def _proxy_id(self) -> Optional[str]:
+        """id прокси из ProxyManager, под которым идёт сессия (None — телеметрию не пишем)."""
+        return self._proxy_item.id if self._proxy_item else None
+
+    def _report_navigation(self, response, started: float) -> None:
+        if response is not None and response.status == 403:
+            self.proxy_manager.report_ban(self._proxy_id, "HTTP 403")
+        else:
+            self.proxy_manager.report_success(self._proxy_id, (time.perf_counter() - started) * 1000)
+
+    def _on_request_failed(self, request) -> None:
+        # Обрыв запроса к API — сбой транспорта, то есть прокси
+        if "wordstat/api" in request.url:
+            self.proxy_manager.report_failure(self._proxy_id, request.failure or "request failed")
+
     async def init_browser(self) -> None:
         """Запуск persistent контекста Chrome с привязанным прокси"""
         from ..services.proxy_manager import proxy_preflight
@@ -252,6 +290,7 @@ class TurboWordstatParser:
         if not preflight.get("ok", False):
             raise RuntimeError(f"Proxy preflight failed: {preflight.get('error')}")
         self._preflight_info = preflight
+        self._session_proxy = proxy_obj
         if preflight.get("ip"):
             print(f"[TURBO] Proxy preflight ip={preflight['ip']}")
 
@@ -277,7 +316,11 @@ class TurboWordstatParser:
             host = proxy_obj.server.split("://")[-1].split(":")[0]
             launch_kwargs["args"].append(f"--host-resolver-rules=MAP * ~NOTFOUND , EXCLUDE {host}")
 
-        context = await self.playwright.chromium.launch_persistent_context(**launch_kwargs)
+        try:
+            context = await self.playwright.chromium.launch_persistent_context(**launch_kwargs)
+        except Exception as exc:
+            self.proxy_manager.report_failure(self._proxy_id, str(exc))
+            raise
         await context.add_init_script(script=WORDSTAT_FETCH_NORMALIZER_SCRIPT)
         for existing_page in context.pages:
             await existing_page.add_init_script(script=WORDSTAT_FETCH_NORMALIZER_SCRIPT)
@@ -297,11 +340,17 @@ class TurboWordstatParser:
             await page.evaluate(WORDSTAT_FETCH_NORMALIZER_SCRIPT)
         except Exception:
             pass
-        await page.goto(
-            "https://wordstat.yandex.ru/#!/?region=225",
-            wait_until="domcontentloaded",
-            timeout=30000,
-        )
+        started = time.perf_counter()
+        try:
+            response = await page.goto(
+                "https://wordstat.yandex.ru/#!/?region=225",
+                wait_until="domcontentloaded",
+                timeout=30000,
+            )
+        except Exception as exc:
+            self.proxy_manager.report_failure(self._proxy_id, str(exc))
+            raise
+        self._report_navigation(response, started)
         self.pages = [page]
 
     async def setup_tabs(self) -> None:
@@ -323,15 +372,19 @@ class TurboWordstatParser:
             _ensure_wired(page)
             self.page_mapping[i] = page
             if "wordstat.yandex.ru" not in page.url:
+                started = time.perf_counter()
                 try:
-                    await page.goto(
+                    response = await page.goto(
                         "https://wordstat.yandex.ru/#!/?region=225",
                         wait_until="domcontentloaded",
                         timeout=30000,
                     )
-                    await asyncio.sleep(2)
                 except Exception as exc:
+                    self.proxy_manager.report_failure(self._proxy_id, str(exc))
                     print(f"[TURBO] Tab {i}: ошибка загрузки Wordstat: {exc}")
+                else:
+                    self._report_navigation(response, started)
+                    await asyncio.sleep(2)
         print(f"[TURBO] Все {len(self.pages)} вкладок готовы")
 
     async def wait_wordstat_ready(self, page: Page) -> None:
@@ -340,6 +393,8 @@ class TurboWordstatParser:
     async def handle_response(self, response, tab_id: int) -> None:
         if "wordstat/api" not in response.url:
             return
+        if response.status == 403:
+            self.proxy_manager.report_ban(self._proxy_id, "HTTP 403")
 
         data = await _parse_wordstat_json(response)
         if not data:
@@ -355,17 +410,10 @@ class TurboWordstatParser:
         if not phrase:
             return
 
-        freq: Optional[Any] = data.get("totalValue")
-        if freq is None:
-            items = (data.get("table") or {}).get("items") or []
-            if items:
-                freq = items[0].get("count") or items[0].get("value")
-
-        try:
-            frequency = int(str(freq).replace(" ", "")) if freq is not None else None
-        except Exception:
-            frequency = None
-
+        frequency = _extract_total_value(data)
+        self._payload_buffer.append(payload_record(phrase, self.region, data, frequency))
+        if len(self._payload_buffer) >= self.payload_flush_size:
+            await self.flush_payloads()
         if frequency is None:
             return
 
@@ -376,32 +424,59 @@ class TurboWordstatParser:
             "tab": tab_id,
         }
 
-    async def process_tab_worker(self, page: Page, phrases: List[str], tab_id: int) -> List[Dict[str, Any]]:
+    async def flush_payloads(self) -> None:
+        """Сбросить накопленные ответы Wordstat в wordstat_payloads"""
+        if not self._payload_buffer:
+            return
+        batch, self._payload_buffer = self._payload_buffer, []
+        try:
+            await asyncio.to_thread(store_payloads, batch)
+        except Exception as exc:
+            print(f"[TURBO] Не удалось сохранить ответы Wordstat: {exc}")
+
+    async def process_tab_worker(
+        self,
+        page: Page,
+        queue: "asyncio.Queue[tuple[str, int]]",
+        tab_id: int,
+        limiter: AdaptiveLimiter,
+    ) -> None:
+        """Вкладка берёт фразы из общей очереди, пока её не отменят; неудачи уходят в хвост."""
         _ensure_wired(page)
-        results = []
         page.on("response", lambda response: asyncio.create_task(self.handle_response(response, tab_id)))
-        for phrase in phrases:
+        page.on("requestfailed", self._on_request_failed)
+        while True:
+            await limiter.acquire()
+            phrase, attempt = await queue.get()
+            started = time.time()
+            captured = False
             try:
                 await page.fill("input.textinput__control", phrase)
                 await page.keyboard.press("Enter")
                 await self.wait_wordstat_ready(page)
-                captured = False
                 wait_delay = max(self.aimd.get_delay(), 0.05)
                 for _ in range(30):
                     if phrase in self.results:
-                        results.append(self.results[phrase])
                         captured = True
                         break
                     await asyncio.sleep(wait_delay)
+                if not captured:
+                    print(f"[TURBO] Tab {tab_id}: не получили ответ для «{phrase}» (попытка {attempt})")
+            except Exception as exc:
+                print(f"[TURBO] Tab {tab_id}: ошибка {exc}")
+            finally:
                 if captured:
                     self.aimd.on_success()
+                    self.proxy_manager.report_success(self._proxy_id, (time.time() - started) * 1000)
+                    self.total_processed += 1
                 else:
-                    print(f"[TURBO] Tab {tab_id}: не получили ответ для «{phrase}»")
                     self.aimd.on_error()
-            except Exception as exc:
-                print(f"[TURBO] Tab {tab_id}: ошибка {exc}")
-                self.aimd.on_error()
-        return results
+                    if attempt < self.max_attempts:
+                        queue.put_nowait((phrase, attempt + 1))
+                    else:
+                        self.total_errors += 1
+                await limiter.release(time.time() - started, ok=captured)
+                queue.task_done()
 
     async def parse_batch(self, queries: List[str], region: int = 225) -> List[Dict[str, Any]]:
         if not queries:
@@ -409,38 +484,75 @@ class TurboWordstatParser:
         self.total_processed = 0
         self.total_errors = 0
         self.start_time = time.time()
+        self.region = region
         await self.init_browser()
         await self.setup_tabs()
-        buckets = [queries[i::len(self.pages)] for i in range(len(self.pages))]
-        tasks = []
-        for idx, page in enumerate(self.pages):
-            tasks.append(self.process_tab_worker(page, buckets[idx], idx))
-        results_nested = await asyncio.gather(*tasks)
-        flat_results = [item for bucket in results_nested for item in bucket]
-        return flat_results
+        unique_queries = list(dict.fromkeys(queries))
+        queue: "asyncio.Queue[tuple[str, int]]" = asyncio.Queue()
+        for query in unique_queries:
+            queue.put_nowait((query, 1))
+        limiter = AdaptiveLimiter(len(self.pages))
+        workers = [
+            asyncio.create_task(self.process_tab_worker(page, queue, idx, limiter))
+            for idx, page in enumerate(self.pages)
+        ]
+        try:
+            await queue.join()
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            await self.flush_payloads()
+        return [self.results[query] for query in unique_queries if query in self.results]
+
+    async def parse_batch_http(
+        self,
+        queries: List[str],
+        region: int = 225,
+        concurrency: int = 4,
+    ) -> List[Dict[str, Any]]:
+        """Браузер только снимает шаблон запроса и cookies, фразы идут прямыми POST на /wordstat/api."""
+        from workers.wordstat_replay import AccountReplayClient, WordstatReplayEngine, capture_replay_template
+
+        unique_queries = list(dict.fromkeys(queries))
+        if not unique_queries:
+            return []
+        self.total_processed = 0
+        self.total_errors = 0
+        self.start_time = time.time()
+        await self.init_browser()
+        try:
+            template = await capture_replay_template(self.pages[0], unique_queries[0])
+        finally:
+            await self._close_browser()
+
+        client = AccountReplayClient(
+            getattr(self.account, "name", None) or "default",
+            template,
+            proxy=self._session_proxy,
+            concurrency=concurrency,
+        )
+        # Общий AIMD парсера, чтобы регулятор видел и браузерный, и HTTP режим
+        client.aimd = self.aimd
+        engine = WordstatReplayEngine([client], max_attempts=self.max_attempts)
+        self.region = region
+        results = await engine.run(unique_queries, region)
+        for row in results:
+            self.results[row["query"]] = row
+        self.total_processed = len(results)
+        self.total_errors = len(engine.failed)
+        elapsed = max(time.time() - self.start_time, 1e-6)
+        print(f"[TURBO] HTTP реплей: {len(results)}/{len(unique_queries)} за {elapsed:.1f}с ({len(results) / elapsed:.1f} фраз/с)")
+        return results
 
     async def save_to_db(self, results: List[Dict[str, Any]]) -> None:
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        """Результаты уходят в общий буфер freq_results; ждём, пока пачка ляжет на диск"""
+        sink = get_result_sink()
         for row in results:
-            cursor.execute(
-                """
-                INSERT OR REPLACE INTO freq_results
-                (mask, region, freq_total, freq_exact, status, created_at)
-                VALUES (?, ?, ?, ?, ?, ?)""",
-                (
-                    row["query"],
-                    row.get("region", 225),
-                    row["frequency"],
-                    row["frequency"],
-                    "ok",
-                    row["timestamp"],
-                ),
-            )
-        conn.commit()
-        conn.close()
+            sink.result(row["query"], row.get("region", self.region), row["frequency"])
+        await sink.aflush()
 
-    async def close(self) -> None:
+    async def _close_browser(self) -> None:
         try:
             if self.context:
                 await self.context.close()
@@ -448,6 +560,15 @@ class TurboWordstatParser:
                 await self.browser.close()
             if getattr(self, "playwright", None):
                 await self.playwright.stop()
+        finally:
+            self.context = None
+            self.browser = None
+            self.playwright = None
+            self.pages = []
+
+    async def close(self) -> None:
+        try:
+            await self._close_browser()
         finally:
             if self._proxy_item:
                 try:
@@ -455,17 +576,21 @@ class TurboWordstatParser:
                 except Exception:
                     pass
                 self._proxy_item = None
-            self.context = None
-            self.browser = None
-            self.playwright = None
-            self.pages = []
             print("[TURBO] Persistent сессия закрыта")
 
 
-async def run_turbo_parser(queries: List[str], account: Optional[Account] = None, headless: bool = False) -> List[Dict[str, Any]]:
+async def run_turbo_parser(
+    queries: List[str],
+    account: Optional[Account] = None,
+    headless: bool = False,
+    http_replay: bool = False,
+) -> List[Dict[str, Any]]:
     parser = TurboWordstatParser(account=account, headless=headless)
     try:
-        results = await parser.parse_batch(queries)
+        if http_replay:
+            results = await parser.parse_batch_http(queries)
+        else:
+            results = await parser.parse_batch(queries)
         await parser.save_to_db(results)
         return results
     finally:
@@ -5,6 +5,7 @@
 """
 
 import asyncio
+import re
 import time
 from datetime import datetime
 from pathlib import Path
@@ -56,6 +57,28 @@ class BrowserInstance:
     last_activity: Optional[datetime] = None
     phrases_parsed: int = 0
     errors: int = 0
+    consecutive_errors: int = 0
+    busy_seconds: float = 0.0
+    last_latency: Optional[float] = None
+
+    def record(self, ok: bool, latency: float) -> None:
+        """Учесть результат одной фразы в счётчиках браузера"""
+        self.busy_seconds += latency
+        self.last_latency = latency
+        self.last_activity = datetime.now()
+        if ok:
+            self.phrases_parsed += 1
+            self.consecutive_errors = 0
+        else:
+            self.errors += 1
+            self.consecutive_errors += 1
+
+    @property
+    def throughput(self) -> float:
+        """Фраз в минуту за время работы браузера"""
+        if self.busy_seconds <= 0:
+            return 0.0
+        return self.phrases_parsed * 60.0 / self.busy_seconds
 
 
 class VisualBrowserManager:
@@ -508,105 +531,163 @@ class VisualBrowserManager:
                 except:
                     pass
     
+    # Поле ввода: новый Wordstat, затем старая вёрстка
+    INPUT_SELECTORS = [
+        'input.textinput__control',
+        'input[name="text"]',
+        'input[type="search"]',
+        '.b-form-input__input',
+    ]
+    FREQ_SELECTORS = [
+        '.b-word-statistics-info__td:has-text("показов в месяц")',
+        'td:has-text("показов")',
+        '.b-word-statistics__info-wrapper',
+    ]
+    RESPONSE_TIMEOUT = 15.0
+    MAX_ATTEMPTS = 3
+    # После стольких ошибок подряд браузер выводится из пула до конца батча
+    MAX_CONSECUTIVE_ERRORS = 5
+
+    def _available_browser_ids(self) -> List[int]:
+        return [
+            b_id for b_id, b in self.browsers.items()
+            if b.page and b.status in (BrowserStatus.LOGGED_IN, BrowserStatus.IDLE)
+        ]
+
+    async def _submit_phrase(self, page: Page, phrase: str) -> bool:
+        for selector in self.INPUT_SELECTORS:
+            try:
+                input_field = await page.query_selector(selector)
+                if input_field:
+                    await input_field.fill(phrase)
+                    await input_field.press("Enter")
+                    return True
+            except Exception:
+                continue
+        return False
+
+    async def _read_frequency_from_dom(self, page: Page) -> Optional[int]:
+        for selector in self.FREQ_SELECTORS:
+            try:
+                element = await page.wait_for_selector(selector, timeout=3000)
+                if element:
+                    text = await element.inner_text()
+                    numbers = re.findall(r'\d[\d\s\xa0]*', text)
+                    if numbers:
+                        return int(re.sub(r'\D', '', numbers[0]))
+            except Exception:
+                continue
+        return None
+
     async def parse_phrase_on_browser(self, browser_id: int, phrase: str) -> Optional[int]:
-        """Парсить фразу на конкретном браузере"""
+        """Парсить фразу на конкретном браузере: ждём ответ /wordstat/api, а не фиксированную паузу"""
+        from workers.turbo_parser_integration import (
+            _extract_total_value,
+            _normalize_wordstat_payload,
+            _parse_wordstat_json,
+        )
+
         browser = self.browsers.get(browser_id)
-        if not browser or browser.status != BrowserStatus.LOGGED_IN:
+        if not browser or not browser.page or browser.status not in (BrowserStatus.LOGGED_IN, BrowserStatus.IDLE):
             return None
-        
+
+        started = time.monotonic()
+        freq: Optional[int] = None
         try:
             browser.status = BrowserStatus.PARSING
             page = browser.page
-            
-            # Вводим фразу
-            input_selectors = [
-                'input[name="text"]',
-                'input[type="search"]',
-                '.b-form-input__input'
-            ]
-            
-            for selector in input_selectors:
-                try:
-                    input_field = await page.query_selector(selector)
-                    if input_field:
-                        await input_field.click()
-                        await page.keyboard.press("Control+A")
-                        await page.keyboard.press("Delete")
-                        await input_field.type(phrase, delay=50)
-                        await page.keyboard.press("Enter")
-                        break
-                except:
-                    continue
-            
-            # Ждем результат
-            await asyncio.sleep(1.5)
-            
-            # Извлекаем частотность
-            freq_selectors = [
-                '.b-word-statistics-info__td:has-text("показов в месяц")',
-                'td:has-text("показов")',
-                '.b-word-statistics__info-wrapper'
-            ]
-            
-            for selector in freq_selectors:
-                try:
-                    element = await page.wait_for_selector(selector, timeout=3000)
-                    if element:
-                        text = await element.inner_text()
-                        # Извлекаем число из текста
-                        import re
-                        numbers = re.findall(r'[\d\s]+', text)
-                        if numbers:
-                            freq = int(numbers[0].replace(' ', '').replace('\xa0', ''))
-                            browser.phrases_parsed += 1
-                            browser.status = BrowserStatus.IDLE
-                            return freq
-                except:
-                    continue
-            
-            browser.errors += 1
+
+            def _is_search_response(response) -> bool:
+                return "/wordstat/api" in response.url and response.request.method == "POST"
+
+            try:
+                async with page.expect_response(
+                    _is_search_response, timeout=int(self.RESPONSE_TIMEOUT * 1000)
+                ) as captured:
+                    if not await self._submit_phrase(page, phrase):
+                        raise RuntimeError("поле ввода не найдено")
+                data = await _parse_wordstat_json(await captured.value)
+                if data:
+                    _normalize_wordstat_payload(data)
+                    freq = _extract_total_value(data)
+            except RuntimeError:
+                raise
+            except Exception:
+                # Старый интерфейс без JSON API — читаем число со страницы
+                freq = await self._read_frequency_from_dom(page)
+
             browser.status = BrowserStatus.IDLE
-            return None
-            
         except Exception as e:
             print(f"[Browser {browser_id}] Ошибка парсинга: {e}")
-            browser.errors += 1
+            browser.status = BrowserStatus.IDLE
+            freq = None
+
+        browser.record(freq is not None, time.monotonic() - started)
+        if browser.consecutive_errors >= self.MAX_CONSECUTIVE_ERRORS:
             browser.status = BrowserStatus.ERROR
-            return None
-    
+        return freq
+
+    async def _browser_worker(
+        self,
+        browser_id: int,
+        queue: "asyncio.Queue[tuple[str, int]]",
+        results: Dict[str, int],
+    ) -> None:
+        """Долгоживущий воркер браузера: берёт фразы из общей очереди"""
+        browser = self.browsers[browser_id]
+        while browser.status != BrowserStatus.ERROR:
+            phrase, attempt = await queue.get()
+            try:
+                freq = await self.parse_phrase_on_browser(browser_id, phrase)
+                if freq is not None:
+                    results[phrase] = freq
+                    print(f"[OK] [Browser {browser_id}] {phrase}: {freq:,}")
+                elif attempt < self.MAX_ATTEMPTS:
+                    queue.put_nowait((phrase, attempt + 1))
+                else:
+                    print(f"[ERROR] {phrase}: нет данных после {attempt} попыток")
+            except Exception as exc:
+                print(f"[Browser {browser_id}] Воркер: {exc}")
+            finally:
+                queue.task_done()
+        print(f"[Browser {browser_id}] Выведен из пула после {browser.consecutive_errors} ошибок подряд")
+
     async def parse_batch_parallel(self, phrases: List[str]) -> Dict[str, int]:
-        """Парсить батч фраз параллельно на всех браузерах"""
-        results = {}
-        
-        # Распределяем фразы по браузерам
-        browser_ids = [b_id for b_id, b in self.browsers.items() 
-                      if b.status in [BrowserStatus.LOGGED_IN, BrowserStatus.IDLE]]
-        
+        """Парсить батч фраз параллельно на всех браузерах (общая очередь, воркер на браузер)"""
+        results: Dict[str, int] = {}
+
+        browser_ids = self._available_browser_ids()
         if not browser_ids:
             print("[!] No available browsers for parsing")
             return results
-        
-        # Парсим по частям
-        for i in range(0, len(phrases), len(browser_ids)):
-            batch = phrases[i:i+len(browser_ids)]
-            tasks = []
-            
-            for j, phrase in enumerate(batch):
-                browser_id = browser_ids[j % len(browser_ids)]
-                task = self.parse_phrase_on_browser(browser_id, phrase)
-                tasks.append((phrase, task))
-            
-            # Ждем завершения батча
-            for phrase, task in tasks:
-                freq = await task
-                if freq is not None:
-                    results[phrase] = freq
-                    print(f"[OK] {phrase}: {freq:,}")
-                else:
-                    print(f"[ERROR] {phrase}: error")
-        
+
+        unique_phrases = list(dict.fromkeys(phrases))
+        queue: "asyncio.Queue[tuple[str, int]]" = asyncio.Queue()
+        for phrase in unique_phrases:
+            queue.put_nowait((phrase, 1))
+
+        started = time.monotonic()
+        workers = [asyncio.create_task(self._browser_worker(b_id, queue, results)) for b_id in browser_ids]
+        joiner = asyncio.create_task(queue.join())
+        all_workers = asyncio.gather(*workers, return_exceptions=True)
+        try:
+            # Воркеры завершаются сами, только если все браузеры выведены из пула
+            await asyncio.wait({joiner, all_workers}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            joiner.cancel()
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(joiner, all_workers, return_exceptions=True)
+
+        elapsed = max(time.monotonic() - started, 1e-6)
+        print(f"[MANAGER] {len(results)}/{len(unique_phrases)} фраз за {elapsed:.1f}с "
+              f"({len(results) * 60 / elapsed:.0f} фраз/мин)")
+        for b_id in browser_ids:
+            browser = self.browsers[b_id]
+            print(f"  [{b_id}] {browser.name}: {browser.phrases_parsed} ок, {browser.errors} ошибок, "
+                  f"{browser.throughput:.0f} фраз/мин")
         return results
-    
+
     async def close_all(self):
         """Закрыть все браузеры корректно"""
         print("[MANAGER] Закрываю все браузеры...")
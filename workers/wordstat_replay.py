@@ -0,0 +1,370 @@
+# -*- coding: utf-8 -*-
+"""HTTP-реплей Wordstat API без рендеринга страниц.
+
+Браузер нужен только для старта сессии: один раз вводим фразу, перехватываем
+POST на ``/wordstat/api`` (URL, заголовки, тело) и забираем cookies. Дальше
+каждая фраза — это прямой POST с подменённым ``searchValue`` через общий
+aiohttp-пул. На аккаунт действует свой лимит параллельности (AdaptiveLimiter)
+и своя пауза между запросами (AIMDController).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import copy
+import json
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+import aiohttp
+
+from playwright.async_api import Page
+
+from services.proxy_manager import Proxy, ProxyManager
+from services.wordstat_payloads import payload_record, store_payloads
+from utils.concurrency import AdaptiveLimiter
+from utils.text_fix import fix_mojibake
+from workers.turbo_parser_integration import (
+    AIMDController,
+    _extract_total_value,
+    _normalize_wordstat_payload,
+)
+
+try:
+    from aiohttp_socks import ProxyConnector
+    SOCKS_AVAILABLE = True
+except ImportError:
+    SOCKS_AVAILABLE = False
+
+
+WORDSTAT_ORIGIN = "https://wordstat.yandex.ru"
+REPLAY_DEFAULT_CONCURRENCY = 4
+REPLAY_TIMEOUT = 30.0
+# Пауза аккаунта после 429/капчи, прежде чем вернуть его воркеры в работу
+REPLAY_COOLDOWN = 15.0
+# Сколько ответов копить перед записью в wordstat_payloads
+PAYLOAD_FLUSH_SIZE = 100
+
+# Заголовки, которые aiohttp выставляет сам или которые привязаны к конкретному соединению
+_SKIP_HEADERS = frozenset({
+    "host", "content-length", "cookie", "connection", "accept-encoding",
+    "transfer-encoding", "keep-alive", "upgrade",
+})
+
+
+class ReplaySessionError(RuntimeError):
+    """Сессия аккаунта больше не годится (капча, 401/403, протухшие cookies)."""
+
+
+@dataclass
+class ReplayTemplate:
+    """Снимок запроса к /wordstat/api, перехваченного в браузере."""
+
+    url: str
+    headers: Dict[str, str]
+    body: Dict[str, Any]
+    cookies: List[Dict[str, Any]] = field(default_factory=list)
+
+    def build_body(self, phrase: str, region: int) -> Dict[str, Any]:
+        body = copy.deepcopy(self.body)
+        body["searchValue"] = phrase
+        if "regions" in body:
+            body["regions"] = [region]
+        if "region" in body:
+            body["region"] = region
+        return body
+
+    def request_headers(self) -> Dict[str, str]:
+        headers = {k: v for k, v in self.headers.items() if k.lower() not in _SKIP_HEADERS and not k.startswith(":")}
+        cookie = "; ".join(
+            f"{c['name']}={c['value']}"
+            for c in self.cookies
+            if "yandex" in (c.get("domain") or "yandex")
+        )
+        if cookie:
+            headers["Cookie"] = cookie
+        headers.setdefault("Content-Type", "application/json")
+        headers.setdefault("Origin", WORDSTAT_ORIGIN)
+        headers.setdefault("Referer", f"{WORDSTAT_ORIGIN}/")
+        return headers
+
+
+async def capture_replay_template(page: Page, probe_phrase: str, timeout: float = 30.0) -> ReplayTemplate:
+    """Вводит пробную фразу в Wordstat и перехватывает запрос к API."""
+    if "wordstat.yandex.ru" not in page.url:
+        await page.goto(f"{WORDSTAT_ORIGIN}/#!/?region=225", wait_until="domcontentloaded", timeout=int(timeout * 1000))
+    await page.wait_for_selector("input.textinput__control", timeout=int(timeout * 1000))
+
+    def _is_api(request) -> bool:
+        return "/wordstat/api" in request.url and request.method == "POST"
+
+    async with page.expect_request(_is_api, timeout=int(timeout * 1000)) as captured:
+        await page.fill("input.textinput__control", probe_phrase)
+        await page.keyboard.press("Enter")
+    request = await captured.value
+
+    try:
+        body = json.loads(request.post_data or "{}")
+    except ValueError as exc:
+        raise RuntimeError(f"Неожиданное тело запроса Wordstat: {exc}") from exc
+    if not isinstance(body, dict) or "searchValue" not in body:
+        raise RuntimeError("В запросе Wordstat нет поля searchValue")
+
+    headers = await request.all_headers()
+    cookies = await page.context.cookies([WORDSTAT_ORIGIN])
+    print(f"[REPLAY] Шаблон запроса: {request.url} ({len(cookies)} cookies)")
+    return ReplayTemplate(url=request.url, headers=headers, body=body, cookies=cookies)
+
+
+class AccountReplayClient:
+    """HTTP-сессия одного аккаунта: пул соединений, лимит и AIMD-пауза."""
+
+    def __init__(
+        self,
+        name: str,
+        template: ReplayTemplate,
+        *,
+        proxy: Optional[Proxy] = None,
+        concurrency: int = REPLAY_DEFAULT_CONCURRENCY,
+        timeout: float = REPLAY_TIMEOUT,
+    ):
+        self.name = name
+        self.template = template
+        self.proxy = proxy
+        self.concurrency = max(1, concurrency)
+        self.timeout = timeout
+        self.limiter = AdaptiveLimiter(self.concurrency)
+        self.aimd = AIMDController()
+        self.alive = True
+        self.processed = 0
+        self.errors = 0
+        self._cooldown_until = 0.0
+        self.payloads: List[Dict[str, Any]] = []
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._proxy_url: Optional[str] = None
+        # Телеметрия прокси: исходы запросов уходят в ProxyManager
+        self._proxy_health = ProxyManager.instance() if proxy is not None else None
+        self._headers = template.request_headers()
+
+    async def open(self) -> None:
+        if self._session is not None:
+            return
+        connector: aiohttp.BaseConnector
+        if self.proxy and self.proxy.type.lower().startswith("socks"):
+            if not SOCKS_AVAILABLE:
+                raise RuntimeError("Для SOCKS-прокси нужен пакет aiohttp-socks")
+            connector = ProxyConnector.from_url(self.proxy.uri(), limit=self.concurrency)
+        else:
+            connector = aiohttp.TCPConnector(limit=self.concurrency, ttl_dns_cache=300)
+            if self.proxy:
+                self._proxy_url = self.proxy.uri()
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            headers=self._headers,
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+        )
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def pace(self) -> None:
+        """Ждёт окончания cooldown и выдерживает текущую AIMD-паузу."""
+        wait = self._cooldown_until - time.monotonic()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        await asyncio.sleep(self.aimd.get_delay())
+
+    def cooldown(self, seconds: float) -> None:
+        self._cooldown_until = max(self._cooldown_until, time.monotonic() + seconds)
+
+    async def fetch(self, phrase: str, region: int) -> Optional[int]:
+        """Один запрос к API. None — ответ пришёл, но частоты в нём нет."""
+        if self._session is None:
+            await self.open()
+        assert self._session is not None
+        payload = self.template.build_body(phrase, region)
+        health = self._proxy_health
+        proxy_id = self.proxy.id if self.proxy is not None else None
+        started = time.monotonic()
+        try:
+            async with self._session.post(self.template.url, json=payload, proxy=self._proxy_url) as resp:
+                if resp.status == 403 and health:
+                    health.report_ban(proxy_id, "HTTP 403")
+                if resp.status in (401, 403):
+                    raise ReplaySessionError(f"HTTP {resp.status}")
+                if resp.status == 429:
+                    retry_after = resp.headers.get("Retry-After", "")
+                    self.cooldown(float(retry_after) if retry_after.isdigit() else REPLAY_COOLDOWN)
+                    raise aiohttp.ClientResponseError(resp.request_info, resp.history, status=429, message="Too Many Requests")
+                resp.raise_for_status()
+                raw = await resp.read()
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as exc:
+            # Ответа нет вовсе — виноват транспорт, а не аккаунт
+            if health:
+                health.report_failure(proxy_id, str(exc) or exc.__class__.__name__)
+            raise
+        latency_ms = (time.monotonic() - started) * 1000
+
+        try:
+            data = json.loads(raw.decode(resp.charset or "utf-8", errors="replace"))
+        except ValueError:
+            # Вместо JSON отдают HTML — это капча или редирект на логин
+            if health:
+                health.report_captcha(proxy_id)
+            raise ReplaySessionError("ответ не JSON (капча?)")
+        if isinstance(data, dict) and (data.get("captcha") or data.get("type") == "captcha"):
+            if health:
+                health.report_captcha(proxy_id)
+            raise ReplaySessionError("капча")
+        if health:
+            health.report_success(proxy_id, latency_ms)
+        if not isinstance(data, dict):
+            return None
+        _normalize_wordstat_payload(data)
+        total = _extract_total_value(data)
+        self.payloads.append(payload_record(phrase, region, data, total))
+        return total
+
+
+class WordstatReplayEngine:
+    """Раздаёт фразы из общей очереди воркерам всех аккаунтов."""
+
+    def __init__(self, clients: Iterable[AccountReplayClient], *, max_attempts: int = 3):
+        self.clients = list(clients)
+        if not self.clients:
+            raise ValueError("Нужен хотя бы один аккаунт для реплея")
+        self.max_attempts = max(1, max_attempts)
+        self.results: Dict[str, Dict[str, Any]] = {}
+        self.failed: Dict[str, str] = {}
+
+    async def run(
+        self,
+        phrases: Iterable[str],
+        region: int = 225,
+        on_result: Optional[Callable[[Dict[str, Any]], None]] = None,
+    ) -> List[Dict[str, Any]]:
+        unique = [p for p in dict.fromkeys(fix_mojibake(p).strip() for p in phrases) if p]
+        if not unique:
+            return []
+        queue: "asyncio.Queue[tuple[str, int]]" = asyncio.Queue()
+        for phrase in unique:
+            queue.put_nowait((phrase, 1))
+
+        for client in self.clients:
+            await client.open()
+        workers = [
+            asyncio.create_task(self._worker(client, queue, region, on_result))
+            for client in self.clients
+            for _ in range(client.concurrency)
+        ]
+        joiner = asyncio.create_task(queue.join())
+        all_workers = asyncio.gather(*workers, return_exceptions=True)
+        try:
+            # Воркеры выходят сами, только если все сессии умерли — тогда очередь уже не опустеет
+            await asyncio.wait({joiner, all_workers}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            joiner.cancel()
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(joiner, all_workers, return_exceptions=True)
+            for client in self.clients:
+                await client.close()
+                await self._flush_payloads(client)
+
+        while not queue.empty():
+            phrase, _ = queue.get_nowait()
+            self.failed.setdefault(phrase, "нет живых сессий")
+        return [self.results[p] for p in unique if p in self.results]
+
+    async def _flush_payloads(self, client: AccountReplayClient) -> None:
+        if not client.payloads:
+            return
+        batch, client.payloads = client.payloads, []
+        try:
+            await asyncio.to_thread(store_payloads, batch)
+        except Exception as exc:
+            print(f"[REPLAY] Не удалось сохранить ответы Wordstat: {exc}")
+
+    async def _worker(
+        self,
+        client: AccountReplayClient,
+        queue: "asyncio.Queue[tuple[str, int]]",
+        region: int,
+        on_result: Optional[Callable[[Dict[str, Any]], None]],
+    ) -> None:
+        while client.alive:
+            phrase, attempt = await queue.get()
+            if not client.alive:
+                queue.put_nowait((phrase, attempt))
+                queue.task_done()
+                break
+            ok = False
+            started = time.monotonic()
+            await client.limiter.acquire()
+            try:
+                await client.pace()
+                started = time.monotonic()
+                frequency = await client.fetch(phrase, region)
+                ok = True
+                if len(client.payloads) >= PAYLOAD_FLUSH_SIZE:
+                    await self._flush_payloads(client)
+                if frequency is None:
+                    self.failed[phrase] = "нет частоты в ответе"
+                else:
+                    row = {
+                        "query": phrase,
+                        "frequency": frequency,
+                        "region": region,
+                        "timestamp": datetime.utcnow().isoformat(),
+                        "account": client.name,
+                    }
+                    self.results[phrase] = row
+                    self.failed.pop(phrase, None)
+                    client.processed += 1
+                    if on_result:
+                        on_result(row)
+            except ReplaySessionError as exc:
+                # Фраза не виновата — отдаём её другим аккаунтам без расхода попытки
+                print(f"[REPLAY] {client.name}: сессия недействительна ({exc}), аккаунт выключен")
+                client.alive = False
+                queue.put_nowait((phrase, attempt))
+            except Exception as exc:
+                client.errors += 1
+                if attempt < self.max_attempts:
+                    queue.put_nowait((phrase, attempt + 1))
+                else:
+                    self.failed[phrase] = str(exc) or exc.__class__.__name__
+                    print(f"[REPLAY] {client.name}: «{phrase}» не получена: {exc}")
+            finally:
+                if ok:
+                    client.aimd.on_success()
+                else:
+                    client.aimd.on_error()
+                await client.limiter.release(time.monotonic() - started, ok=ok)
+                queue.task_done()
+
+
+async def replay_frequencies(
+    clients: Iterable[AccountReplayClient],
+    phrases: Iterable[str],
+    region: int = 225,
+    *,
+    max_attempts: int = 3,
+    on_result: Optional[Callable[[Dict[str, Any]], None]] = None,
+) -> List[Dict[str, Any]]:
+    engine = WordstatReplayEngine(clients, max_attempts=max_attempts)
+    return await engine.run(phrases, region, on_result)
+
+
+__all__ = [
+    "ReplayTemplate",
+    "ReplaySessionError",
+    "AccountReplayClient",
+    "WordstatReplayEngine",
+    "capture_replay_template",
+    "replay_frequencies",
+]